@@ -0,0 +1,5 @@
+"""
+Benchmark and load-test suite for the Flask Blog application.
+
+Run it with `python -m benchmarks.run --help`.
+"""
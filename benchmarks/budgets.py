@@ -0,0 +1,25 @@
+"""
+Number of SQL statements each route may execute per request.
+
+tests/test_query_budgets.py fails when a change makes a route exceed its
+budget, and the benchmark runner reports the measured counts next to them.
+Lower a budget when a change removes queries. The budgets are measured
+for a logged-in user, whose feed pages read their reactions with one more
+query than an anonymous visitor's. The home and admin pages holding news
+items also count their interactions with one grouped query.
+"""
+
+QUERY_BUDGETS = {
+    'main.home': 3,
+    'main.newsfeed': 2,
+    'main.settings': 4,
+    'main.admin_items': 4,
+    'main.moderate': 7,
+    'main.update_interaction': 3,
+    'main.update_interactions': 3,
+    'main.search': 1,
+    'main.news_content': 1,
+    'main.thread': 2,
+    'main.create_post': 2,
+    'main.delete_post': 4,
+}
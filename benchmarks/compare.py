@@ -0,0 +1,49 @@
+"""
+Compare two benchmark result files written by benchmarks.run.
+
+Usage:
+    python -m benchmarks.compare before.json after.json
+"""
+
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'throughput_rps', 'sql_queries')
+
+
+def load(path):
+    """
+    Read a result file.
+    """
+    with open(path, encoding='utf-8') as result_file:
+        return json.load(result_file)
+
+
+def change(before, after):
+    """
+    Format the relative change between two values.
+    """
+    if not before or after is None:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def main(argv=None):
+    """
+    Print the change of every route metric between two runs.
+    """
+    before_path, after_path = (argv or sys.argv[1:])[:2]
+    before, after = load(before_path), load(after_path)
+    print(f"{before.get('commit', '?')[:10]} -> {after.get('commit', '?')[:10]}")
+    for name, result in after['routes'].items():
+        previous = before['routes'].get(name, {})
+        cells = [f"{metric} {previous.get(metric)} -> {result.get(metric)} "
+                 f"({change(previous.get(metric), result.get(metric))})" for metric in METRICS]
+        print(f'{name:24} ' + '  '.join(cells))
+    if 'ingest' in before and 'ingest' in after:
+        print(f"{'ingest':24} seconds {before['ingest']['seconds']} -> {after['ingest']['seconds']} "
+              f"({change(before['ingest']['seconds'], after['ingest']['seconds'])})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Latency, throughput and query-count benchmarks of the main routes, and of
+the news ingestion against a local stub of the Hacker News API.
+
+Usage:
+    python -m benchmarks.run --scale small --output bench.json
+    python -m benchmarks.compare before.json after.json
+
+The database is seeded once per scale and reused by later runs unless
+--reseed is given. Results are written as JSON, tagged with the git commit.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from flaskblog import create_app, db
+from flaskblog.config import BenchmarkConfig
+from flaskblog.models import NewsItem, save_news_to_db
+from benchmarks.budgets import QUERY_BUDGETS
+from benchmarks.seed import SCALES, seed
+from tests.hn_stub import StubHNServer, make_story
+
+
+def sql_count(response):
+    """
+    Read the number of SQL statements from the Server-Timing header.
+    """
+    match = re.search(r'desc="(\d+) queries"', response.headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def route_cases(dataset):
+    """
+    Requests to benchmark, as (name, endpoint, method, path, kwargs).
+
+    kwargs is either the keyword arguments of the test client call or a
+    function of the request number returning them, so that concurrent
+    interactions go to distinct posts.
+    """
+    posts = dataset['posts']
+    return [
+        ('home', 'main.home', 'get', '/home', {}),
+        ('newsfeed', 'main.newsfeed', 'get', '/newsfeed', {}),
+        ('newsfeed_hot', 'main.newsfeed', 'get', '/newsfeed?sort=hot', {}),
+        ('newsfeed_compact_200', 'main.newsfeed', 'get', '/newsfeed?compact=1&limit=200', {}),
+        ('search', 'main.search', 'get', '/search?q=sqlite+story', {}),
+        ('settings_admin', 'main.settings', 'get', '/settings', {}),
+        ('admin_items', 'main.admin_items', 'get', '/admin/items?type=post', {}),
+        ('update_interaction', 'main.update_interaction', 'post', '/update_interaction',
+         lambda number: {'json': {'id': number % posts + 1, 'type': 'post', 'action': 'like'}}),
+        ('update_interactions_batch', 'main.update_interactions', 'post', '/update_interactions',
+         lambda number: {'json': {'operations': [
+             {'id': (number * 10 + i) % posts + 1, 'type': 'post', 'action': 'dislike'} for i in range(10)]}}),
+    ]
+
+
+def login(client):
+    """
+    Log the client in as the seeded Admin user.
+    """
+    with client.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'user1@example.com', 'name': 'User 1'}
+
+
+def bench_route(app, method, path, kwargs, requests, concurrency):
+    """
+    Send requests to one route from concurrency threads.
+
+    Returns the latency percentiles in milliseconds, the throughput and the
+    number of SQL statements of the last request.
+    """
+    latencies = []
+    queries = []
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+    numbers = itertools.count()
+    arguments = kwargs if callable(kwargs) else lambda _number: kwargs
+
+    def worker():
+        client = app.test_client()
+        login(client)
+        local = []
+        count = None
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            response = getattr(client, method)(path, **arguments(next(numbers)))
+            response.get_data()
+            local.append((time.perf_counter() - started) * 1000)
+            count = sql_count(response)
+        with lock:
+            latencies.extend(local)
+            queries.append(count)
+
+    # Warm up caches and connections
+    bench_client = app.test_client()
+    login(bench_client)
+    getattr(bench_client, method)(path, **arguments(next(numbers))).get_data()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(latencies[len(latencies) // 2], 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'sql_queries': queries[-1],
+    }
+
+
+def bench_ingest(items, concurrency):
+    """
+    Time save_news_to_db for items stories served by the stub Hacker News API.
+    """
+    stories = {i: make_story(i, kids=list(range(i * 10, i * 10 + 5))) for i in range(1, items + 1)}
+    with tempfile.TemporaryDirectory() as directory, StubHNServer(stories, latency=0.005) as server:
+        class IngestConfig(BenchmarkConfig):
+            """
+            Ingestion into a scratch database from the stub.
+            """
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, 'ingest.db')}"
+            HN_API_URL = server.url
+            HN_TOP_STORIES = items
+            HN_CONCURRENCY = concurrency
+
+        app = create_app(IngestConfig)
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            save_news_to_db(delta=False)
+            elapsed = time.perf_counter() - started
+            stored = NewsItem.query.count()
+            db.engine.dispose()
+
+    return {
+        'items': items,
+        'stored': stored,
+        'seconds': round(elapsed, 3),
+        'items_per_second': round(items / elapsed, 1),
+        'connections': server.connections,
+    }
+
+
+def git_commit():
+    """
+    Return the current git commit, or None outside of a checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    """
+    Run the benchmarks and write the results.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the Flask Blog routes.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--db', help='SQLite file to seed and benchmark (default: a file per scale in the temp dir)')
+    parser.add_argument('--reseed', action='store_true', help='seed the database even if it exists')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads per route')
+    parser.add_argument('--ingest-items', type=int, default=500, help='stories for the ingestion benchmark')
+    parser.add_argument('--cache', action='store_true', help='benchmark with the response cache on')
+    parser.add_argument('--write-behind', action='store_true', help='buffer interactions (write-behind mode)')
+    parser.add_argument('--output', default='bench_output.json', help='JSON file to write the results to')
+    args = parser.parse_args(argv)
+
+    dataset = SCALES[args.scale]
+    path = args.db or os.path.join(tempfile.gettempdir(), f'flaskblog-bench-{args.scale}.db')
+
+    class RunConfig(BenchmarkConfig):
+        """
+        The benchmarked database.
+        """
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(path)}'
+        FEED_CACHE_ENABLED = args.cache
+        INTERACTION_WRITE_BEHIND = args.write_behind
+
+    app = create_app(RunConfig)
+    seed_seconds = None
+    with app.app_context():
+        if args.reseed or not os.path.exists(path) or NewsItem.query.count() != dataset['news']:
+            print(f'Seeding {path} with {dataset} ...')
+            seed_seconds = round(seed(**dataset), 1)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'scale': args.scale,
+        'dataset': dataset,
+        'seed_seconds': seed_seconds,
+        'cache': args.cache,
+        'write_behind': args.write_behind,
+        'routes': {},
+    }
+    for name, endpoint, method, route_path, kwargs in route_cases(dataset):
+        result = bench_route(app, method, route_path, kwargs, args.requests, args.concurrency)
+        result['endpoint'] = endpoint
+        result['query_budget'] = QUERY_BUDGETS.get(endpoint)
+        results['routes'][name] = result
+        print(f"{name:24} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+              f"{result['throughput_rps']:8.1f} req/s  {result['sql_queries']} queries")
+
+    results['ingest'] = bench_ingest(args.ingest_items, concurrency=20)
+    print(f"ingest {results['ingest']['items']} items in {results['ingest']['seconds']} s "
+          f"over {results['ingest']['connections']} connections")
+
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
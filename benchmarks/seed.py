@@ -0,0 +1,115 @@
+"""
+Fast bulk generator of synthetic data for the benchmarks.
+
+Rows are streamed into SQLite with executemany over the raw DBAPI
+connection, which seeds millions of rows in seconds rather than the minutes
+the ORM would take. The data is deterministic for a given size.
+"""
+
+import time
+
+from flaskblog import db
+from flaskblog.models import ItemType, Reaction, reconcile_post_counters, refresh_rankings
+from flaskblog.search import rebuild_index
+
+SCALES = {
+    'small': {'news': 10_000, 'posts': 1_000, 'users': 1_000, 'interactions': 100_000},
+    'medium': {'news': 100_000, 'posts': 10_000, 'users': 10_000, 'interactions': 1_000_000},
+    'full': {'news': 1_000_000, 'posts': 100_000, 'users': 100_000, 'interactions': 10_000_000},
+}
+
+# Epoch seconds of the oldest generated item
+EPOCH = 1_600_000_000
+
+# Words mixed into the titles so that searches have selective terms
+TOPICS = ('python', 'sqlite', 'compilers', 'databases', 'security', 'startups', 'rust',
+          'kernels', 'browsers', 'networking', 'hardware', 'science', 'design')
+
+
+def user_rows(count):
+    """
+    Generate users; the first one is an Admin.
+    """
+    for i in range(1, count + 1):
+        yield (i, f'user{i}@example.com', f'User {i}', f'user{i}', None,
+               'Admin' if i == 1 else 'User')
+
+
+def news_rows(count):
+    """
+    Generate news items one minute apart.
+    """
+    for i in range(1, count + 1):
+        timestamp = EPOCH + i * 60
+        yield (i, f'hn{i % 5000}', i % 300, None, i % 1000, None, timestamp,
+               f'Synthetic story {i} about {TOPICS[i % len(TOPICS)]}', 'story', f'https://example.com/{i}', timestamp, timestamp)
+
+
+def post_rows(count, users):
+    """
+    Generate posts ten minutes apart.
+    """
+    for i in range(1, count + 1):
+        timestamp = EPOCH + i * 600
+        posted = time.strftime('%Y-%m-%d %H:%M:%S.000000', time.gmtime(timestamp))
+        yield (i, posted, f'user{i % users + 1}@example.com', f'Synthetic post {i}',
+               f'Body of synthetic post {i}', timestamp)
+
+
+def interaction_rows(count, users, posts):
+    """
+    Generate interactions on posts. Interaction k belongs to user k % users
+    and goes to a distinct post of that user, so (user_id, post_id) is unique
+    as long as count <= users * posts. Types and interactions are written as
+    their stored codes.
+    """
+    post_type = ItemType.CODES['post']
+    for k in range(min(count, users * posts)):
+        user = k % users
+        post = (k // users + user * 7919) % posts
+        yield (user + 1, post_type, post + 1, Reaction.CODES['dislike' if k % 3 == 0 else 'like'])
+
+
+def seed(news, posts, users, interactions):
+    """
+    Create the schema and fill it with synthetic data. Must run in an app context.
+
+    Returns the number of seconds it took.
+    """
+    started = time.perf_counter()
+    db.drop_all()
+    db.create_all()
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.executemany(
+            'INSERT INTO user (id, email, name, nickname, picture, role) VALUES (?, ?, ?, ?, ?, ?)',
+            user_rows(users)
+        )
+        cursor.executemany(
+            'INSERT INTO news_item (id, "by", descendants, kids, score, text, time, title, type, '
+            'url, sort_key, refreshed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            news_rows(news)
+        )
+        cursor.executemany(
+            'INSERT INTO post (id, date_posted, user_email, title, content, sort_key) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            post_rows(posts, users)
+        )
+        cursor.executemany(
+            'INSERT INTO user_interaction (user_id, target_type, post_id, interaction) '
+            'VALUES (?, ?, ?, ?)',
+            interaction_rows(interactions, users, posts)
+        )
+        connection.commit()
+        cursor.execute('PRAGMA synchronous=FULL')
+        cursor.execute('ANALYZE')
+    finally:
+        connection.close()
+
+    reconcile_post_counters()
+    rebuild_index()
+    refresh_rankings()
+    return time.perf_counter() - started
@@ -0,0 +1,185 @@
+"""
+Cold start and per-worker memory benchmarks of the serving setup.
+
+Usage:
+    python -m benchmarks.startup --output startup.json
+
+The cold start is measured in fresh interpreters, for the WSGI entry point
+(wsgi.py, no migration commands) and for the full app of run.py. The
+worker memory is measured the way gunicorn runs with preload_app: the app
+is created and its database seeded in this process, workers are forked
+from it and serve requests, then every worker reports the memory it does
+not share with the others (USS) from /proc/self/smaps_rollup. It is
+measured with and without gc.freeze() before the fork (see gunicorn.conf.py).
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import git_commit
+
+COLD_START = '''
+import json, resource, sys, time
+started = time.perf_counter()
+from flaskblog import create_app
+imported = time.perf_counter()
+app = create_app(migrations={migrations})
+created = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+}}))
+'''
+
+
+def cold_start(migrations, runs):
+    """
+    Start runs fresh interpreters that import flaskblog and create the app.
+
+    Returns the medians of the import and create_app times, of the wall
+    time of the whole interpreter, and of its peak RSS.
+    """
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START.format(migrations=migrations)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['wall_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {
+        name: round(statistics.median(sample[name] for sample in samples), 1)
+        for name in ('import_ms', 'create_ms', 'wall_ms', 'max_rss_kb', 'modules')
+    }
+
+
+def memory_usage():
+    """
+    Return the RSS and the unshared memory (USS) of this process in KiB, or
+    None where /proc/self/smaps_rollup is not available.
+    """
+    try:
+        with open('/proc/self/smaps_rollup', encoding='ascii') as smaps:
+            fields = dict(line.split(':', 1) for line in smaps if ':' in line)
+    except OSError:
+        return None
+    kib = {name.strip(): int(value.split()[0]) for name, value in fields.items()
+           if value.strip().endswith('kB')}
+    return {'rss_kb': kib['Rss'], 'uss_kb': kib['Private_Clean'] + kib['Private_Dirty']}
+
+
+def serve_in_worker(app, paths, requests):
+    """
+    Body of a forked worker: serve the requests, collect garbage like a
+    long running worker would, and return its memory usage.
+    """
+    client = app.test_client()
+    for number in range(requests):
+        client.get(paths[number % len(paths)]).get_data()
+    gc.collect()
+    return memory_usage()
+
+
+def worker_memory(app, workers, requests, paths):
+    """
+    Fork workers from this process and return the median of their memory usage.
+    """
+    children = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            try:
+                result = serve_in_worker(app, paths, requests)
+                os.write(write_end, json.dumps(result).encode('utf-8'))
+            finally:
+                os._exit(0) # pylint: disable=protected-access
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    usages = []
+    for pid, read_end in children:
+        with os.fdopen(read_end, 'rb') as pipe:
+            usages.append(json.loads(pipe.read() or b'null'))
+        os.waitpid(pid, 0)
+    if None in usages:
+        return None
+    return {name: statistics.median(usage[name] for usage in usages) for name in ('rss_kb', 'uss_kb')}
+
+
+def main(argv=None):
+    """
+    Run the startup benchmarks and write the results.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the start up and worker memory.')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters started per entry point')
+    parser.add_argument('--workers', type=int, default=4, help='workers forked per memory run')
+    parser.add_argument('--requests', type=int, default=200, help='requests served by every worker')
+    parser.add_argument('--output', default='startup_output.json', help='JSON file to write the results to')
+    args = parser.parse_args(argv)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'cold_start': {
+            'wsgi': cold_start(False, args.runs),
+            'run': cold_start(True, args.runs),
+        },
+    }
+    for name, result in results['cold_start'].items():
+        print(f"cold start {name:5} import {result['import_ms']:7.1f} ms  create_app {result['create_ms']:6.1f} ms  "
+              f"process {result['wall_ms']:7.1f} ms  peak RSS {result['max_rss_kb'] / 1024:6.1f} MiB  "
+              f"{result['modules']:.0f} modules")
+
+    # pylint: disable=import-outside-toplevel
+    from flaskblog import create_app
+    from flaskblog.config import BenchmarkConfig
+    from benchmarks.seed import seed
+    # pylint: enable=import-outside-toplevel
+    with tempfile.TemporaryDirectory() as directory:
+        class StartupConfig(BenchmarkConfig):
+            """
+            A small seeded database in a temporary directory.
+            """
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(directory, "startup.db")}'
+
+        app = create_app(StartupConfig, migrations=False)
+        with app.app_context():
+            seed(news=2000, posts=200, users=100, interactions=2000)
+        paths = ['/home', '/newsfeed', '/home?sort=hot', '/newsfeed?compact=1&limit=200']
+
+        results['workers'] = {'count': args.workers, 'requests': args.requests}
+        for variant, freeze in (('no_freeze', False), ('gc_freeze', True)):
+            if freeze:
+                gc.freeze()
+            usage = worker_memory(app, args.workers, args.requests, paths)
+            if freeze:
+                gc.unfreeze()
+            results['workers'][variant] = usage
+            if usage is None:
+                print('worker memory: /proc/self/smaps_rollup is not available')
+                break
+            print(f"worker {variant:9}  RSS {usage['rss_kb'] / 1024:6.1f} MiB  "
+                  f"unshared (USS) {usage['uss_kb'] / 1024:6.1f} MiB")
+
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,96 @@
 """
 This module initializes the Flask application and its extensions. It also
 registers the necessary blueprints and sets up OAuth for authentication.
+
+The factory is meant to run once in the gunicorn master (preload_app, see
+gunicorn.conf.py) before the workers are forked: authlib is only imported
+by the first login, Flask-Migrate only when the app serves the CLI, and
+the database connections opened before a fork are not reused by the child.
 """
 
-from datetime import datetime
 from os import environ as env
 
 from flask import Flask, make_response, jsonify, redirect, render_template, session, url_for
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_cors import CORS
-from authlib.integrations.flask_client import OAuth
 
-from flaskblog.config import Config
+from flaskblog.assets import Assets
+from flaskblog.auth import Auth0
+from flaskblog.config import CONFIGS, Config
+from flaskblog.database import RoutingSession, configure_engines, configure_routing
+from flaskblog.database import dispose_after_fork, include_in_migrations, parse_pragmas
+from flaskblog.cache import ResponseCache
+from flaskblog.compression import Compression
+from flaskblog.identity import Identity
+from flaskblog.metrics import Metrics
+from flaskblog.ratelimit import RateLimiter
+from flaskblog.write_behind import InteractionBuffer
 
-db = SQLAlchemy()
-migrate = Migrate()
-oauth = OAuth()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+assets = Assets()
+auth0 = Auth0()
+cache = ResponseCache()
+identity = Identity()
+metrics = Metrics()
+rate_limiter = RateLimiter()
+interaction_buffer = InteractionBuffer()
+compression = Compression()
 
-def create_app(config_class=Config):
+def create_app(config_class=None, migrations=True):
     """
     Create and configure an instance of the Flask application.
     Args:
         config_class: The configuration class to use for the application.
+            Defaults to the profile named by the APP_CONFIG environment
+            variable (production, testing, benchmark), or Config.
+        migrations: Whether to set up Flask-Migrate and its `flask db`
+            commands. The WSGI entry point leaves them out.
 
     Returns:
         The configured Flask application instance.
     """
+    if config_class is None:
+        config_class = CONFIGS.get(env.get("APP_CONFIG", "default").lower(), Config)
     app = Flask(__name__)
     app.config.from_object(config_class)
-    db.init_app(app)
-    migrate.init_app(app, db)
     app.config['SECRET_KEY'] = env.get("APP_SECRET_KEY") or 'a-very-secret-key'
+    if env.get("DATABASE_URL") and not app.config.get('TESTING'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = env["DATABASE_URL"]
+    if env.get("READ_REPLICA_URL") and not app.config.get('TESTING'):
+        app.config['READ_REPLICA_URI'] = env["READ_REPLICA_URL"]
+    app.config['SQLITE_PRAGMAS'] = dict(app.config['SQLITE_PRAGMAS'],
+                                        **parse_pragmas(env.get("SQLITE_PRAGMAS")))
+
+    configure_routing(app)
+    db.init_app(app)
+    configure_engines(app, db)
+    dispose_after_fork(app, db)
+    if migrations:
+        # pylint: disable=import-outside-toplevel
+        from flask_migrate import Migrate
+        # pylint: enable=import-outside-toplevel
+        Migrate(app, db, render_as_batch=True, include_name=include_in_migrations)
+    cache.init_app(app)
+    identity.init_app(app)
+    metrics.init_app(app)
+    rate_limiter.init_app(app)
+    interaction_buffer.init_app(app)
+    assets.init_app(app)
 
-    oauth.init_app(app)
-    oauth.register(
-        "auth0",
-        client_id=env.get("AUTH0_CLIENT_ID"),
-        client_secret=env.get("AUTH0_CLIENT_SECRET"),
-        client_kwargs={"scope": "openid profile email"},
-        server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration',
-        redirect_uri='https://cop4521.oteomamo.com/callback'
-    )
+    auth0.init_app(app)
 
-    @app.template_filter('datetimeformat')
-    def datetimeformat(value, date_format='%Y-%m-%d %H:%M'):
-        try:
-            timestamp = int(value)
-        except ValueError:
-            try:
-                return datetime.fromisoformat(value).strftime(date_format)
-            except ValueError:
-                return value
+    @app.template_filter('feed_card')
+    def feed_card(item, reaction=None):
+        """
+        Render one feed row with feed_card.html, cached until the row changes.
+        The card shows the reaction of the current user, so there is one per
+        reaction.
+        """
+        return cache.fragment(
+            ('feed_card', item.type, item.id, reaction), tuple(item),
+            lambda: Markup(app.jinja_env.get_template('feed_card.html').render(item=item, reaction=reaction))
+        )
 
-        return datetime.fromtimestamp(timestamp).strftime(date_format)
-    
     @app.after_request
     def set_security_headers(response):
         """
@@ -64,11 +100,15 @@ def create_app(config_class=Config):
         response.headers['X-Frame-Options'] = 'SAMEORIGIN'  # or 'DENY'
         response.headers['X-XSS-Protection'] = '1; mode=block'
         return response
+    # Registered after set_security_headers, so that it runs just before it
+    compression.init_app(app)
     # pylint: disable=import-outside-toplevel
     from flaskblog.main.routes import main
     from flaskblog.errors.handlers import errors
+    from flaskblog.commands import register_commands
     # pylint: enable=import-outside-toplevel
     app.register_blueprint(main)
     app.register_blueprint(errors)
+    register_commands(app)
 
     return app
@@ -0,0 +1,237 @@
+"""
+Fetcher of the articles linked by news items.
+
+Articles are downloaded with bounded concurrency over the keep-alive
+connection pool of the Hacker News client, with caps on the size of every
+response, the time of every request and the duration of the whole run. The
+readable text is extracted from the HTML and stored zlib-compressed in the
+deferred NewsItem.content column.
+
+Article URLs are submitted by anyone, so the fetcher only connects to
+public addresses: every host, the first one and those of the redirects, is
+resolved and refused when any of its addresses is loopback, private,
+link-local or otherwise not globally routable, and the connection is made
+to the checked address. Networks listed in CONTENT_ALLOWED_NETWORKS are
+exempt.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import time
+import zlib
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from flaskblog.hn_client import AddressNotAllowed, ConnectionPool, ResponseTooLarge
+
+logger = logging.getLogger(__name__)
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Elements whose text is not part of the article
+SKIPPED_TAGS = {
+    'script', 'style', 'noscript', 'template', 'head', 'nav', 'header', 'footer',
+    'aside', 'form', 'button', 'svg', 'iframe', 'select',
+}
+
+# Elements that start a new line of text
+BLOCK_BREAK = '\x00'
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'article',
+    'section', 'main', 'tr', 'blockquote', 'pre', 'figcaption', 'dd', 'dt', 'table',
+}
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the readable text of an HTML document, one line per block element.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.skipped = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipped += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(BLOCK_BREAK)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipped = max(0, self.skipped - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(BLOCK_BREAK)
+
+    def handle_data(self, data):
+        if not self.skipped:
+            self.parts.append(data)
+
+    def text(self):
+        """
+        Return the collected text with the whitespace of every line collapsed.
+        """
+        lines = (' '.join(line.split()) for line in ''.join(self.parts).split(BLOCK_BREAK))
+        return '\n'.join(line for line in lines if line)
+
+
+def extract_text(html, max_chars=None):
+    """
+    Extract the readable text of an HTML document, truncated to max_chars.
+    """
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    text = extractor.text()
+    return text[:max_chars] if max_chars else text
+
+
+def compress_text(text):
+    """
+    Compress article text for storage.
+    """
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def decompress_text(blob):
+    """
+    Decompress text stored by compress_text; None stays None.
+    """
+    if blob is None:
+        return None
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def response_charset(content_type):
+    """
+    Return the charset of a Content-Type header, defaulting to UTF-8.
+    """
+    for parameter in content_type.split(';')[1:]:
+        name, _, value = parameter.partition('=')
+        if name.strip().lower() == 'charset' and value.strip():
+            return value.strip().strip('"')
+    return 'utf-8'
+
+
+def address_checker(allowed_networks=()):
+    """
+    Return a function telling whether the fetcher may connect to an IP
+    address: a globally routable one, or one of allowed_networks.
+    """
+    networks = [ipaddress.ip_network(network) for network in allowed_networks]
+
+    def allowed(address):
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if any(ip in network for network in networks):
+            return True
+        return ip.is_global and not ip.is_multicast
+    return allowed
+
+
+class ArticleFetcher:
+    """
+    Downloads articles and extracts their text. Use it as an async context
+    manager so that the pooled connections are closed when done.
+    """
+
+    def __init__(self, concurrency=10, per_host_limit=2, timeout=10, deadline=60,
+                 max_bytes=2_000_000, max_chars=100_000, max_redirects=3, allowed_networks=()):
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.max_redirects = max_redirects
+        self.pool = ConnectionPool(per_host_limit=per_host_limit, timeout=timeout,
+                                   address_allowed=address_checker(allowed_networks))
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a fetcher from the CONTENT_* settings of a Flask config.
+        """
+        return cls(
+            concurrency=config.get('CONTENT_CONCURRENCY', 10),
+            per_host_limit=config.get('CONTENT_PER_HOST_LIMIT', 2),
+            timeout=config.get('CONTENT_TIMEOUT', 10),
+            deadline=config.get('CONTENT_DEADLINE', 60),
+            max_bytes=config.get('CONTENT_MAX_BYTES', 2_000_000),
+            max_chars=config.get('CONTENT_MAX_CHARS', 100_000),
+            allowed_networks=config.get('CONTENT_ALLOWED_NETWORKS', ()),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.close()
+
+    async def fetch(self, url):
+        """
+        Download one article and return its text, or None if it is not an
+        HTML page that could be downloaded within the limits.
+        """
+        for _ in range(self.max_redirects + 1):
+            if urlsplit(url).scheme not in ('http', 'https'):
+                return None
+            try:
+                response = await self.pool.request(
+                    url, headers={'Accept': 'text/html,application/xhtml+xml'},
+                    max_bytes=self.max_bytes
+                )
+            except ResponseTooLarge as e:
+                logger.info("Skipping article %s: %s", url, e)
+                return None
+            except AddressNotAllowed as e:
+                logger.warning("Refusing to fetch article %s: %s", url, e)
+                return None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    ValueError, zlib.error) as e:
+                logger.info("Error fetching article %s: %r", url, e)
+                return None
+
+            if response.status in REDIRECT_STATUSES and 'location' in response.headers:
+                url = urljoin(url, response.headers['location'])
+                continue
+            content_type = response.headers.get('content-type', '')
+            if response.status != 200 or 'html' not in content_type.lower():
+                return None
+            try:
+                html = response.body.decode(response_charset(content_type), errors='replace')
+            except LookupError:
+                html = response.body.decode('utf-8', errors='replace')
+            return extract_text(html, self.max_chars) or None
+        return None
+
+    async def fetch_many(self, urls):
+        """
+        Download many articles concurrently within the overall deadline.
+
+        Args:
+            urls: Dict of item id to article URL.
+
+        Returns:
+            Dict of item id to text, or None for articles without usable
+            text. Articles not finished before the deadline are left out.
+        """
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(url):
+            async with limit:
+                return await self.fetch(url)
+
+        tasks = {item_id: asyncio.ensure_future(fetch(url)) for item_id, url in urls.items()}
+        if not tasks:
+            return {}
+        started = time.monotonic()
+        _, pending = await asyncio.wait(tasks.values(), timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            logger.warning("Content deadline reached after %.0f s, %d of %d articles were not fetched",
+                           time.monotonic() - started, len(pending), len(tasks))
+        return {item_id: task.result() for item_id, task in tasks.items() if not task.cancelled()}
@@ -0,0 +1,210 @@
+"""
+Fingerprinted static assets.
+
+When the app starts, every file of the static folder is hashed, and
+url_for('static', ...) links it under a name carrying the hash, such as
+main.3f2a9c0d41be.css. The content behind such a name never changes, so
+it is served with a Cache-Control of a year and immutable: browsers do
+not revalidate it, and an edited file gets a new name. Plain names are
+still served as before.
+
+`flask build-assets` writes gzip (and, with the brotli module, brotli)
+copies of the text assets next to them, which are sent to the clients
+accepting them. With --vendor it first downloads the third-party bundles
+of layout.html into static/vendor, which the layout then links instead of
+the CDNs. The app has to be restarted to pick up the new files.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import urllib.request
+
+from flask import current_app, send_from_directory, url_for
+
+from flaskblog.compression import COMPRESSIBLE_TYPES, available_encodings, compress, negotiate_encoding
+
+logger = logging.getLogger(__name__)
+
+# Suffix of the precompressed copy of an asset, by encoding
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Bundles linked by layout.html, by name: path under the static folder and CDN URL
+VENDOR_BUNDLES = {
+    'font-awesome.css': ('vendor/font-awesome/css/all.min.css',
+                         'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css'),
+    'bootstrap.css': ('vendor/bootstrap/bootstrap.min.css',
+                      'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css'),
+    'jquery.js': ('vendor/jquery/jquery.min.js', 'https://code.jquery.com/jquery-3.6.0.min.js'),
+    'popper.js': ('vendor/popper/popper.min.js',
+                  'https://cdn.jsdelivr.net/npm/@popperjs/core@2.0.0/dist/umd/popper.min.js'),
+    'bootstrap.js': ('vendor/bootstrap/bootstrap.min.js',
+                     'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/js/bootstrap.min.js'),
+}
+
+# Files the bundles load by relative URL, which are vendored with them
+VENDOR_FILES = [
+    (f'vendor/font-awesome/webfonts/fa-{font}.{extension}',
+     f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/webfonts/fa-{font}.{extension}')
+    for font in ('brands-400', 'regular-400', 'solid-900') for extension in ('woff2', 'ttf')
+]
+
+
+def fingerprint(filename, content):
+    """
+    Return filename with the hash of content inserted before its extension.
+    """
+    root, extension = posixpath.splitext(filename)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+
+def static_files(folder):
+    """
+    Yield the path of every file of folder, relative and with forward slashes,
+    leaving out the precompressed copies.
+    """
+    for directory, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                continue
+            yield os.path.relpath(os.path.join(directory, name), folder).replace(os.sep, '/')
+
+
+class _AssetState:
+    """
+    Manifest of the static folder of an app.
+
+    urls maps a file to its fingerprinted name, sources maps it back, and
+    variants gives the encodings of the precompressed copies of a file.
+    """
+
+    def __init__(self, folder, max_age):
+        self.max_age = max_age
+        self.urls = {}
+        self.sources = {}
+        self.variants = {}
+        if not folder or not os.path.isdir(folder):
+            return
+        for filename in static_files(folder):
+            path = os.path.join(folder, filename)
+            with open(path, 'rb') as asset:
+                hashed = fingerprint(filename, asset.read())
+            self.urls[filename] = hashed
+            self.sources[hashed] = filename
+            encodings = tuple(encoding for encoding, suffix in ENCODING_SUFFIXES.items()
+                              if os.path.isfile(path + suffix))
+            if encodings:
+                self.variants[filename] = encodings
+
+
+class Assets:
+    """
+    Flask extension serving the static folder of an app under fingerprinted names.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Build the manifest of app's static folder and route its static files.
+        """
+        app.extensions['assets'] = _AssetState(app.static_folder, app.config['ASSETS_MAX_AGE'])
+        app.url_defaults(self.fingerprint_url)
+        if 'static' in app.view_functions:
+            app.view_functions['static'] = self.send_static
+        app.add_template_global(self.vendor_url)
+
+    @staticmethod
+    def fingerprint_url(endpoint, values):
+        """
+        Link the static files by their fingerprinted name.
+        """
+        if endpoint == 'static':
+            hashed = current_app.extensions['assets'].urls.get(values.get('filename'))
+            if hashed:
+                values['filename'] = hashed
+
+    @staticmethod
+    def send_static(filename):
+        """
+        Serve a static file. A fingerprinted name is served for a year, from
+        its precompressed copy when the client accepts one.
+        """
+        state = current_app.extensions['assets']
+        source = state.sources.get(filename)
+        if source is None:
+            return current_app.send_static_file(filename)
+
+        encoding = negotiate_encoding(state.variants.get(source, ()))
+        response = send_from_directory(
+            current_app.static_folder, source + ENCODING_SUFFIXES[encoding] if encoding else source,
+            mimetype=mimetypes.guess_type(source)[0] or 'application/octet-stream',
+            max_age=state.max_age
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if source in state.variants:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    @staticmethod
+    def vendor_url(name):
+        """
+        URL of a bundle of VENDOR_BUNDLES: the vendored copy if there is one,
+        its CDN otherwise.
+        """
+        path, cdn_url = VENDOR_BUNDLES[name]
+        if path in current_app.extensions['assets'].urls:
+            return url_for('static', filename=path)
+        return cdn_url
+
+
+def vendor_bundles(folder):
+    """
+    Download the bundles of VENDOR_BUNDLES and the files they load into folder.
+    Returns the number of files written.
+    """
+    downloads = list(VENDOR_BUNDLES.values()) + VENDOR_FILES
+    for path, source_url in downloads:
+        target = os.path.join(folder, *path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(source_url, timeout=30) as response:
+            content = response.read()
+        with open(target, 'wb') as output:
+            output.write(content)
+        logger.info("Vendored %s (%d bytes)", path, len(content))
+    return len(downloads)
+
+
+def precompress(folder, min_size, level=9, quality=11):
+    """
+    Write the precompressed copies of the compressible files of folder larger
+    than min_size bytes, at the highest settings, since it is done once.
+    A copy that is not smaller than the file is left out.
+
+    Returns the number of copies written.
+    """
+    written = 0
+    for filename in static_files(folder):
+        if mimetypes.guess_type(filename)[0] not in COMPRESSIBLE_TYPES:
+            continue
+        path = os.path.join(folder, filename)
+        with open(path, 'rb') as asset:
+            content = asset.read()
+        for encoding in available_encodings():
+            target = path + ENCODING_SUFFIXES[encoding]
+            data = compress(content, encoding, level, quality)
+            if len(content) < min_size or len(data) >= len(content):
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            with open(target, 'wb') as output:
+                output.write(data)
+            written += 1
+    return written
@@ -0,0 +1,55 @@
+"""
+Auth0 login client.
+
+Only the login routes need authlib and the registered OAuth client, so they
+are set up on first use rather than in create_app: starting the app does
+not import authlib, and the OpenID metadata of the Auth0 tenant is fetched
+by authlib when the first login starts.
+"""
+
+import threading
+from os import environ as env
+
+from flask import current_app
+
+
+class Auth0:
+    """
+    Flask extension giving the Auth0 OAuth client of the current app.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Make room for the client of app; it is registered on first use.
+        """
+        app.extensions['auth0'] = None
+
+    @property
+    def client(self):
+        """
+        The Auth0 client of the current app, registered on the first call.
+        """
+        app = current_app._get_current_object() # pylint: disable=protected-access
+        client = app.extensions['auth0']
+        if client is None:
+            with self._lock:
+                client = app.extensions['auth0']
+                if client is None:
+                    # pylint: disable=import-outside-toplevel
+                    from authlib.integrations.flask_client import OAuth
+                    # pylint: enable=import-outside-toplevel
+                    client = OAuth(app).register(
+                        "auth0",
+                        client_id=env.get("AUTH0_CLIENT_ID"),
+                        client_secret=env.get("AUTH0_CLIENT_SECRET"),
+                        client_kwargs={"scope": "openid profile email"},
+                        server_metadata_url=f'https://{env.get("AUTH0_DOMAIN")}/.well-known/openid-configuration',
+                        redirect_uri='https://cop4521.oteomamo.com/callback'
+                    )
+                    app.extensions['auth0'] = client
+        return client
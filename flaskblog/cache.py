@@ -0,0 +1,325 @@
+"""
+Response cache for the feed routes.
+
+Rendered responses are kept in an in-process LRU with a TTL and a size
+bound, optionally backed by a SQLite file shared by all worker processes.
+Every cache key embeds a version counter that the write paths bump, so a
+write invalidates every cached page at once. Cached responses carry a
+strong ETag and conditional requests are answered with 304.
+
+Without the shared store the version counter lives in the process, so a
+write only invalidates the pages cached by the worker that handled it and
+the other workers serve their copies until the TTL expires. Production
+therefore sets FEED_CACHE_PATH.
+
+A session that wrote within READ_YOUR_WRITES_SECONDS bypasses the cache,
+like it bypasses the read replica, so that it sees its own writes even
+from a worker whose copy predates them.
+
+Fragments of pages, such as the cards of the home feed, are kept in a
+separate per-process LRU. A fragment is stored with the version it was
+rendered from (the values of its row) and rendered again when the version
+differs, so it never needs invalidating.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from flaskblog.database import recently_wrote
+
+
+class CachedResponse:
+    """
+    The parts of a response needed to serve it again.
+    """
+
+    def __init__(self, body, mimetype, etag):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+
+
+class LRUCache:
+    """
+    A thread-safe least recently used cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, maxsize=512, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value stored under key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries if needed.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove key from the cache.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    A response store and version counter in a local SQLite file, shared by
+    every process that opens the same path.
+    """
+
+    def __init__(self, path, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections are opened per thread and are not reused after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, expires REAL, mimetype TEXT, etag TEXT, body BLOB)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_version (name TEXT PRIMARY KEY, value INTEGER)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """
+        Return the CachedResponse stored under key, or None.
+        """
+        row = self._connection().execute(
+            'SELECT mimetype, etag, body FROM response_cache WHERE key = ? AND expires >= ?',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        mimetype, etag, body = row
+        return CachedResponse(body, mimetype, etag)
+
+    def set(self, key, value):
+        """
+        Store a CachedResponse under key and drop expired entries.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            'INSERT OR REPLACE INTO response_cache (key, expires, mimetype, etag, body) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, now + self.ttl, value.mimetype, value.etag, value.body)
+        )
+        connection.execute('DELETE FROM response_cache WHERE expires < ?', (now,))
+
+    def version(self, name):
+        """
+        Return the current value of a version counter.
+        """
+        row = self._connection().execute(
+            'SELECT value FROM cache_version WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, name):
+        """
+        Increment a version counter.
+        """
+        self._connection().execute(
+            'INSERT INTO cache_version (name, value) VALUES (?, 1) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+            (name,)
+        )
+
+
+class _CacheState:
+    """
+    Per app state of the response cache.
+    """
+
+    def __init__(self, config, instance_path):
+        self.enabled = config['FEED_CACHE_ENABLED']
+        self.local = LRUCache(config['FEED_CACHE_SIZE'], config['FEED_CACHE_TTL'])
+        self.shared = None
+        if config['FEED_CACHE_PATH']:
+            os.makedirs(instance_path, exist_ok=True)
+            self.shared = SQLiteStore(os.path.join(instance_path, config['FEED_CACHE_PATH']),
+                                      config['FEED_CACHE_TTL'])
+        self.version = 0
+        self.lock = threading.Lock()
+        self.fragments = LRUCache(config['FRAGMENT_CACHE_SIZE'], config['FRAGMENT_CACHE_TTL'])
+
+
+class ResponseCache:
+    """
+    Flask extension caching the responses of the feed routes.
+    """
+
+    VERSION_NAME = 'feed'
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Set up the cache for app from its FEED_CACHE_* settings.
+        """
+        app.extensions['response_cache'] = _CacheState(app.config, app.instance_path)
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['response_cache']
+
+    def version(self):
+        """
+        Return the current version of the feed data.
+        """
+        state = self._state()
+        if state.shared is not None:
+            return state.shared.version(self.VERSION_NAME)
+        return state.version
+
+    def invalidate(self):
+        """
+        Bump the version of the feed data, invalidating every cached response.
+        Called by the write paths after they commit.
+        """
+        state = self._state()
+        if state.shared is not None:
+            state.shared.bump(self.VERSION_NAME)
+        with state.lock:
+            state.version += 1
+        state.local.clear()
+
+    def fragment(self, key, version, render):
+        """
+        Return the fragment cached under key if it was rendered from the
+        same version, otherwise call render() and cache its result.
+        """
+        fragments = self._state().fragments
+        entry = fragments.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        fragment = render()
+        fragments.set(key, (version, fragment))
+        return fragment
+
+    def _key(self):
+        user = json.dumps(session.get('user'), sort_keys=True, default=str)
+        return '|'.join((
+            str(self.version()),
+            request.endpoint,
+            request.full_path,
+            request.headers.get('Accept', ''),
+            hashlib.sha1(user.encode('utf-8')).hexdigest()
+        ))
+
+    @staticmethod
+    def _lookup(state, key):
+        entry = state.local.get(key)
+        if entry is None and state.shared is not None:
+            entry = state.shared.get(key)
+            if entry is not None:
+                state.local.set(key, entry)
+        return entry
+
+    @staticmethod
+    def _store(state, key, entry):
+        state.local.set(key, entry)
+        if state.shared is not None:
+            state.shared.set(key, entry)
+
+    def cached(self, view):
+        """
+        Decorator caching the successful GET responses of a view.
+
+        Pages carrying flashed messages are neither served from nor stored
+        in the cache, since the messages are only shown once, and neither
+        are the pages of a session that has just written. Streamed
+        responses are passed through as they are generated and stored once
+        they are complete.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            state = self._state()
+            if (not state.enabled or request.method != 'GET' or '_flashes' in session
+                    or recently_wrote()):
+                return view(*args, **kwargs)
+
+            key = self._key()
+            entry = self._lookup(state, key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = self._store_when_complete(
+                        state, key, response.iter_encoded(), response.mimetype
+                    )
+                    return response
+                body = response.get_data()
+                entry = CachedResponse(body, response.mimetype, hashlib.sha1(body).hexdigest())
+                self._store(state, key, entry)
+            else:
+                response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+
+            response.set_etag(entry.etag)
+            return response.make_conditional(request)
+        return wrapper
+
+    def _store_when_complete(self, state, key, stream, mimetype):
+        """
+        Pass the chunks of a streamed response through and store the whole
+        body once the last chunk has been sent.
+        """
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        body = b''.join(chunks)
+        self._store(state, key, CachedResponse(body, mimetype, hashlib.sha1(body).hexdigest()))
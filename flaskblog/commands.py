@@ -0,0 +1,92 @@
+"""
+This module defines the custom command line commands of the application,
+used for maintenance tasks on the database.
+"""
+
+import click
+
+from flaskblog import cache, db
+from flaskblog.assets import precompress, vendor_bundles
+from flaskblog.database import sync_replica
+from flaskblog.models import fetch_news_content, reconcile_post_counters, refresh_rankings
+from flaskblog.models import save_comments_to_db, save_news_to_db
+from flaskblog.search import rebuild_index
+
+
+def register_commands(app):
+    """
+    Register the custom commands on the app's command line interface.
+    """
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters():
+        """
+        Rebuild the like/dislike counters of every post from user_interaction.
+        """
+        updated = reconcile_post_counters()
+        click.echo(f'Reconciled the counters of {updated} posts.')
+
+    @app.cli.command('sync-news')
+    @click.option('--full', is_flag=True, help='Download every top story, not only new and changed ones.')
+    def sync_news(full):
+        """
+        Fetch the top stories from Hacker News and upsert them.
+        """
+        save_news_to_db(delta=not full)
+
+    @app.cli.command('sync-comments')
+    @click.option('--full', is_flag=True, help='Walk every story and download every comment again.')
+    def sync_comments(full):
+        """
+        Fetch the comment trees of the stories whose comment count changed.
+        """
+        fetched = save_comments_to_db(full=full)
+        click.echo(f'Downloaded {fetched} comments.')
+
+    @app.cli.command('sync-replica')
+    def sync_replica_command():
+        """
+        Copy the primary SQLite database onto the SQLite read replica.
+        """
+        if sync_replica(db):
+            click.echo('Replica synced.')
+        else:
+            click.echo('No SQLite read replica is configured.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """
+        Re-create the full-text search index from the news items and posts.
+        """
+        indexed = rebuild_index()
+        click.echo(f'Indexed {indexed} documents.')
+
+    @app.cli.command('refresh-rankings')
+    def refresh_rankings_command():
+        """
+        Recompute the hot scores of the items whose points or age changed.
+        """
+        written = refresh_rankings()
+        cache.invalidate()
+        click.echo(f'Refreshed {written} hot scores.')
+
+    @app.cli.command('fetch-content')
+    @click.option('--limit', type=int, default=None, help='Maximum number of articles to download.')
+    def fetch_content(limit):
+        """
+        Download the articles of the news items that have no content yet.
+        """
+        stored = fetch_news_content(limit or app.config['CONTENT_FETCH_LIMIT'])
+        click.echo(f'Stored the content of {stored} news items.')
+
+    @app.cli.command('build-assets')
+    @click.option('--vendor', is_flag=True, help='Download the CDN bundles of the layout into static/vendor first.')
+    def build_assets(vendor):
+        """
+        Write the precompressed copies of the static files.
+        """
+        if vendor:
+            vendored = vendor_bundles(app.static_folder)
+            click.echo(f'Vendored {vendored} files.')
+        written = precompress(app.static_folder, app.config['COMPRESS_MIN_SIZE'])
+        click.echo(f'Wrote {written} precompressed files; restart the app to serve them.')
@@ -0,0 +1,150 @@
+"""
+Compression of the dynamic responses.
+
+Responses of a compressible type are compressed with the best encoding the
+client accepts: brotli when the brotli module is installed, gzip otherwise.
+Bodies smaller than COMPRESS_MIN_SIZE are sent as they are, since the
+saving would not pay for the work. Streamed responses such as /newsfeed
+are compressed as they are generated.
+
+The pages of the response cache carry a strong ETag. Their compressed
+bytes are kept in an LRU by ETag and encoding, so a cached page is
+compressed once per encoding, and the ETag is sent weak, since the bytes
+on the wire are no longer those it was computed from.
+"""
+
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError: # pragma: no cover
+    brotli = None
+
+from flaskblog.cache import LRUCache
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'text/xml', 'application/javascript',
+    'application/json', 'application/xml', 'image/svg+xml',
+}
+
+# Bytes of input after which a streamed response is flushed to the client
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+def available_encodings():
+    """
+    Return the supported encodings, the preferred one first.
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(encodings):
+    """
+    Return the encoding among encodings the client of the current request
+    accepts best, or None if it accepts none of them.
+    """
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data, encoding, level=6, quality=5):
+    """
+    Compress bytes with 'br' at the given quality or 'gzip' at the given level.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=quality)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level=6, quality=5):
+    """
+    Compress an iterable of byte chunks as they come. The output is flushed
+    every STREAM_FLUSH_SIZE bytes of input so that a long stream keeps reaching
+    the client.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=quality)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    pending = 0
+    for chunk in chunks:
+        output = process(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            output += flush()
+            pending = 0
+        if output:
+            yield output
+    yield finish()
+
+
+class _CompressionState:
+    """
+    Per app settings of the compression and its cache of compressed pages.
+    """
+
+    def __init__(self, config):
+        self.enabled = config['COMPRESS_ENABLED']
+        self.min_size = config['COMPRESS_MIN_SIZE']
+        self.level = config['COMPRESS_LEVEL']
+        self.quality = config['COMPRESS_BROTLI_QUALITY']
+        self.compressed = LRUCache(config['COMPRESS_CACHE_SIZE'], config['FEED_CACHE_TTL'])
+
+
+class Compression:
+    """
+    Flask extension compressing the responses of an app.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the compression of app's responses from its COMPRESS_* settings.
+        """
+        app.extensions['compression'] = _CompressionState(app.config)
+        app.after_request(self.compress_response)
+
+    @staticmethod
+    def compress_response(response):
+        """
+        Compress a response with the encoding negotiated with the client.
+        """
+        state = current_app.extensions['compression']
+        if (not state.enabled or request.method == 'HEAD' or response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(available_encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding, state.level, state.quality)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < state.min_size:
+                return response
+            etag, weak = response.get_etag()
+            key = (etag, encoding) if etag and not weak else None
+            data = state.compressed.get(key) if key else None
+            if data is None:
+                data = compress(body, encoding, state.level, state.quality)
+                if key:
+                    state.compressed.set(key, data)
+            response.set_data(data)
+            if key:
+                response.set_etag(etag, weak=True)
+        response.headers['Content-Encoding'] = encoding
+        return response
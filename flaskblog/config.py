@@ -1,5 +1,9 @@
 """
 Module for setting up configuration for the Flask application.
+
+Config holds the defaults; ProductionConfig, TestingConfig and
+BenchmarkConfig are the profiles selected by name with the APP_CONFIG
+environment variable (see CONFIGS).
 """
 
 class Config:
@@ -8,8 +12,184 @@ class Config:
 
     Attributes:
         SQLALCHEMY_DATABASE_URI (str): The URI for the application's database.
+            Overridden by the DATABASE_URL environment variable.
+        SQLALCHEMY_ENGINE_OPTIONS (dict): Keyword arguments of create_engine,
+            such as the pool sizing.
+        SQLITE_PRAGMAS (dict): PRAGMA statements run on every new SQLite
+            connection, by name. Entries of the SQLITE_PRAGMAS environment
+            variable, given as "name=value,name=value", are merged in.
+        READ_REPLICA_URI (str): Optional URI of a read replica serving the
+            queries of the read-only views. Overridden by the READ_REPLICA_URL
+            environment variable.
+        READ_YOUR_WRITES_SECONDS (float): How long after a write the reads of
+            the same browser session stay on the primary.
+        FEED_PAGE_SIZE (int): Default number of items on a page of the feed.
+        FEED_MAX_PAGE_SIZE (int): Largest page size a client may request.
+        ADMIN_COUNT_LIMIT (int): Count at which the totals of the admin listing
+            stop counting.
+        ADMIN_MAX_BATCH (int): Largest number of items in one moderation request.
+        INTERACTION_MAX_BATCH (int): Largest number of operations in one
+            /update_interactions request.
+        INTERACTION_WRITE_BEHIND (bool): Whether interactions are buffered and
+            written to the database in batches (see flaskblog.write_behind).
+        INTERACTION_FLUSH_INTERVAL (float): Seconds between two flushes of the buffer.
+        INTERACTION_FLUSH_SIZE (int): Number of buffered entries that triggers a flush.
+        INTERACTION_JOURNAL_PATH (str): Optional SQLite file holding the buffer, shared
+            by all worker processes and kept across crashes; in memory otherwise.
+        FEED_JSON_ENCODER (str): Encoder of compact newsfeed JSON: 'auto' uses
+            orjson when it is installed, 'json' always uses the standard library.
+        HN_API_URL (str): Base URL of the Hacker News API.
+        HN_TOP_STORIES (int): Number of top stories saved per ingestion run.
+        HN_CONCURRENCY (int): Maximum number of items fetched at once.
+        HN_PER_HOST_LIMIT (int): Maximum number of pooled connections per host.
+        HN_RETRIES (int): Retries of a failed request, with exponential backoff
+            starting at HN_BACKOFF seconds.
+        HN_TIMEOUT (float): Timeout of a single request in seconds.
+        HN_DEADLINE (float): Overall deadline of a bulk fetch in seconds.
+        HN_REFRESH_INTERVAL (int): Age in seconds after which a stored news item
+            is downloaded again by the delta sync.
+        HN_MAX_COMMENTS (int): Maximum number of comments downloaded per comment sync.
+        THREAD_PAGE_SIZE (int): Number of comments on a page of /thread.
+        FEED_CACHE_ENABLED (bool): Whether the feed responses are cached.
+        FEED_CACHE_TTL (int): Lifetime of a cached response in seconds.
+        FEED_CACHE_SIZE (int): Maximum number of responses cached per process.
+        FEED_CACHE_PATH (str): Optional SQLite file shared by all worker processes
+            for cached responses and the invalidation counter; without it a
+            write only invalidates the pages of the worker that handled it.
+            Only ProductionConfig sets it. A relative path is taken from the
+            instance folder.
+        FRAGMENT_CACHE_SIZE (int): Maximum number of rendered feed cards cached
+            per process.
+        FRAGMENT_CACHE_TTL (int): Lifetime of a cached feed card in seconds.
+        USER_CACHE_SIZE (int): Maximum number of users cached per process.
+        USER_CACHE_TTL (int): Lifetime of a cached user in seconds; it bounds how
+            long the other workers keep a user changed by one of them.
+        COMPRESS_ENABLED (bool): Whether the dynamic responses are compressed
+            for the clients accepting it (see flaskblog.compression).
+        COMPRESS_MIN_SIZE (int): Responses smaller than this many bytes are sent
+            uncompressed; precompressed copies are only written for larger assets.
+        COMPRESS_LEVEL (int): zlib level of the gzip compression, 1 to 9.
+        COMPRESS_BROTLI_QUALITY (int): Quality of the brotli compression, 0 to 11,
+            used when the brotli module is installed.
+        COMPRESS_CACHE_SIZE (int): Maximum number of compressed cached pages kept
+            per process.
+        ASSETS_MAX_AGE (int): Max-age in seconds of the static files served under
+            their fingerprinted name (see flaskblog.assets).
+        RATE_LIMIT_ENABLED (bool): Whether the write requests of the endpoints of
+            RATE_LIMITS are rate limited (see flaskblog.ratelimit).
+        RATE_LIMITS (dict): Token bucket policy by endpoint: 'burst' requests at
+            once, refilled at 'rate' per second, per logged-in user or, with
+            'key': 'ip', per client address.
+        RATE_LIMIT_PATH (str): Optional SQLite file holding the buckets, shared by
+            all worker processes; in memory per process otherwise, so that each
+            worker applies the limits on its own. Only ProductionConfig sets it.
+            A relative path is taken from the instance folder.
+        RATE_LIMIT_TRUSTED_PROXIES (int): Number of proxies in front of the app
+            whose X-Forwarded-For entries are trusted for the client address.
+            The X-Request-Start header timing the load shedding is only read
+            when it is not 0.
+        SHED_ENABLED (bool): Whether a worker answers the limited endpoints 503
+            while it is overloaded.
+        SHED_TARGET (float): Seconds, queueing included, that the fastest limited
+            request of an interval may take before the worker counts as overloaded.
+        SHED_INTERVAL (float): Length in seconds of the measuring interval.
+        METRICS_ENABLED (bool): Whether requests are instrumented and /metrics is served.
+        METRICS_BUCKETS (tuple): Upper bounds in seconds of the latency histogram buckets.
+        SLOW_QUERY_THRESHOLD_MS (float): SQL statements slower than this are logged.
+        RANKING_GRAVITY (float): Exponent of the age in the hot score.
+        RANKING_COMMENT_WEIGHT (float): Points a comment adds to a news item.
+        RANKING_REFRESH_INTERVAL (int): Age in seconds after which the hot
+            score of a recent item is computed again.
+        RANKING_WINDOW (int): Items older than this many seconds keep their
+            last hot score unless their points change.
+        CONTENT_FETCH_ENABLED (bool): Whether the news sync downloads the
+            linked articles after saving the items. Off by default; only
+            ProductionConfig turns it on.
+        CONTENT_FETCH_LIMIT (int): Maximum number of articles downloaded per run.
+        CONTENT_CONCURRENCY (int): Maximum number of articles downloaded at once.
+        CONTENT_PER_HOST_LIMIT (int): Maximum number of connections per site.
+        CONTENT_TIMEOUT (float): Timeout of a single article request in seconds.
+        CONTENT_DEADLINE (float): Overall deadline of a run in seconds.
+        CONTENT_MAX_BYTES (int): Articles larger than this are skipped.
+        CONTENT_MAX_CHARS (int): Extracted text is truncated to this length.
+        CONTENT_ALLOWED_NETWORKS (tuple): Networks, such as '10.0.0.0/8', the
+            article fetcher may connect to although they are not public.
     """
     SQLALCHEMY_DATABASE_URI = 'sqlite:///site.db'
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+        'cache_size': -16000,
+    }
+    READ_REPLICA_URI = None
+    READ_YOUR_WRITES_SECONDS = 10
+    FEED_PAGE_SIZE = 30
+    FEED_MAX_PAGE_SIZE = 200
+    ADMIN_COUNT_LIMIT = 10000
+    ADMIN_MAX_BATCH = 500
+    INTERACTION_MAX_BATCH = 100
+    INTERACTION_WRITE_BEHIND = False
+    INTERACTION_FLUSH_INTERVAL = 1.0
+    INTERACTION_FLUSH_SIZE = 1000
+    INTERACTION_JOURNAL_PATH = None
+    FEED_JSON_ENCODER = 'auto'
+    HN_API_URL = 'https://hacker-news.firebaseio.com/v0'
+    HN_TOP_STORIES = 30
+    HN_CONCURRENCY = 20
+    HN_PER_HOST_LIMIT = 10
+    HN_RETRIES = 3
+    HN_BACKOFF = 0.2
+    HN_TIMEOUT = 10
+    HN_DEADLINE = 30
+    HN_REFRESH_INTERVAL = 3600
+    HN_MAX_COMMENTS = 5000
+    THREAD_PAGE_SIZE = 500
+    FEED_CACHE_ENABLED = True
+    FEED_CACHE_TTL = 60
+    FEED_CACHE_SIZE = 512
+    FEED_CACHE_PATH = None
+    FRAGMENT_CACHE_SIZE = 2048
+    FRAGMENT_CACHE_TTL = 3600
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 30
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_CACHE_SIZE = 512
+    ASSETS_MAX_AGE = 31536000
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {
+        'main.update_interaction': {'burst': 30, 'rate': 5},
+        'main.update_interactions': {'burst': 10, 'rate': 1},
+        'main.create_post': {'burst': 5, 'rate': 0.05},
+        'main.update_user': {'burst': 10, 'rate': 0.5},
+        'main.delete_post': {'burst': 10, 'rate': 0.5},
+    }
+    RATE_LIMIT_PATH = None
+    RATE_LIMIT_TRUSTED_PROXIES = 0
+    SHED_ENABLED = True
+    SHED_TARGET = 0.5
+    SHED_INTERVAL = 1.0
+    METRICS_ENABLED = True
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    SLOW_QUERY_THRESHOLD_MS = 100
+    RANKING_GRAVITY = 1.8
+    RANKING_COMMENT_WEIGHT = 0.5
+    RANKING_REFRESH_INTERVAL = 600
+    RANKING_WINDOW = 172800
+    CONTENT_FETCH_ENABLED = False
+    CONTENT_FETCH_LIMIT = 100
+    CONTENT_CONCURRENCY = 10
+    CONTENT_PER_HOST_LIMIT = 2
+    CONTENT_TIMEOUT = 10
+    CONTENT_DEADLINE = 60
+    CONTENT_MAX_BYTES = 2_000_000
+    CONTENT_MAX_CHARS = 100_000
+    CONTENT_ALLOWED_NETWORKS = ()
 
     def dummy_method_one(self):
         """
@@ -20,3 +200,61 @@ class Config:
         """
         Another dummy method
         """
+
+
+class ProductionConfig(Config):
+    """
+    Configuration of the gunicorn deployment: WAL lets readers proceed while
+    a writer commits, a larger page cache and memory mapped I/O serve the
+    feed queries from memory, and the pool holds a connection per thread of
+    a worker.
+    """
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 3600,
+    }
+    SQLITE_PRAGMAS = dict(
+        Config.SQLITE_PRAGMAS,
+        cache_size=-64000,
+        mmap_size=268435456,
+    )
+    CONTENT_FETCH_ENABLED = True
+    FEED_CACHE_PATH = 'feed_cache.db'
+    RATE_LIMIT_PATH = 'rate_limits.db'
+    RATE_LIMIT_TRUSTED_PROXIES = 1
+
+
+class TestingConfig(Config):
+    """
+    Configuration of the test suite: a private in-memory database per app.
+    """
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    CONTENT_FETCH_ENABLED = False
+    RATE_LIMIT_ENABLED = False
+    SHED_ENABLED = False
+
+
+class BenchmarkConfig(ProductionConfig):
+    """
+    Configuration of the benchmarks: the production engine on a scratch
+    database, with the response cache off so that every request reaches
+    the database.
+    """
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///benchmark.db'
+    FEED_CACHE_ENABLED = False
+    CONTENT_FETCH_ENABLED = False
+    RATE_LIMIT_ENABLED = False
+    SHED_ENABLED = False
+    SLOW_QUERY_THRESHOLD_MS = 10_000
+
+
+CONFIGS = {
+    'default': Config,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
+}
@@ -0,0 +1,228 @@
+"""
+Engine set up of the application database.
+
+SQLite settings that are not stored in the database file have to be applied
+to every new connection, so they are run as PRAGMA statements from a connect
+listener on the engines of the app.
+
+When READ_REPLICA_URI is set, the SELECT statements of the views decorated
+with replica_reads go to the 'replica' bind, while every write and every
+read of the other views stays on the primary. A request that writes marks
+the browser session, and for READ_YOUR_WRITES_SECONDS afterwards that
+user's reads stay on the primary too, so a redirect after a write shows the
+write. Other users may see the replica lag behind the primary until it is
+synced, e.g. with `flask sync-replica` for a local SQLite replica.
+
+Connections must not cross a fork: a gunicorn master that preloads the app
+may have opened some, so forked children drop the pools they inherited
+without closing the connections, which stay the parent's.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+import weakref
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session as BaseSession
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+# Tables created by DDL events rather than models: the FTS5 search index and
+# its shadow tables
+UNMAPPED_TABLE_PREFIXES = ('search_index',)
+
+
+def parse_pragmas(value):
+    """
+    Parse "name=value,name=value" into a dict of pragmas.
+    """
+    pragmas = {}
+    for item in (value or '').split(','):
+        name, _, setting = item.partition('=')
+        if name.strip() and setting.strip():
+            pragmas[name.strip()] = setting.strip()
+    return pragmas
+
+
+def pragma_statements(pragmas):
+    """
+    Turn a dict of pragmas into PRAGMA statements. The names and values come
+    from the configuration and are checked to be plain identifiers or numbers.
+    """
+    statements = []
+    for name, value in pragmas.items():
+        value = str(value)
+        if not name.isidentifier() or not value.lstrip('-').isalnum():
+            raise ValueError(f'Invalid SQLite pragma {name}={value}')
+        statements.append(f'PRAGMA {name}={value}')
+    return statements
+
+
+def configure_engines(app, db):
+    """
+    Run the SQLITE_PRAGMAS of app on every new connection of its SQLite engines.
+    """
+    # The replica mirrors the default schema and has no models of its own,
+    # so create_all and drop_all leave it alone
+    db.metadatas.pop(REPLICA_BIND, None)
+    statements = pragma_statements(app.config['SQLITE_PRAGMAS'])
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            engine_statements = list(statements)
+            if key == REPLICA_BIND:
+                # Catch a write routed to the replica by mistake
+                engine_statements.append('PRAGMA query_only=ON')
+            event.listen(engine, 'connect', _pragma_listener(engine_statements))
+
+
+def dispose_after_fork(app, db):
+    """
+    Have forked children of this process open their own connections to the
+    engines of app.
+    """
+    with app.app_context():
+        _FORKED_ENGINES.update(db.engines.values())
+
+
+def _dispose_engines():
+    for engine in list(_FORKED_ENGINES):
+        engine.dispose(close=False)
+
+
+_FORKED_ENGINES = weakref.WeakSet()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines)
+
+
+def _pragma_listener(statements):
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+        logger.debug("Applied %d SQLite pragmas", len(statements))
+    return set_pragmas
+
+
+class RoutingSession(Session):
+    """
+    Session sending the SELECT statements of replica_reads views to the
+    replica bind. Writes, and reads once the request has written, go to the
+    bind Flask-SQLAlchemy would pick.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # ORM statements are passed as a mapper without a clause; DML marks
+        # the request as writing before its bind is looked up
+        if (bind is None and not self._flushing and replica_allowed()
+                and (clause is None or getattr(clause, 'is_select', False))):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(BaseSession, 'after_flush')
+def _flushed(_session, _flush_context):
+    mark_write()
+
+
+@event.listens_for(BaseSession, 'do_orm_execute')
+def _orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        mark_write()
+
+
+def mark_write():
+    """
+    Record that the current request writes to the database.
+    """
+    if has_request_context():
+        g.db_wrote = True
+
+
+def recently_wrote():
+    """
+    Whether the session wrote within the last READ_YOUR_WRITES_SECONDS.
+    """
+    last_write = session.get('_last_write')
+    window = current_app.config['READ_YOUR_WRITES_SECONDS']
+    return last_write is not None and time.time() - last_write <= window
+
+
+def replica_allowed():
+    """
+    Whether reads of the current request may be served by the replica.
+    """
+    if not has_request_context() or not g.get('use_replica') or g.get('db_wrote'):
+        return False
+    return not recently_wrote()
+
+
+def replica_reads(view):
+    """
+    Decorator letting a read-only view query the read replica.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_routing(app):
+    """
+    Add the replica bind of app and remember the writes of each request in
+    the browser session, for read-your-writes.
+    """
+    if app.config['READ_REPLICA_URI']:
+        replica = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=app.config['READ_REPLICA_URI'])
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                              **{REPLICA_BIND: replica})
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('db_wrote'):
+            session['_last_write'] = time.time()
+        return response
+
+
+def sync_replica(db):
+    """
+    Copy the primary SQLite database onto the SQLite replica with the online
+    backup API. Returns False if there is no SQLite replica to sync.
+    """
+    primary = db.engines[None]
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None or primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        return False
+    source = primary.raw_connection()
+    try:
+        target = sqlite3.connect(replica.url.database, timeout=30)
+        try:
+            source.driver_connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    logger.info("Synced the read replica %s", replica.url.database)
+    return True
+
+
+def include_in_migrations(name, type_, _parent_names):
+    """
+    Alembic include_name hook leaving the tables that have no model out of
+    the autogenerated migrations.
+    """
+    return not (type_ == 'table' and name.startswith(UNMAPPED_TABLE_PREFIXES))
@@ -0,0 +1,369 @@
+"""
+Asyncio client for the Hacker News API.
+
+The client keeps a pool of keep-alive HTTP/1.1 connections per host, so a
+bulk fetch of hundreds of items pays for a handful of TCP/TLS handshakes
+instead of one per item. Concurrency, the number of connections per host,
+retries with exponential backoff and an overall deadline are configurable.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import random
+import socket
+import ssl
+import time
+import zlib
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://hacker-news.firebaseio.com/v0'
+
+# Status codes worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HNClientError(Exception):
+    """
+    Raised when a request to the Hacker News API fails after all retries.
+    """
+
+
+class ResponseTooLarge(ValueError):
+    """
+    Raised when a response body exceeds the size limit of the request.
+    """
+
+
+class AddressNotAllowed(ValueError):
+    """
+    Raised when a host resolves to an address the pool may not connect to.
+    """
+
+
+class HTTPResponse:
+    """
+    A fully read HTTP response.
+    """
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        """
+        Decode the body as JSON.
+        """
+        return json.loads(self.body)
+
+
+def host_header(hostname, port, default_port):
+    """
+    Return the Host header of a request to hostname: the host without any
+    userinfo of the URL, with the port only when it is not the default.
+    """
+    host = f'[{hostname}]' if ':' in hostname else hostname
+    return host if port == default_port else f'{host}:{port}'
+
+
+class ConnectionPool:
+    """
+    A pool of keep-alive HTTP/1.1 connections, limited per host.
+    """
+
+    def __init__(self, per_host_limit=10, timeout=10, address_allowed=None):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.address_allowed = address_allowed
+        self._idle = {}
+        self._limits = {}
+        self._ssl_context = None
+        self.connections_opened = 0
+
+    def _limit(self, key):
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.per_host_limit)
+        return self._limits[key]
+
+    async def _open(self, scheme, host, port):
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        server_hostname = None
+        if self.address_allowed is not None:
+            # Connect to the address that was checked, not to a new lookup of the host
+            server_hostname = host if ssl_context else None
+            host = await asyncio.wait_for(self._resolve(host, port), self.timeout)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=server_hostname),
+            self.timeout
+        )
+        self.connections_opened += 1
+        return reader, writer
+
+    async def _resolve(self, host, port):
+        """
+        Resolve host and return its first address, raising AddressNotAllowed
+        when any of its addresses fails address_allowed.
+        """
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = [info[4][0] for info in infos]
+        for address in addresses:
+            if not self.address_allowed(address):
+                raise AddressNotAllowed(f'{host} resolves to {address}')
+        if not addresses:
+            raise AddressNotAllowed(f'{host} does not resolve')
+        return addresses[0]
+
+    async def request(self, url, headers=None, max_bytes=None):
+        """
+        Send a GET request and read the whole response.
+
+        A connection that was closed by the server while idle is replaced
+        by a fresh one once; any other error is raised to the caller.
+        ResponseTooLarge is raised, and the connection closed, when the body
+        is larger than max_bytes.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        default_port = 443 if scheme == 'https' else 80
+        port = parts.port or default_port
+        key = (scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        headers = dict({'Accept': 'application/json'}, **(headers or {}))
+        lines = [
+            f'GET {target} HTTP/1.1',
+            f'Host: {host_header(parts.hostname, port, default_port)}',
+            'Accept-Encoding: gzip, deflate',
+            'Connection: keep-alive',
+        ]
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        async with self._limit(key):
+            idle = self._idle.setdefault(key, [])
+            while True:
+                reused = bool(idle)
+                connection = idle.pop() if reused else await self._open(*key)
+                try:
+                    response, keep_alive = await asyncio.wait_for(
+                        self._exchange(connection, payload, max_bytes), self.timeout
+                    )
+                except (OSError, asyncio.IncompleteReadError):
+                    self._close(connection)
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    self._close(connection)
+                    raise
+
+                if keep_alive:
+                    idle.append(connection)
+                else:
+                    self._close(connection)
+                return response
+
+    async def _exchange(self, connection, payload, max_bytes=None):
+        reader, writer = connection
+        writer.write(payload)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (version == 'HTTP/1.1'
+                      and headers.get('connection', '').lower() != 'close')
+        status = int(status)
+        if status < 200 or status in (204, 304):
+            # Never has a body, whatever the headers say
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked(reader, max_bytes)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if max_bytes is not None and length > max_bytes:
+                raise ResponseTooLarge(f'Response of {length} bytes')
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read(-1 if max_bytes is None else max_bytes + 1)
+            if max_bytes is not None and len(body) > max_bytes:
+                raise ResponseTooLarge(f'Response over {max_bytes} bytes')
+            keep_alive = False
+
+        encoding = headers.get('content-encoding', '').lower()
+        if encoding in ('gzip', 'deflate'):
+            if max_bytes is None:
+                body = gzip.decompress(body) if encoding == 'gzip' else zlib.decompress(body)
+            else:
+                # Bound the decompressed size as well
+                wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+                body = zlib.decompressobj(wbits).decompress(body, max_bytes + 1)
+                if len(body) > max_bytes:
+                    raise ResponseTooLarge(f'Decompressed response over {max_bytes} bytes')
+        return HTTPResponse(status, headers, body), keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader, max_bytes=None):
+        chunks = []
+        received = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Skip the trailer section
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            received += size
+            if max_bytes is not None and received > max_bytes:
+                raise ResponseTooLarge(f'Response over {max_bytes} bytes')
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    @staticmethod
+    def _close(connection):
+        connection[1].close()
+
+    async def close(self):
+        """
+        Close every idle connection.
+        """
+        for connections in self._idle.values():
+            for connection in connections:
+                self._close(connection)
+        self._idle.clear()
+
+
+class HNClient:
+    """
+    Client for the Hacker News API backed by a shared connection pool.
+
+    Use it as an async context manager so that the pooled connections are
+    closed when done.
+    """
+
+    def __init__(self, base_url=DEFAULT_API_URL, concurrency=20, per_host_limit=10,
+                 retries=3, backoff=0.2, timeout=10, deadline=30):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.pool = ConnectionPool(per_host_limit=per_host_limit, timeout=timeout)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a client from the HN_* settings of a Flask config.
+        """
+        return cls(
+            base_url=config.get('HN_API_URL', DEFAULT_API_URL),
+            concurrency=config.get('HN_CONCURRENCY', 20),
+            per_host_limit=config.get('HN_PER_HOST_LIMIT', 10),
+            retries=config.get('HN_RETRIES', 3),
+            backoff=config.get('HN_BACKOFF', 0.2),
+            timeout=config.get('HN_TIMEOUT', 10),
+            deadline=config.get('HN_DEADLINE', 30),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.close()
+
+    async def get_json(self, url, deadline_at=None):
+        """
+        Fetch a URL and decode its JSON body, retrying transient failures
+        with exponential backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self.pool.request(url)
+                if response.status == 200:
+                    return response.json()
+                error = HNClientError(f'{url} returned HTTP {response.status}')
+                if response.status not in RETRY_STATUSES:
+                    raise error
+            except (OSError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    ValueError, zlib.error) as e:
+                error = HNClientError(f'{url} failed: {e!r}')
+
+            delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+            out_of_time = deadline_at is not None and time.monotonic() + delay >= deadline_at
+            if attempt >= self.retries or out_of_time:
+                raise error
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def top_story_ids(self):
+        """
+        Fetch the ids of the current top stories.
+        """
+        return await self.get_json(f'{self.base_url}/topstories.json')
+
+    async def updated_ids(self):
+        """
+        Fetch the ids of the items that changed recently.
+        """
+        updates = await self.get_json(f'{self.base_url}/updates.json')
+        return (updates or {}).get('items', [])
+
+    async def item(self, item_id, deadline_at=None):
+        """
+        Fetch a single item, or None if it could not be fetched.
+        """
+        try:
+            return await self.get_json(f'{self.base_url}/item/{item_id}.json', deadline_at)
+        except HNClientError as e:
+            logger.error("Error fetching details for item %s: %s", item_id, e)
+            return None
+
+    async def items(self, item_ids):
+        """
+        Fetch many items concurrently within the overall deadline.
+
+        Returns a list in the order of item_ids, with None for items that
+        failed or did not finish before the deadline.
+        """
+        item_ids = list(item_ids)
+        if not item_ids:
+            return []
+        deadline_at = time.monotonic() + self.deadline
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(item_id):
+            async with limit:
+                return await self.item(item_id, deadline_at)
+
+        tasks = [asyncio.ensure_future(fetch(item_id)) for item_id in item_ids]
+        _, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            logger.warning("Deadline reached, %d of %d items were not fetched",
+                           len(pending), len(item_ids))
+
+        return [None if task.cancelled() else task.result() for task in tasks]
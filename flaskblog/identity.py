@@ -0,0 +1,101 @@
+"""
+Identity of the logged-in user.
+
+The session holds the id of the user from the login callback. The current
+user is resolved from it once per request by primary key and kept on
+flask.g, so that every helper of the request shares the same object. The
+resolved rows are also kept in an in-process LRU with a TTL, keyed by user
+id, so most authenticated requests do not query the user table at all.
+
+The write paths that change a user call invalidate after they commit. The
+LRU is per process: another worker keeps serving its copy until
+USER_CACHE_TTL expires, which bounds how long a changed role takes to apply
+everywhere.
+"""
+
+from flask import current_app, g, session
+from sqlalchemy import select
+
+from flaskblog.cache import LRUCache
+
+
+class CurrentUser:
+    """
+    Read-only copy of a user row, safe to share between requests.
+    """
+
+    def __init__(self, user_id, email, name, nickname, picture, role):
+        self.id = user_id
+        self.email = email
+        self.name = name
+        self.nickname = nickname
+        self.picture = picture
+        self.role = role
+
+    @property
+    def is_admin(self):
+        """
+        Whether the user has admin privileges.
+        """
+        return self.role == 'Admin'
+
+
+class Identity:
+    """
+    Flask extension resolving the user of the current session.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Set up the user cache for app from its USER_CACHE_* settings.
+        """
+        app.extensions['identity'] = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+    @staticmethod
+    def _cache():
+        return current_app.extensions['identity']
+
+    def current_user(self):
+        """
+        Return the CurrentUser of the session, or None if nobody is logged in
+        or the user no longer exists. Resolved at most once per request.
+        """
+        if 'current_user' not in g:
+            user_session = session.get('user') or {}
+            user_id = user_session.get('id')
+            g.current_user = self.get(user_id) if isinstance(user_id, int) else None
+        return g.current_user
+
+    def get(self, user_id):
+        """
+        Return the CurrentUser with the given id, from the cache if possible.
+        """
+        # pylint: disable=import-outside-toplevel
+        from flaskblog import db
+        from flaskblog.models import User
+        # pylint: enable=import-outside-toplevel
+        cache = self._cache()
+        user = cache.get(user_id)
+        if user is None:
+            row = db.session.execute(
+                select(User.id, User.email, User.name, User.nickname, User.picture, User.role)
+                .where(User.id == user_id)
+            ).first()
+            if row is None:
+                return None
+            user = CurrentUser(*row)
+            cache.set(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        """
+        Forget the cached copy of a user. Called by the write paths after
+        they commit a change to the user.
+        """
+        self._cache().delete(user_id)
+        if g.get('current_user') is not None and g.current_user.id == user_id:
+            del g.current_user
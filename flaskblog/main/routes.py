@@ -2,54 +2,107 @@
 This module contains route definitions for the main functionality of the Flask application.
 """
 
-#import logging
+import logging
 #from datetime import datetime
 from os import environ as env
 #from urllib.parse import urlencode
 
-from flask import Blueprint, render_template, request, jsonify
-from flask import json, session, redirect, url_for, flash, current_app
-from sqlalchemy import func, case, select, union_all, literal_column
-
-from flaskblog import db, oauth
-from flaskblog.models import NewsItem, Post, User, UserInteraction
+from flask import Blueprint, render_template, request, jsonify, abort
+from flask import session, redirect, url_for, flash, current_app, stream_with_context
+from sqlalchemy import case, func, select, literal_column, update
+
+from flaskblog import db, auth0, cache, identity, interaction_buffer
+from flaskblog.articles import decompress_text
+from flaskblog.database import replica_reads
+from flaskblog.models import Comment, FeedRanking, NewsItem, Post, User, UserInteraction
+from flaskblog.models import INTERACTIONS, ITEM_TYPES, MODERATION_ACTIONS, apply_interactions
+from flaskblog.models import interaction_counts, moderate_items, upsert_login_user
+from flaskblog.main.utils import page_args, paginate, paginate_feed, feed_statement, feed_sort
+from flaskblog.main.utils import capped_count, display_time, hot_feed_statement, replace_columns
+from flaskblog.main.utils import stream_feed_json, wants_compact_json
+from flaskblog.search import index_documents, search_available
+from flaskblog.search import match_expression, search_statement
 
 main = Blueprint('main', __name__)
 
+logger = logging.getLogger(__name__)
+
+# Epoch seconds used to order the merged feed
+NEWS_SORT_KEY = NewsItem.sort_key
+POST_SORT_KEY = Post.sort_key
+
 @main.route("/")
 @main.route("/home")
+@cache.cached
+@replica_reads
 def home():
     """
     Home route
     """
+    try:
+        cursor, limit = page_args()
+        sort = feed_sort()
+    except ValueError:
+        abort(400)
+
+    if sort == 'hot':
+        combined_results, next_cursor = paginate(
+            hot_feed_statement(
+                [
+                    FeedRanking.item_id.label('id'),
+                    func.coalesce(NewsItem.title, Post.title).label('title'),
+                    func.coalesce(NewsItem.text, Post.content).label('text'),
+                    func.coalesce(NEWS_SORT_KEY, POST_SORT_KEY).label('datetime'),
+                    display_time(func.coalesce(NEWS_SORT_KEY, POST_SORT_KEY)).label('posted'),
+                    FeedRanking.item_type.label('type'),
+                    func.coalesce(Post.like_count, 0).label('likes'),
+                    func.coalesce(Post.dislike_count, 0).label('dislikes')
+                ],
+                cursor,
+                limit
+            ),
+            limit,
+            sort_label='rank'
+        )
+        combined_results = with_news_counts(combined_results)
+        return render_template('home.html', news=combined_results, next_cursor=next_cursor,
+                               reactions=page_reactions(combined_results))
+
     news_select = select(
         NewsItem.id,
         NewsItem.title,
         NewsItem.text,
-        NewsItem.time.label('datetime'),
+        NEWS_SORT_KEY.label('datetime'),
+        display_time(NEWS_SORT_KEY).label('posted'),
         literal_column("'news'").label('type'),
+        # Counted for the page by with_news_counts
         literal_column("0").label('likes'),
         literal_column("0").label('dislikes')
-    )
+    ).where(~NewsItem.hidden)
 
     post_select = select(
         Post.id,
         Post.title,
         Post.content.label('text'),
-        Post.date_posted.label('datetime'),
+        POST_SORT_KEY.label('datetime'),
+        display_time(POST_SORT_KEY).label('posted'),
         literal_column("'post'").label('type'),
-        func.count(case((UserInteraction.interaction == 'like', 1))).label('likes'), # pylint: disable=not-callable
-        func.count(case((UserInteraction.interaction == 'dislike', 1))).label('dislikes') # pylint: disable=not-callable
-    ).outerjoin(UserInteraction, Post.id == UserInteraction.post_id).group_by(Post.id)
-
-    combined_query = (
-        union_all(news_select, post_select)
-        .order_by(literal_column('datetime desc'))
-        .limit(30)
+        Post.like_count.label('likes'),
+        Post.dislike_count.label('dislikes')
+    ).where(~Post.hidden)
+
+    combined_results, next_cursor = paginate_feed(
+        [
+            (news_select, 'news', NEWS_SORT_KEY, NewsItem.id),
+            (post_select, 'post', POST_SORT_KEY, Post.id)
+        ],
+        cursor,
+        limit
     )
-    combined_results = db.session.execute(combined_query).fetchall()
 
-    return render_template('home.html', news=combined_results)
+    combined_results = with_news_counts(combined_results)
+    return render_template('home.html', news=combined_results, next_cursor=next_cursor,
+                           reactions=page_reactions(combined_results))
 
 @main.route("/about")
 def about():
@@ -59,13 +112,46 @@ def about():
     return render_template('about.html', title='About')
 
 @main.route("/newsfeed")
+@cache.cached
+@replica_reads
 def newsfeed():
     """
     Newsfeed
     """
     try:
-        # Create a subquery for NewsItem
-        news_subquery = db.session.query(
+        cursor, limit = page_args()
+        sort = feed_sort()
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or sort"}), 400
+
+    try:
+        if sort == 'hot':
+            result = db.session.execute(hot_feed_statement(
+                [
+                    FeedRanking.item_id.label('id'),
+                    func.coalesce(NewsItem.by, Post.user_email).label('by'),
+                    NewsItem.descendants.label('descendants'),
+                    NewsItem.kids.label('kids'),
+                    NewsItem.score.label('score'),
+                    NewsItem.time.label('time'),
+                    func.coalesce(NewsItem.title, Post.title).label('title'),
+                    case((FeedRanking.item_type == 'post', 'post'), else_=NewsItem.type).label('type'),
+                    NewsItem.url.label('url'),
+                    func.coalesce(NewsItem.text, Post.content).label('text'),
+                    func.coalesce(NEWS_SORT_KEY, POST_SORT_KEY).label('datetime')
+                ],
+                cursor,
+                limit
+            ))
+            rows, serialize = with_reactions(result, limit)
+            body = stream_feed_json(rows, limit, serialize, wants_compact_json(), sort_label='rank')
+            return current_app.response_class(
+                stream_with_context(body),
+                status=200,
+                mimetype='application/json'
+            )
+
+        news_select = select(
             NewsItem.id.label('id'),
             NewsItem.by.label('by'),
             NewsItem.descendants.label('descendants'),
@@ -76,11 +162,10 @@ def newsfeed():
             NewsItem.type.label('type'),
             NewsItem.url.label('url'),
             NewsItem.text.label('text'),
-            NewsItem.time.label('datetime')
-        ).subquery()
+            NEWS_SORT_KEY.label('datetime')
+        ).where(~NewsItem.hidden)
 
-        # Create a subquery for Post
-        post_subquery = db.session.query(
+        post_select = select(
             Post.id.label('id'),
             Post.user_email.label('by'),
             literal_column("NULL").label('descendants'),
@@ -91,81 +176,223 @@ def newsfeed():
             literal_column("'post'").label('type'),
             literal_column("NULL").label('url'),
             Post.content.label('text'),
-            func.strftime('%s', Post.date_posted).label('datetime')
-        ).subquery()
-
-        union_query = union_all(news_subquery.select(),post_subquery.select()).alias('union_query')
-        ordered_union_query = (
-            db.session.query(union_query)
-            .order_by(union_query.c.datetime.desc())
-            .limit(30)
+            POST_SORT_KEY.label('datetime')
+        ).where(~Post.hidden)
+
+        statement = feed_statement(
+            [
+                (news_select, 'news', NEWS_SORT_KEY, NewsItem.id),
+                (post_select, 'post', POST_SORT_KEY, Post.id)
+            ],
+            cursor,
+            limit
         )
-        results = ordered_union_query.all()
-        news_list = [
-            {
-                "id": item.id,
-                "by": item.by,
-                "descendants": item.descendants if item.descendants else "N/A",
-                "kids": item.kids if item.kids else "N/A",
-                "score": item.score if item.score else "N/A",
-                "time": item.time if item.time else "N/A",
-                "title": item.title,
-                "type": item.type,
-                "url": item.url if item.url else "N/A",
-                "text": item.text if item.text else "N/A",
-                "datetime": item.datetime
-            }
-            for item in results
-        ]
+        # Run the query here so that errors still get a proper response,
+        # then encode the rows while they are read from the cursor.
+        result = db.session.execute(statement)
+        rows, serialize = with_reactions(result, limit)
+        body = stream_feed_json(rows, limit, serialize, wants_compact_json())
 
         return current_app.response_class(
-            response=json.dumps(news_list, indent=4),
+            stream_with_context(body),
             status=200,
             mimetype='application/json'
         )
     except Exception as e: # pylint: disable=broad-except
         return jsonify({"error": str(e)}), 500
 
+def newsfeed_item(item):
+    """
+    Convert a newsfeed row to its JSON representation.
+    """
+    return {
+        "id": item.id,
+        "by": item.by,
+        "descendants": item.descendants if item.descendants else "N/A",
+        "kids": item.kids if item.kids else "N/A",
+        "score": item.score if item.score else "N/A",
+        "time": item.time if item.time else "N/A",
+        "title": item.title,
+        "type": item.type,
+        "url": item.url if item.url else "N/A",
+        "text": item.text if item.text else "N/A",
+        "datetime": item.datetime
+    }
+
+def page_reactions(rows):
+    """
+    Return the interactions of the logged-in user with the items of a feed
+    page, as a dict of (item type, item id) to 'like' or 'dislike', read
+    with one query for the whole page. Anonymous visitors cost no query.
+    """
+    user_id = (session.get('user') or {}).get('id')
+    if user_id is None or not rows:
+        return {}
+    return interaction_buffer.current_states(user_id, [(row.feed_type, row.id) for row in rows])
+
+def with_news_counts(rows):
+    """
+    Fill in the likes and dislikes of the news items of a feed page.
+    News items have no counters, so they are counted for the whole page
+    with one grouped query; pages without news items cost none.
+    """
+    counts = interaction_counts([row.id for row in rows if row.feed_type == 'news'])
+    if not counts:
+        return rows
+    return [
+        replace_columns(row, likes=counts[row.id][0], dislikes=counts[row.id][1])
+        if row.feed_type == 'news' else row
+        for row in rows
+    ]
+
+def with_reactions(result, limit):
+    """
+    Return the rows of a newsfeed page and a serializer adding the reaction
+    of the current user to every item. For a logged-in user the page is
+    fetched before it is streamed, so that its reactions take one query.
+    """
+    if (session.get('user') or {}).get('id') is None:
+        return result, lambda row: dict(newsfeed_item(row), reaction=None)
+    rows = result.fetchall()
+    reactions = page_reactions(rows[:limit])
+    return rows, lambda row: dict(newsfeed_item(row), reaction=reactions.get((row.feed_type, row.id)))
+
+@main.route("/news/<int:item_id>/content")
+@cache.cached
+@replica_reads
+def news_content(item_id):
+    """
+    Text of the article linked by a news item.
+    """
+    item = db.session.execute(
+        select(NewsItem.id, NewsItem.title, NewsItem.url, NewsItem.content)
+        .where(NewsItem.id == item_id, ~NewsItem.hidden)
+    ).first()
+    if item is None:
+        return jsonify({"error": "News item not found"}), 404
+    return jsonify(id=item.id, title=item.title, url=item.url, content=decompress_text(item.content))
+
+@main.route("/thread/<int:story_id>")
+@cache.cached
+@replica_reads
+def thread(story_id):
+    """
+    Comment thread of a news item, depth first. Comments are paged by
+    their path: ?after=<next_after of the previous page>.
+    """
+    story = db.session.execute(
+        select(NewsItem.id, NewsItem.title, NewsItem.url, NewsItem.by, NewsItem.descendants)
+        .where(NewsItem.id == story_id, ~NewsItem.hidden)
+    ).first()
+    if story is None:
+        return jsonify({"error": "News item not found"}), 404
+
+    limit = current_app.config['THREAD_PAGE_SIZE']
+    statement = (
+        select(Comment.id, Comment.parent_id, Comment.depth, Comment.path, Comment.by,
+               Comment.text, Comment.time, Comment.deleted)
+        .where(Comment.story_id == story_id)
+        .order_by(Comment.path)
+        .limit(limit + 1)
+    )
+    after = request.args.get('after')
+    if after:
+        statement = statement.where(Comment.path > after)
+    rows = db.session.execute(statement).all()
+    comments = [
+        {
+            "id": row.id,
+            "parent": row.parent_id,
+            "depth": row.depth,
+            "by": row.by,
+            "text": None if row.deleted else row.text,
+            "time": row.time,
+            "deleted": row.deleted
+        }
+        for row in rows[:limit]
+    ]
+    return jsonify(
+        id=story.id, title=story.title, url=story.url, by=story.by,
+        descendants=story.descendants, comments=comments,
+        next_after=rows[limit - 1].path if len(rows) > limit else None
+    )
+
+@main.route("/search")
+@cache.cached
+@replica_reads
+def search():
+    """
+    Full-text search over news items and posts, best match first.
+    """
+    if not search_available():
+        return jsonify({"error": "Search is not available"}), 501
+    limit = max(1, min(request.args.get('limit', default=current_app.config['FEED_PAGE_SIZE'], type=int),
+                       current_app.config['FEED_MAX_PAGE_SIZE']))
+    page = max(1, request.args.get('page', default=1, type=int))
+    expression = match_expression(request.args.get('q'))
+    if expression is None:
+        return jsonify({"error": "Missing search terms"}), 400
+
+    rows = db.session.execute(search_statement(expression, limit, (page - 1) * limit)).all()
+    items = [
+        {
+            "id": row.id,
+            "type": 'post' if row.is_post else 'news',
+            "title": row.title,
+            "url": row.url if row.url else "N/A",
+            "datetime": row.datetime,
+            "score": round(-row.score, 4)
+        }
+        for row in rows[:limit]
+    ]
+    return jsonify(items=items, next_page=page + 1 if len(rows) > limit else None)
+
 @main.route("/callback", methods=["GET", "POST"])
 def callback():
     """
     Callback route for Auth0
     """
-    oauth.auth0.authorize_access_token() # Authorize without assigning to token
+    auth0.client.authorize_access_token() # Authorize without assigning to token
     userinfo_endpoint = f'https://{env.get("AUTH0_DOMAIN")}/userinfo'
-    resp = oauth.auth0.get(userinfo_endpoint)
+    resp = auth0.client.get(userinfo_endpoint)
     userinfo = resp.json()
     email = userinfo.get('email')
     name = userinfo.get('name')
     nickname = userinfo.get('nickname')
     picture = userinfo.get('picture')
 
-    user = User.query.filter_by(email=email).first()
-    if not user:
-        user = User(email=email, name=name, nickname=nickname, picture=picture, role='User')
-        db.session.add(user)
-        db.session.commit()
-    else:
-        user.name = name
-        user.nickname = nickname
-        user.picture = picture
-        db.session.commit()
+    user_id = upsert_login_user(email, name, nickname, picture)
+    db.session.commit()
+    identity.invalidate(user_id)
 
     session["user"] = {
         'name': name,
         'nickname': nickname,
         'email': email,
         'picture': picture,
-        'id': user.id
+        'id': user_id
     }
 
     return redirect(url_for('main.home'))
 
 
+def record_interactions(user_id, operations):
+    """
+    Apply interaction toggles, through the write-behind buffer when it is on.
+    """
+    if interaction_buffer.enabled:
+        return interaction_buffer.toggle_many(user_id, operations)
+    results = apply_interactions(user_id, operations)
+    db.session.commit()
+    cache.invalidate()
+    return results
+
 @main.route('/update_interaction', methods=['POST'])
 def update_interaction():
     """
     Update Interactions
+
+    The item is {"id": ..., "type": "post" or "news"}; the type defaults to 'post'.
     """
     data = request.get_json()
 
@@ -174,28 +401,47 @@ def update_interaction():
         return jsonify({'error': 'User not authenticated'}), 401
     user_id = user_session['id']
 
-    post_id = data['id']
+    item = (data.get('type', 'post'), data['id'])
     action = data['action']
+    if action not in INTERACTIONS:
+        return jsonify({'error': 'Invalid action'}), 400
+    if item[0] not in ITEM_TYPES:
+        return jsonify({'error': 'Invalid type'}), 400
 
-    # Find an existing interaction
-    interaction = UserInteraction.query.filter_by(user_id=user_id, post_id=post_id).first()
+    interaction, like_count, dislike_count = record_interactions(user_id, [(item, action)])[item]
 
-    if interaction:
-        if interaction.interaction != action:
-            interaction.interaction = action
-        else:
-            db.session.delete(interaction)
-    else:
-        # Add new interaction
-        interaction = UserInteraction(user_id=user_id, post_id=post_id, interaction=action)
-        db.session.add(interaction)
+    return jsonify(new_like_count=like_count, new_dislike_count=dislike_count, interaction=interaction)
 
-    db.session.commit()
+@main.route('/update_interactions', methods=['POST'])
+def update_interactions():
+    """
+    Apply a batch of interactions queued by a client in one transaction:
+    {"operations": [{"id": 1, "type": "post", "action": "like"}, ...]},
+    applied in order. The type defaults to 'post'.
+    """
+    user_session = session.get('user')
+    if not user_session or 'id' not in user_session:
+        return jsonify({'error': 'User not authenticated'}), 401
 
-    like_count = UserInteraction.query.filter_by(post_id=post_id, interaction='like').count()
-    dislike_count = UserInteraction.query.filter_by(post_id=post_id, interaction='dislike').count()
+    operations = (request.get_json(silent=True) or {}).get('operations')
+    if (not isinstance(operations, list) or not operations
+            or len(operations) > current_app.config['INTERACTION_MAX_BATCH']
+            or not all(isinstance(operation, dict) and operation.get('action') in INTERACTIONS
+                       and operation.get('type', 'post') in ITEM_TYPES
+                       and isinstance(operation.get('id'), int) and not isinstance(operation.get('id'), bool)
+                       for operation in operations)):
+        return jsonify({'error': 'Invalid operations'}), 400
+
+    results = record_interactions(
+        user_session['id'],
+        [((operation.get('type', 'post'), operation['id']), operation['action']) for operation in operations]
+    )
 
-    return jsonify(new_like_count=like_count, new_dislike_count=dislike_count)
+    return jsonify(items=[
+        {'id': item_id, 'type': item_type, 'interaction': interaction,
+         'like_count': likes, 'dislike_count': dislikes}
+        for (item_type, item_id), (interaction, likes, dislikes) in results.items()
+    ])
 
 @main.route('/update_user', methods=['POST'])
 def update_user():
@@ -218,81 +464,63 @@ def update_user():
         user.role = user_data['role']
     if 'name' in user_data:
         user.name = user_data['name']
+    db.session.flush()
+    user_id = user.id
     db.session.commit()
+    identity.invalidate(user_id)
 
     return jsonify({'status': 'success'}), 200
 
 
-@main.route("/update_nickname", methods=["POST"])
-def update_nickname():
+def update_current_user(values, message):
     """
-    Update Nickname
+    Change columns of the logged-in user, then redirect to the settings page.
     """
     if not session.get('user'):
         flash('You need to login first.', 'danger')
         return redirect(url_for('main.login'))
 
-    user_email = session.get('user')['email']
-    user = User.query.filter_by(email=user_email).first()
-
+    user = identity.current_user()
     if user:
-        new_nickname = request.form.get('nickname')
-        user.nickname = new_nickname
+        db.session.execute(update(User).where(User.id == user.id).values(**values))
         db.session.commit()
-        flash('Nickname updated successfully.', 'success')
+        identity.invalidate(user.id)
+        flash(message, 'success')
     else:
         flash('User not found.', 'danger')
 
     return redirect(url_for('main.settings'))
 
 
+@main.route("/update_nickname", methods=["POST"])
+def update_nickname():
+    """
+    Update Nickname
+    """
+    return update_current_user({'nickname': request.form.get('nickname')}, 'Nickname updated successfully.')
+
+
 @main.route("/update_name", methods=["POST"])
 def update_name():
     """
     Update Name
     """
-    if not session.get('user'):
-        flash('You need to login first.', 'danger')
-        return redirect(url_for('main.login'))
-
-    user_email = session.get('user')['email']
-    user = User.query.filter_by(email=user_email).first()
-
-    if user:
-        new_name = request.form.get('name')
-        user.name = new_name
-        db.session.commit()
-        flash('Name updated successfully.', 'success')
-    else:
-        flash('User not found.', 'danger')
-
-    return redirect(url_for('main.settings'))
+    return update_current_user({'name': request.form.get('name')}, 'Name updated successfully.')
 
 @main.route("/update_profile", methods=["POST"])
 def update_profile():
     """
     Update The Users Profile
     """
-    if not session.get('user'):
-        flash('You need to login first.', 'danger')
-        return redirect(url_for('main.login'))
-
-    user_email = session.get('user')['email']
-    user = User.query.filter_by(email=user_email).first()
-
-    if user:
-        user.name = request.form.get('name')
-        user.nickname = request.form.get('nickname')
-        db.session.commit()
-        flash('Profile updated successfully.', 'success')
-    else:
-        flash('User not found.', 'danger')
-
-    return redirect(url_for('main.settings'))
+    return update_current_user(
+        {'name': request.form.get('name'), 'nickname': request.form.get('nickname')},
+        'Profile updated successfully.'
+    )
 
 
 
 @main.route("/settings")
+@replica_reads
 def settings():
     """
     Settings Page
@@ -301,8 +529,7 @@ def settings():
         flash('You need to login first.', 'danger')
         return redirect(url_for('main.login'))
 
-    user_email = session.get('user')['email']
-    user = User.query.filter_by(email=user_email).first()
+    user = identity.current_user()
 
     if user is None:
         flash('User not found.', 'danger')
@@ -314,12 +541,10 @@ def settings():
             Post.user_email.label('by'),
             Post.title,
             Post.date_posted.label('time'),
-            func.count(case((UserInteraction.interaction == 'like', 1))).label('likes'), # pylint: disable=not-callable
-            func.count(case((UserInteraction.interaction == 'dislike', 1))).label('dislikes') # pylint: disable=not-callable
+            Post.like_count.label('likes'),
+            Post.dislike_count.label('dislikes')
         )
-        .outerjoin(UserInteraction, Post.id == UserInteraction.post_id)
-        .filter(Post.user_email == user_email)
-        .group_by(Post.id, Post.user_email, Post.title, Post.date_posted)
+        .filter(Post.user_email == user.email)
         .all()
     )
 
@@ -330,47 +555,20 @@ def settings():
         Post.title,
         UserInteraction.interaction
     ).join(Post, Post.id == UserInteraction.post_id)\
-      .filter(UserInteraction.user_id == user_id).all()
+      .filter(UserInteraction.user_id == user_id, UserInteraction.target_type == 'post').all()
 
     news_interactions = db.session.query(
         UserInteraction.post_id,
         NewsItem.title,
         UserInteraction.interaction
     ).join(NewsItem, NewsItem.id == UserInteraction.post_id)\
-      .filter(UserInteraction.user_id == user_id).all()
+      .filter(UserInteraction.user_id == user_id, UserInteraction.target_type == 'news').all()
 
     combined_interactions = post_interactions + news_interactions
 
-    all_posts = []
-    if user.role == 'Admin':
-        news_query = select(
-            NewsItem.id,
-            NewsItem.by,
-            NewsItem.title,
-            NewsItem.time.label('datetime'),
-            literal_column("'0'").label('likes'),
-            literal_column("'0'").label('dislikes'),
-            literal_column("'news'").label('type')
-        )
-
-        post_query = select(
-            Post.id,
-            Post.user_email.label('by'),
-            Post.title,
-            Post.date_posted.label('datetime'),
-            func.count(case((UserInteraction.interaction == 'like', 1))).label('likes'), # pylint: disable=not-callable
-            func.count(case((UserInteraction.interaction == 'dislike', 1))).label('dislikes'), # pylint: disable=not-callable
-            literal_column("'post'").label('type')
-        ).outerjoin(UserInteraction, Post.id == UserInteraction.post_id).group_by(Post.id)
-
-        combined_query = union_all(news_query, post_query).order_by(literal_column('datetime desc'))
-
-        all_posts = db.session.execute(combined_query).fetchall()
-
     return render_template(
         'settings.html',
         user=user,
-        all_posts=all_posts,
         my_posts=my_posts,
         user_interactions=combined_interactions
     )
@@ -379,31 +577,153 @@ def delete_post():
     """
     Delete Posts
     """
+    if current_admin() is None:
+        return jsonify({'status': 'error', 'message': 'Admin privileges required'}), 403
     try:
         data = request.get_json()
         post_id = data.get('id')
         post_type = data.get('type')
-        UserInteraction.query.filter_by(post_id=post_id).delete()
-        if post_type == 'post':
-            Post.query.filter_by(id=post_id).delete()
-        elif post_type == 'news':
-            NewsItem.query.filter_by(id=post_id).delete()
-        else:
+        if post_type not in ('post', 'news'):
             return jsonify({'status': 'error', 'message': 'Invalid post type'}), 400
+        if interaction_buffer.enabled:
+            interaction_buffer.flush()
+        moderate_items('delete', [(post_type, post_id)])
 
         db.session.commit()
+        cache.invalidate()
         return jsonify({'status': 'success', 'message': 'Post deleted successfully'})
-    except Exception as e: # pylint: disable=broad-except
-        print(e)
+    except Exception: # pylint: disable=broad-except
+        db.session.rollback()
+        logger.exception("Deleting a post failed")
         return jsonify({'status': 'error', 'message': 'An error occurred during deletion'})
 
+def current_admin():
+    """
+    Return the logged-in user if they are an admin, otherwise None.
+    """
+    user = identity.current_user()
+    return user if user is not None and user.is_admin else None
+
+@main.route("/admin/items")
+@replica_reads
+def admin_items():
+    """
+    Every news item and post for the admins, newest first, with a cursor
+    like the newsfeed. Filters: ?type=news|post, ?author=, and ?since= /
+    ?until= in epoch seconds. The totals stop counting at ADMIN_COUNT_LIMIT.
+    """
+    if current_admin() is None:
+        return jsonify({"error": "Admin privileges required"}), 403
+    try:
+        cursor, limit = page_args()
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    item_type = request.args.get('type') or None
+    if item_type not in (None, 'news', 'post'):
+        return jsonify({"error": "Invalid type"}), 400
+    author = request.args.get('author')
+    since = request.args.get('since', type=int)
+    until = request.args.get('until', type=int)
+
+    sources = (
+        (select(
+            NewsItem.id,
+            NewsItem.by.label('by'),
+            NewsItem.title,
+            NEWS_SORT_KEY.label('datetime'),
+            # Counted for the page by with_news_counts
+            literal_column("0").label('likes'),
+            literal_column("0").label('dislikes'),
+            NewsItem.hidden
+        ), 'news', NEWS_SORT_KEY, NewsItem.id, NewsItem.by),
+        (select(
+            Post.id,
+            Post.user_email.label('by'),
+            Post.title,
+            POST_SORT_KEY.label('datetime'),
+            Post.like_count.label('likes'),
+            Post.dislike_count.label('dislikes'),
+            Post.hidden
+        ), 'post', POST_SORT_KEY, Post.id, Post.user_email),
+    )
+    branches = []
+    for statement, source_type, sort_column, id_column, author_column in sources:
+        if item_type not in (None, source_type):
+            continue
+        if author:
+            statement = statement.where(author_column == author)
+        if since is not None:
+            statement = statement.where(sort_column >= since)
+        if until is not None:
+            statement = statement.where(sort_column < until)
+        branches.append((statement, source_type, sort_column, id_column))
+
+    rows, next_cursor = paginate_feed(branches, cursor, limit)
+    rows = with_news_counts(rows)
+    count_limit = current_app.config['ADMIN_COUNT_LIMIT']
+    counts = db.session.execute(select(*(
+        capped_count(statement.with_only_columns(id_column), count_limit).label(source_type)
+        for statement, source_type, _, id_column in branches
+    ))).one()._asdict()
+
+    items = [
+        {
+            "id": row.id,
+            "type": row.feed_type,
+            "by": row.by,
+            "title": row.title,
+            "datetime": row.datetime,
+            "likes": row.likes,
+            "dislikes": row.dislikes,
+            "hidden": bool(row.hidden)
+        }
+        for row in rows
+    ]
+    return jsonify(
+        items=items,
+        next_cursor=next_cursor,
+        totals=counts,
+        totals_capped=any(count >= count_limit for count in counts.values())
+    )
+
+@main.route("/admin/moderate", methods=["POST"])
+def moderate():
+    """
+    Delete or hide many items at once: {"action": "delete" | "hide",
+    "items": [{"id": 1, "type": "news" | "post"}, ...]}.
+    """
+    if current_admin() is None:
+        return jsonify({'status': 'error', 'message': 'Admin privileges required'}), 403
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    items = data.get('items')
+    if (action not in MODERATION_ACTIONS or not isinstance(items, list) or not items
+            or len(items) > current_app.config['ADMIN_MAX_BATCH']
+            or not all(isinstance(item, dict) and item.get('type') in ('news', 'post')
+                       and isinstance(item.get('id'), int) and not isinstance(item.get('id'), bool)
+                       for item in items)):
+        return jsonify({'status': 'error', 'message': 'Invalid moderation request'}), 400
+
+    try:
+        if interaction_buffer.enabled:
+            # Buffered interactions would bring deleted rows back
+            interaction_buffer.flush()
+        changed = moderate_items(action, [(item['type'], item['id']) for item in items])
+        db.session.commit()
+    except Exception: # pylint: disable=broad-except
+        db.session.rollback()
+        logger.exception("Moderation %s of %d items failed", action, len(items))
+        return jsonify({'status': 'error', 'message': 'An error occurred during moderation'}), 500
+    cache.invalidate()
+    return jsonify(status='success', action=action, changed=changed)
+
 # Login route
 @main.route("/login")
 def login():
     """
     Login using Auth0
     """
-    return oauth.auth0.authorize_redirect(
+    return auth0.client.authorize_redirect(
         redirect_uri=url_for("main.callback", _external=True)
     )
 
@@ -422,7 +742,10 @@ def create_post():
         user_email = session.get('user')['email']
         post = Post(title=title, content=content, user_email=user_email)
         db.session.add(post)
+        db.session.flush()
+        index_documents('post', [(post.id, title, content)])
         db.session.commit()
+        cache.invalidate()
         flash('Your post has been created!', 'success')
         return redirect(url_for('main.home'))
     return render_template('create_post.html')
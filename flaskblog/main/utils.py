@@ -0,0 +1,302 @@
+"""
+Helper functions for the main blueprint.
+
+The feed shown on the home page and served by /newsfeed is a merge of
+NewsItem and Post rows. It is paginated with an opaque keyset cursor over
+(datetime, type, id) so that every page costs the same as the first one.
+The hot feed (?sort=hot) is read from the feed_ranking table instead, with
+a cursor over (hot score, type, id).
+"""
+
+import base64
+import binascii
+import functools
+import json
+from collections import namedtuple
+
+from flask import current_app, request
+
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+from sqlalchemy import func, or_, select, union_all, literal_column, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import String
+
+from flaskblog import db
+from flaskblog.models import FeedRanking, NewsItem, Post
+
+FEED_SORTS = ('new', 'hot')
+
+
+class display_time(FunctionElement): # pylint: disable=invalid-name,too-many-ancestors
+    """
+    Epoch seconds formatted as 'YYYY-MM-DD HH:MM' in local time by the
+    database, so that the feed rows carry the time the cards display.
+    """
+    type = String()
+    name = 'display_time'
+    inherit_cache = True
+
+
+@compiles(display_time)
+def _display_time_sqlite(element, compiler, **kw):
+    value = compiler.process(element.clauses, **kw)
+    return f"strftime('%Y-%m-%d %H:%M', {value}, 'unixepoch', 'localtime')"
+
+
+@compiles(display_time, 'postgresql')
+def _display_time_postgresql(element, compiler, **kw):
+    value = compiler.process(element.clauses, **kw)
+    return f"to_char(to_timestamp({value}), 'YYYY-MM-DD HH24:MI')"
+
+
+def encode_cursor(datetime_value, item_type, item_id):
+    """
+    Encode the sort key of the last row of a page into an opaque cursor.
+    """
+    payload = json.dumps([datetime_value, item_type, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Returns None for an empty token and raises ValueError if the token is malformed.
+    """
+    if not token:
+        return None
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        value = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, ValueError, UnicodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+    if (not isinstance(value, list) or len(value) != 3
+            or not isinstance(value[0], (int, float)) or isinstance(value[0], bool)
+            or not isinstance(value[1], str)
+            or not isinstance(value[2], int)):
+        raise ValueError('Invalid cursor')
+    return tuple(value)
+
+
+def page_args():
+    """
+    Read the cursor and page size from the query string of the current request.
+
+    Raises ValueError if the cursor is malformed.
+    """
+    default_limit = current_app.config['FEED_PAGE_SIZE']
+    max_limit = current_app.config['FEED_MAX_PAGE_SIZE']
+    limit = request.args.get('limit', default=default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    cursor = decode_cursor(request.args.get('cursor'))
+    return cursor, limit
+
+
+def feed_sort():
+    """
+    Read the feed order from the query string: 'new' (default) or 'hot'.
+
+    Raises ValueError for any other value.
+    """
+    sort = request.args.get('sort', 'new')
+    if sort not in FEED_SORTS:
+        raise ValueError('Invalid sort')
+    return sort
+
+
+def keyset_condition(sort_column, id_column, item_type, cursor):
+    """
+    Restrict one branch of the feed to the rows that come after the cursor
+    in (datetime desc, type desc, id desc) order. The type is constant
+    within a branch, so it folds into the comparison on the sort column.
+    """
+    cursor_datetime, cursor_type, cursor_id = cursor
+    if item_type < cursor_type:
+        return sort_column <= cursor_datetime
+    if item_type > cursor_type:
+        return sort_column < cursor_datetime
+    return tuple_(sort_column, id_column) < tuple_(cursor_datetime, cursor_id)
+
+
+def feed_statement(branches, cursor, limit):
+    """
+    Build the query of one page of the combined feed. It selects one row
+    more than the page size, which tells whether there is a next page.
+
+    Args:
+        branches: Iterable of (statement, item_type, sort_column, id_column).
+            Each statement must label its columns 'id' and 'datetime'; the
+            item_type is added to it as the 'feed_type' column.
+        cursor: Decoded cursor of the previous page, or None for the first page.
+        limit: Number of rows on the page.
+    """
+    bounded = []
+    for statement, item_type, sort_column, id_column in branches:
+        if cursor is not None:
+            statement = statement.where(keyset_condition(sort_column, id_column, item_type, cursor))
+        statement = (
+            statement.add_columns(literal_column(f"'{item_type}'").label('feed_type'))
+            .order_by(sort_column.desc(), id_column.desc())
+            .limit(limit + 1)
+        )
+        bounded.append(select(statement.subquery()))
+
+    return (
+        union_all(*bounded)
+        .order_by(
+            literal_column('datetime desc'),
+            literal_column('feed_type desc'),
+            literal_column('id desc')
+        )
+        .limit(limit + 1)
+    )
+
+
+def hot_feed_statement(columns, cursor, limit):
+    """
+    Build the query of one page of the hot feed: a read of feed_ranking in
+    the order of its hot index, joined to the news item or post of each row.
+    It selects one row more than the page size.
+
+    Args:
+        columns: Labeled columns of the page rows, over FeedRanking, NewsItem
+            and Post. The score is added as 'rank' and the item type as 'feed_type'.
+        cursor: Decoded cursor of the previous page, or None for the first page.
+        limit: Number of rows on the page.
+    """
+    statement = (
+        select(*columns, FeedRanking.hot.label('rank'), FeedRanking.item_type.label('feed_type'))
+        .select_from(FeedRanking)
+        .outerjoin(NewsItem, (FeedRanking.item_type == 'news') & (NewsItem.id == FeedRanking.item_id))
+        .outerjoin(Post, (FeedRanking.item_type == 'post') & (Post.id == FeedRanking.item_id))
+        .where(or_(NewsItem.id.isnot(None), Post.id.isnot(None)))
+        .order_by(FeedRanking.hot.desc(), FeedRanking.item_type.desc(), FeedRanking.item_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(FeedRanking.hot, FeedRanking.item_type, FeedRanking.item_id) < tuple_(*cursor)
+        )
+    return statement
+
+
+def capped_count(statement, cap):
+    """
+    Scalar subquery counting the rows of statement, but at most cap of
+    them, so that counting a large table stays cheap.
+    """
+    return (
+        select(func.count()) # pylint: disable=not-callable
+        .select_from(statement.limit(cap).subquery())
+        .scalar_subquery()
+    )
+
+
+def paginate_feed(branches, cursor, limit):
+    """
+    Fetch one page of the combined feed. The arguments are the same as for
+    feed_statement.
+
+    Returns:
+        A tuple of the page rows and the cursor of the next page (None on the last page).
+    """
+    return paginate(feed_statement(branches, cursor, limit), limit)
+
+
+def paginate(statement, limit, sort_label='datetime'):
+    """
+    Fetch one page from a statement selecting limit + 1 rows, which have
+    the sort key labeled sort_label, 'feed_type' and 'id'.
+
+    Returns:
+        A tuple of the page rows and the cursor of the next page (None on the last page).
+    """
+    rows = db.session.execute(statement).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_label), last.feed_type, last.id)
+    return rows, next_cursor
+
+
+@functools.lru_cache(maxsize=None)
+def _row_type(fields):
+    return namedtuple('FeedRow', fields)
+
+
+def replace_columns(row, **values):
+    """
+    Return a copy of a result row with the given columns replaced. The copy
+    keeps the column names and order, so it reads and compares like the row.
+    """
+    return _row_type(row._fields)(*(values.get(name, value) for name, value in zip(row._fields, row)))
+
+
+def wants_compact_json():
+    """
+    Decide whether to send whitespace-free JSON: either asked for with
+    ?compact=1, or the client prefers application/json over text/html,
+    which browsers do not.
+    """
+    compact = request.args.get('compact')
+    if compact is not None:
+        return compact.lower() in ('1', 'true', 'yes')
+    best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+    return best == 'application/json'
+
+
+def json_encoder(compact):
+    """
+    Return a function encoding a value to JSON bytes. Compact output uses
+    orjson when it is installed and FEED_JSON_ENCODER allows it.
+    """
+    if not compact:
+        return lambda value: json.dumps(value, indent=4).encode('utf-8')
+    if orjson is not None and current_app.config['FEED_JSON_ENCODER'] in ('auto', 'orjson'):
+        return orjson.dumps # pylint: disable=no-member
+    return lambda value: json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def stream_feed_json(result, limit, serialize, compact, sort_label='datetime'):
+    """
+    Encode a page of the feed as {"items": [...], "next_cursor": ...} one
+    row at a time, straight from the database cursor.
+
+    Args:
+        result: Result of executing feed_statement or hot_feed_statement,
+            iterated lazily.
+        limit: Number of rows on the page.
+        serialize: Function turning a row into a JSON-serializable dict.
+        compact: Whether to leave out the indentation.
+        sort_label: Label of the sort key the cursor is made of.
+    """
+    encode = json_encoder(compact)
+    if compact:
+        opening, separator, closing = b'{"items":[', b',', b'],"next_cursor":'
+    else:
+        opening, separator, closing = b'{\n    "items": [\n', b',\n', b'\n    ],\n    "next_cursor": '
+
+    next_cursor = None
+    last = None
+    for count, row in enumerate(result):
+        if count == limit:
+            next_cursor = encode_cursor(getattr(last, sort_label), last.feed_type, last.id)
+            break
+        item = encode(serialize(row))
+        if not compact:
+            item = b'\n'.join(b'        ' + line for line in item.split(b'\n'))
+        yield (opening if last is None else separator) + item
+        last = row
+
+    if last is None:
+        yield b'{"items":[],"next_cursor":' if compact else b'{\n    "items": [],\n    "next_cursor": '
+    else:
+        yield closing
+    yield encode(next_cursor) + (b'}' if compact else b'\n}')
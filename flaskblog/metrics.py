@@ -0,0 +1,227 @@
+"""
+Request level performance instrumentation.
+
+For every request the wall time, the number and duration of the SQL
+statements (collected with SQLAlchemy engine events) and the template render
+time are measured. They are sent back in a Server-Timing header and
+aggregated per endpoint into latency histograms and counters, which /metrics
+exposes in the Prometheus text format. Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged.
+
+The aggregates are kept per process: with several gunicorn workers, every
+scrape of /metrics reports the worker that served it.
+"""
+
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTiming:
+    """
+    Measurements of the current request, stored on flask.g.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_start = None
+
+    def server_timing(self, total):
+        """
+        Format the measurements as a Server-Timing header value.
+        """
+        return ', '.join((
+            f'app;dur={total * 1000:.1f}',
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ))
+
+
+class EndpointStats:
+    """
+    Aggregated measurements of one endpoint.
+    """
+
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+
+class MetricsRegistry:
+    """
+    Aggregated measurements of one app, by endpoint.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.endpoints = {}
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def slow_query(self):
+        """
+        Count a statement slower than the threshold.
+        """
+        with self._lock:
+            self.slow_queries += 1
+
+    def observe(self, endpoint, total, timing):
+        """
+        Add the measurements of one request to the aggregates of its endpoint.
+        """
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if total <= bound:
+                    stats.bucket_counts[index] += 1
+            stats.count += 1
+            stats.total += total
+            stats.sql_count += timing.sql_count
+            stats.sql_time += timing.sql_time
+            stats.template_time += timing.template_time
+
+    def render(self):
+        """
+        Render the aggregates in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP flaskblog_request_duration_seconds Request latency by endpoint.',
+            '# TYPE flaskblog_request_duration_seconds histogram',
+        ]
+        counters = {
+            'flaskblog_sql_queries_total': ('SQL statements executed by endpoint.', []),
+            'flaskblog_sql_duration_seconds_total': ('Time spent in SQL by endpoint.', []),
+            'flaskblog_template_duration_seconds_total': ('Time spent rendering templates by endpoint.', []),
+        }
+        with self._lock:
+            for endpoint, stats in sorted(self.endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                for bound, count in zip(self.buckets, stats.bucket_counts):
+                    lines.append(f'flaskblog_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'flaskblog_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f'flaskblog_request_duration_seconds_sum{{{label}}} {stats.total:.6f}')
+                lines.append(f'flaskblog_request_duration_seconds_count{{{label}}} {stats.count}')
+                counters['flaskblog_sql_queries_total'][1].append(f'{{{label}}} {stats.sql_count}')
+                counters['flaskblog_sql_duration_seconds_total'][1].append(f'{{{label}}} {stats.sql_time:.6f}')
+                counters['flaskblog_template_duration_seconds_total'][1].append(
+                    f'{{{label}}} {stats.template_time:.6f}'
+                )
+            slow_queries = self.slow_queries
+
+        for name, (description, samples) in counters.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(name + sample for sample in samples)
+        lines.append('# HELP flaskblog_slow_queries_total SQL statements slower than the threshold.')
+        lines.append('# TYPE flaskblog_slow_queries_total counter')
+        lines.append(f'flaskblog_slow_queries_total {slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """
+    Flask extension collecting per request timings and serving /metrics.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Hook the instrumentation into app and the engines of its database.
+        """
+        if not app.config['METRICS_ENABLED']:
+            return
+        # pylint: disable=import-outside-toplevel
+        from flaskblog import db
+        # pylint: enable=import-outside-toplevel
+        registry = app.extensions['metrics'] = MetricsRegistry(app.config['METRICS_BUCKETS'])
+        threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self._instrument_engine(engine, registry, threshold)
+
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.before_request(self._request_started)
+        app.after_request(self._request_finished)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    @staticmethod
+    def _instrument_engine(engine, registry, threshold):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _many):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, _cursor, statement, _parameters, _context, _many):
+            elapsed = time.perf_counter() - conn.info['query_start'].pop()
+            if elapsed >= threshold:
+                registry.slow_query()
+                logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+            timing = current_timing()
+            if timing is not None:
+                timing.sql_count += 1
+                timing.sql_time += elapsed
+
+    @staticmethod
+    def _template_started(_app, **_extra):
+        timing = current_timing()
+        if timing is not None:
+            timing.template_start = time.perf_counter()
+
+    @staticmethod
+    def _template_finished(_app, **_extra):
+        timing = current_timing()
+        if timing is not None and timing.template_start is not None:
+            timing.template_time += time.perf_counter() - timing.template_start
+            timing.template_start = None
+
+    @staticmethod
+    def _request_started():
+        g.request_timing = RequestTiming()
+
+    @staticmethod
+    def _request_finished(response):
+        timing = g.pop('request_timing', None)
+        if timing is None:
+            return response
+        total = time.perf_counter() - timing.start
+        response.headers['Server-Timing'] = timing.server_timing(total)
+        current_app.extensions['metrics'].observe(request.endpoint or 'unknown', total, timing)
+        return response
+
+    @staticmethod
+    def metrics_view():
+        """
+        Serve the aggregates to Prometheus.
+        """
+        return current_app.extensions['metrics'].render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def current_timing():
+    """
+    Return the RequestTiming of the current request, or None outside of one.
+    """
+    if not has_app_context():
+        return None
+    return g.get('request_timing')
@@ -5,21 +5,51 @@ This module contains definitions for various database models
 used throughout the Flask application, including user and post models.
 """
 
+import asyncio
+import calendar
 import logging
+import time
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 
-import requests
-#from flask import current_app as app
-from flaskblog import db
+from flask import current_app
+from sqlalchemy import case, delete, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declared_attr, deferred
+from flaskblog import db, cache
+from flaskblog.articles import ArticleFetcher, compress_text, decompress_text
+from flaskblog.hn_client import HNClient, HNClientError
+from flaskblog.search import index_documents, remove_documents
 
 logger = logging.getLogger(__name__)
 
+def default_sort_key(context):
+    """
+    Compute the feed sort key of a new row: the epoch seconds of
+    date_posted for posts and of time for news items.
+    """
+    params = context.get_current_parameters()
+    posted = params.get('date_posted')
+    if posted is not None:
+        return calendar.timegm(posted.utctimetuple())
+    return params.get('time') or 0
+
+
 class BaseNewsItem(db.Model):
     """
     Abstract Base Model
+
+    sort_key holds the epoch seconds the merged feed is ordered by, so that
+    both tables can serve it from the same descending index. Hidden items
+    are kept but left out of the feeds, the rankings and the search index.
     """
     __abstract__ = True
+
+    @declared_attr
+    def __table_args__(cls): # pylint: disable=no-self-argument
+        return (
+            db.Index(f'ix_{cls.__tablename__}_sort_key', db.desc('sort_key'), db.desc('id')),
+        )
+
     id = db.Column(db.Integer, primary_key=True)
     by = db.Column(db.String(120), nullable=True)
     descendants = db.Column(db.Integer, nullable=True)
@@ -31,6 +61,8 @@ class BaseNewsItem(db.Model):
     type = db.Column(db.String(50), nullable=True)
     url = db.Column(db.String(500), nullable=True)
     content = db.Column(db.Text, nullable=True)
+    sort_key = db.Column(db.Integer, nullable=False, default=default_sort_key, server_default='0')
+    hidden = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
 
     def dummy_method_one(self):
         """
@@ -64,18 +96,69 @@ class User(db.Model):
         """
 
 
+class SmallIntEnum(db.TypeDecorator):
+    """
+    A string from a fixed set, stored as the small integer CODES maps it to.
+    """
+    impl = db.SmallInteger
+    cache_ok = True
+    CODES = {}
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else self.CODES[value]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.VALUES[value]
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    @property
+    def python_type(self):
+        return str
+
+
+class ItemType(SmallIntEnum):
+    """
+    Kind of item an interaction is about: 'news' or 'post'.
+    """
+    cache_ok = True
+    CODES = {'news': 0, 'post': 1}
+    VALUES = {code: name for name, code in CODES.items()}
+
+
+class Reaction(SmallIntEnum):
+    """
+    An interaction: 'like' or 'dislike'.
+    """
+    cache_ok = True
+    CODES = {'like': 1, 'dislike': -1}
+    VALUES = {code: name for name, code in CODES.items()}
+
+
 class UserInteraction(db.Model):
     """
-    User Interaction Mode
+    User Interaction Model
+
+    News items and posts have separate id spaces, so an interaction is
+    keyed by the user, the target_type ('news' or 'post') and the id of the
+    item. Both the target type and the interaction are stored as small
+    integers. On SQLite the table is WITHOUT ROWID: rows are stored in the
+    order of the primary key, so the history of a user is one range read,
+    and ix_user_interaction_target covers the per-item counts.
     """
 
     __tablename__ = 'user_interaction'
+    __table_args__ = (
+        db.Index('ix_user_interaction_target', 'target_type', 'post_id', 'interaction'),
+        {'sqlite_with_rowid': False},
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
-    interaction = db.Column(db.String(10), nullable=False)
+    target_type = db.Column(ItemType, primary_key=True)
+    post_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    interaction = db.Column(Reaction, nullable=False)
 
     user = db.relationship('User', backref=db.backref('interactions', lazy='dynamic'))
-    post = db.relationship('Post', backref=db.backref('interactions', lazy='dynamic'))
 
     def dummy_method_four(self):
         """
@@ -91,7 +174,24 @@ class UserInteraction(db.Model):
 class NewsItem(BaseNewsItem):
     """
     NewsItem Model
+
+    content holds the zlib-compressed text of the linked article. It is
+    deferred, so it is only loaded when accessed or asked for explicitly.
+    comments_synced is the descendants count of the story when its comment
+    tree was last stored.
     """
+    refreshed_at = db.Column(db.Integer, nullable=True)
+    content = deferred(db.Column(db.LargeBinary, nullable=True))
+    content_fetched_at = db.Column(db.Integer, nullable=True)
+    comments_synced = db.Column(db.Integer, nullable=True)
+
+    @property
+    def article_text(self):
+        """
+        The text of the linked article, or None if it was not fetched.
+        """
+        return decompress_text(self.content)
+
     def dummy_method_eight(self):
         """
         A dummy method
@@ -108,6 +208,8 @@ class Post(BaseNewsItem):
     """
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user_email = db.Column(db.String(120), nullable=False)
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    dislike_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def dummy_method_six(self):
         """
@@ -120,6 +222,447 @@ class Post(BaseNewsItem):
         """
 
 
+class Comment(db.Model):
+    """
+    Hacker News comment, stored in the tree of its story.
+
+    path is the materialized path of the comment: the zero-padded ids from
+    the top-level comment down to this one, joined by dots. Ordering the
+    comments of a story by path yields the thread depth first, so a thread
+    is read with one range scan of ix_comment_story_path.
+    """
+    __table_args__ = (
+        db.Index('ix_comment_story_path', 'story_id', 'path'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    story_id = db.Column(db.Integer, nullable=False)
+    parent_id = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.Text, nullable=False)
+    depth = db.Column(db.Integer, nullable=False)
+    by = db.Column(db.String(120), nullable=True)
+    text = db.Column(db.Text, nullable=True)
+    time = db.Column(db.Integer, nullable=True)
+    kids = db.Column(db.Text, nullable=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+
+class FeedRanking(db.Model):
+    """
+    Precomputed "hot" score of a news item or post, refreshed in batches by
+    refresh_rankings. points and posted are the inputs the score was
+    computed from.
+    """
+    __tablename__ = 'feed_ranking'
+    __table_args__ = (
+        db.Index('ix_feed_ranking_hot', db.desc('hot'), db.desc('item_type'), db.desc('item_id')),
+    )
+
+    item_type = db.Column(db.String(4), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    points = db.Column(db.Float, nullable=False)
+    posted = db.Column(db.Integer, nullable=False)
+    hot = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.Integer, nullable=False)
+
+
+INTERACTIONS = ('like', 'dislike')
+ITEM_TYPES = tuple(ItemType.CODES)
+
+# Columns of news_item filled from the Hacker News API
+NEWS_SYNC_COLUMNS = [
+    NewsItem.by, NewsItem.descendants, NewsItem.kids, NewsItem.score, NewsItem.text,
+    NewsItem.time, NewsItem.title, NewsItem.type, NewsItem.url
+]
+
+
+def interaction_delta(old, new):
+    """
+    Return the (likes, dislikes) change caused by replacing the interaction
+    old with new. Either of them may be None for no interaction.
+    """
+    likes = (new == 'like') - (old == 'like')
+    dislikes = (new == 'dislike') - (old == 'dislike')
+    return likes, dislikes
+
+
+def adjust_post_counters(deltas):
+    """
+    Apply changes to the like/dislike counters of posts in the current
+    transaction, with one UPDATE ... RETURNING for all of them.
+
+    Args:
+        deltas: Dict of post id to (like delta, dislike delta).
+
+    Returns:
+        Dict of post id to the new (likes, dislikes), without the ids that
+        have no post.
+    """
+    if not deltas:
+        return {}
+    result = db.session.execute(
+        update(Post)
+        .where(Post.id.in_(deltas))
+        .values(
+            like_count=Post.like_count + case(
+                {post_id: delta[0] for post_id, delta in deltas.items()}, value=Post.id, else_=0),
+            dislike_count=Post.dislike_count + case(
+                {post_id: delta[1] for post_id, delta in deltas.items()}, value=Post.id, else_=0)
+        )
+        .returning(Post.id, Post.like_count, Post.dislike_count)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id: (row.like_count, row.dislike_count) for row in result}
+
+
+def interaction_counts(news_ids):
+    """
+    Count the likes and dislikes of news items, which have no counters,
+    with one grouped query.
+
+    Returns a dict of id to (likes, dislikes).
+    """
+    if not news_ids:
+        return {}
+    rows = db.session.execute(
+        select(
+            UserInteraction.post_id,
+            func.sum(case((UserInteraction.interaction == 'like', 1), else_=0)),
+            func.sum(case((UserInteraction.interaction == 'dislike', 1), else_=0))
+        )
+        .where(UserInteraction.target_type == 'news', UserInteraction.post_id.in_(news_ids))
+        .group_by(UserInteraction.post_id)
+    )
+    counts = {news_id: (0, 0) for news_id in news_ids}
+    counts.update((news_id, (likes, dislikes)) for news_id, likes, dislikes in rows)
+    return counts
+
+
+def write_interactions(previous, final):
+    """
+    Insert the final interactions of (user id, item type, item id) keys
+    whose rows were just deleted, and move the post counters from the
+    previous states to the final ones, in the current transaction.
+
+    Args:
+        previous: Dict of key to the deleted interaction or None.
+        final: Dict of key to the new interaction or None.
+
+    Returns:
+        Dict of post id to the new (likes, dislikes) of the changed posts.
+    """
+    rows = [{'user_id': user_id, 'target_type': item_type, 'post_id': item_id, 'interaction': interaction}
+            for (user_id, item_type, item_id), interaction in final.items() if interaction is not None]
+    if rows:
+        statement = dialect_insert(UserInteraction.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[UserInteraction.user_id, UserInteraction.target_type, UserInteraction.post_id],
+            set_={'interaction': statement.excluded.interaction}
+        )
+        db.session.execute(statement, rows)
+
+    deltas = {}
+    for key, interaction in final.items():
+        _, item_type, item_id = key
+        old = previous.get(key)
+        if item_type == 'post' and old != interaction:
+            likes, dislikes = deltas.get(item_id, (0, 0))
+            like_delta, dislike_delta = interaction_delta(old, interaction)
+            deltas[item_id] = (likes + like_delta, dislikes + dislike_delta)
+    return adjust_post_counters(deltas)
+
+
+def item_condition(items):
+    """
+    Restrict user_interaction to the rows of (item type, item id) pairs.
+    """
+    return tuple_(UserInteraction.target_type, UserInteraction.post_id).in_(list(items))
+
+
+def interaction_states(user_id, items):
+    """
+    Return a dict of (item type, item id) to the stored interaction of a
+    user, for the items the user interacted with.
+    """
+    if not items:
+        return {}
+    return {
+        (item_type, item_id): interaction for item_type, item_id, interaction in db.session.execute(
+            select(UserInteraction.target_type, UserInteraction.post_id, UserInteraction.interaction)
+            .where(UserInteraction.user_id == user_id, item_condition(items))
+        )
+    }
+
+
+def item_counts(items):
+    """
+    Return a dict of (item type, item id) to the stored (likes, dislikes):
+    the counters of posts, counted interactions for news items.
+    """
+    post_ids = [item_id for item_type, item_id in items if item_type == 'post']
+    counts = {('post', post_id): (0, 0) for post_id in post_ids}
+    if post_ids:
+        counts.update(
+            (('post', post_id), (likes, dislikes)) for post_id, likes, dislikes in db.session.execute(
+                select(Post.id, Post.like_count, Post.dislike_count).where(Post.id.in_(post_ids))
+            )
+        )
+    news_counts = interaction_counts([item_id for item_type, item_id in items if item_type == 'news'])
+    counts.update((('news', news_id), news_count) for news_id, news_count in news_counts.items())
+    return counts
+
+
+def apply_interactions(user_id, operations):
+    """
+    Apply like/dislike toggles of one user in the current transaction.
+
+    An action toggles: it sets the interaction, or removes it when the item
+    already has that interaction. The toggles of each item are folded into
+    its final state, so a batch costs the same few statements as one click:
+    a DELETE ... RETURNING that reads and clears the previous state (the
+    transaction starts with a write, so it never has to upgrade a read lock),
+    one upsert of the final states and one update of the post counters.
+
+    Args:
+        user_id: Id of the user.
+        operations: Iterable of ((item type, item id), action), applied in order.
+
+    Returns:
+        Dict of (item type, item id) to (interaction or None, likes, dislikes).
+    """
+    operations = list(operations)
+    items = list(dict.fromkeys(item for item, _ in operations))
+    if not items:
+        return {}
+
+    previous = {
+        (user_id, item_type, item_id): interaction
+        for item_type, item_id, interaction in db.session.execute(
+            delete(UserInteraction)
+            .where(UserInteraction.user_id == user_id, item_condition(items))
+            .returning(UserInteraction.target_type, UserInteraction.post_id, UserInteraction.interaction)
+            .execution_options(synchronize_session=False)
+        )
+    }
+    final = fold_interactions(
+        {(user_id, *item): previous.get((user_id, *item)) for item in items},
+        (((user_id, *item), action) for item, action in operations)
+    )
+
+    counts = {('post', post_id): count for post_id, count in write_interactions(previous, final).items()}
+    counts.update(item_counts([item for item in items if item not in counts]))
+    return {item: (final[(user_id, *item)], *counts[item]) for item in items}
+
+
+def fold_interactions(states, operations):
+    """
+    Apply toggles to interaction states.
+
+    Args:
+        states: Dict of key to the current interaction or None; updated in place.
+        operations: Iterable of (key, action), applied in order.
+
+    Returns:
+        states.
+    """
+    for key, action in operations:
+        states[key] = None if states[key] == action else action
+    return states
+
+
+def store_interactions(states):
+    """
+    Set the interactions of (user id, item type, item id) keys to given
+    final states, in the current transaction. Unlike apply_interactions
+    this is idempotent: storing the same states twice leaves the rows and
+    counters as they were after the first time.
+
+    Args:
+        states: Dict of key to the interaction or None.
+
+    Returns:
+        Dict of key to the interaction it replaced.
+    """
+    if not states:
+        return {}
+    previous = {
+        (user_id, item_type, item_id): interaction
+        for user_id, item_type, item_id, interaction in db.session.execute(
+            delete(UserInteraction)
+            .where(tuple_(UserInteraction.user_id, UserInteraction.target_type,
+                          UserInteraction.post_id).in_(list(states)))
+            .returning(UserInteraction.user_id, UserInteraction.target_type,
+                       UserInteraction.post_id, UserInteraction.interaction)
+            .execution_options(synchronize_session=False)
+        )
+    }
+    write_interactions(previous, states)
+    return previous
+
+
+def reconcile_post_counters():
+    """
+    Rebuild the like/dislike counters of every post from user_interaction.
+
+    Returns the number of posts updated.
+    """
+    def count_of(interaction):
+        return (
+            select(func.count()) # pylint: disable=not-callable
+            .where(UserInteraction.target_type == 'post')
+            .where(UserInteraction.post_id == Post.id)
+            .where(UserInteraction.interaction == interaction)
+            .scalar_subquery()
+        )
+
+    result = db.session.execute(
+        update(Post).values(like_count=count_of('like'), dislike_count=count_of('dislike'))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+MODERATION_ACTIONS = ('delete', 'hide')
+
+
+def moderate_items(action, items):
+    """
+    Delete or hide many news items and posts in the current transaction,
+    with one statement per table rather than one per item.
+
+    Deleting also removes the interactions with the items and the comments
+    of the news items. Either way the items leave the search index and the
+    hidden ones leave the hot ranking.
+
+    Args:
+        action: 'delete' or 'hide'.
+        items: Iterable of (type, id) with type 'news' or 'post'.
+
+    Returns:
+        Dict of type to the number of rows changed.
+    """
+    ids = {'news': set(), 'post': set()}
+    for item_type, item_id in items:
+        ids[item_type].add(item_id)
+    models = {'news': NewsItem, 'post': Post}
+    targets = [(item_type, item_id) for item_type in ids for item_id in ids[item_type]]
+
+    if action == 'delete':
+        if targets:
+            db.session.execute(delete(UserInteraction).where(item_condition(targets)))
+        if ids['news']:
+            db.session.execute(delete(Comment).where(Comment.story_id.in_(ids['news'])))
+    elif targets:
+        db.session.execute(
+            delete(FeedRanking)
+            .where(tuple_(FeedRanking.item_type, FeedRanking.item_id).in_(targets))
+        )
+
+    changed = {}
+    for item_type, model in models.items():
+        changed[item_type] = 0
+        if not ids[item_type]:
+            continue
+        statement = delete(model) if action == 'delete' else update(model).values(hidden=True)
+        changed[item_type] = db.session.execute(
+            statement.where(model.id.in_(ids[item_type]))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        remove_documents(item_type, ids[item_type])
+    return changed
+
+
+def upsert_login_user(email, name, nickname, picture):
+    """
+    Create the user of a login, or refresh the profile of an existing one,
+    with one INSERT ... ON CONFLICT in the current transaction.
+
+    Returns the id of the user.
+    """
+    statement = dialect_insert(User.__table__).values(
+        email=email, name=name, nickname=nickname, picture=picture, role='User'
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[User.email],
+        set_={'name': statement.excluded.name, 'nickname': statement.excluded.nickname,
+              'picture': statement.excluded.picture}
+    )
+    return db.session.execute(statement.returning(User.id)).scalar_one()
+
+
+def hot_score(points, posted, now, gravity):
+    """
+    SQL expression of the HN gravity formula: (points - 1) / (age + 2) ^ gravity,
+    with the age in hours.
+    """
+    age_hours = case((posted > now, 0.0), else_=(now - posted) / 3600.0)
+    return (points - 1) / func.power(age_hours + 2, gravity)
+
+
+def refresh_rankings(now=None):
+    """
+    Recompute the hot scores of the items whose points or age changed.
+
+    Scores are computed by the database in one INSERT ... SELECT per item
+    table. An item is refreshed when it has no score yet, when its points
+    differ from the ones its score was computed from, or when its score is
+    older than RANKING_REFRESH_INTERVAL and the item is younger than
+    RANKING_WINDOW; older items keep their last, already tiny, score.
+
+    Returns the number of scores written.
+    """
+    config = current_app.config
+    now = int(time.time()) if now is None else now
+    stale_before = now - config['RANKING_REFRESH_INTERVAL']
+    window_start = now - config['RANKING_WINDOW']
+    ranking = FeedRanking.__table__
+
+    sources = (
+        ('news', NewsItem,
+         func.coalesce(NewsItem.score, 0)
+         + config['RANKING_COMMENT_WEIGHT'] * func.coalesce(NewsItem.descendants, 0)),
+        ('post', Post, 1 + Post.like_count - Post.dislike_count),
+    )
+    written = 0
+    for item_type, model, points in sources:
+        points = db.cast(points, db.Float)
+        stored = FeedRanking.__table__.alias('stored')
+        candidates = (
+            select(
+                db.literal(item_type), model.id, points, model.sort_key,
+                hot_score(points, model.sort_key, now, config['RANKING_GRAVITY']),
+                db.literal(now)
+            )
+            .outerjoin(stored, (stored.c.item_type == item_type) & (stored.c.item_id == model.id))
+            .where(~model.hidden)
+            .where(
+                stored.c.item_id.is_(None)
+                | (stored.c.points != points)
+                | (stored.c.posted != model.sort_key)
+                | ((stored.c.computed_at < stale_before) & (model.sort_key > window_start))
+            )
+        )
+        statement = dialect_insert(ranking).from_select(
+            ['item_type', 'item_id', 'points', 'posted', 'hot', 'computed_at'], candidates
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[ranking.c.item_type, ranking.c.item_id],
+            set_={column: getattr(statement.excluded, column)
+                  for column in ('points', 'posted', 'hot', 'computed_at')}
+        )
+        written += db.session.execute(statement).rowcount
+
+    # Scores of deleted and hidden items
+    for item_type, model, _ in sources:
+        db.session.execute(
+            delete(FeedRanking)
+            .where(FeedRanking.item_type == item_type)
+            .where(~select(model.id).where(model.id == FeedRanking.item_id, ~model.hidden).exists())
+        )
+    db.session.commit()
+    return written
+
+
 def truncate_text_and_url(details):
     """
     Helper function to truncate text and URL
@@ -135,71 +678,329 @@ def truncate_text_and_url(details):
 
     return details
 
+def hn_client():
+    """
+    Create a Hacker News client configured from the current app.
+    """
+    return HNClient.from_config(current_app.config)
+
+
 def fetch_hn_ids():
     """
     Fetch the top story IDs from Hacker News.
     """
-    url = "https://hacker-news.firebaseio.com/v0/topstories.json?print=pretty"
-    response = requests.get(url, timeout=10)
-    if response.status_code == 200:
-        return response.json()
-    return []
+    async def fetch():
+        async with hn_client() as client:
+            return await client.top_story_ids()
+    return asyncio.run(fetch())
 
 
 def fetch_hn_news_details(item_id):
     """
     Fetch details for a Hacker News item by ID.
     """
-    url = f"https://hacker-news.firebaseio.com/v0/item/{item_id}.json?print=pretty"
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            details = response.json()
-            details = truncate_text_and_url(details)
-            logger.info("Details fetched for item %s", item_id)
-            return details
-    except requests.RequestException as e:
-        logger.error("Error fetching details for item %s: %s", item_id, e)
-    return None
+    return fetch_hn_news_details_bulk([item_id])[0]
 
 
 def fetch_hn_news_details_bulk(item_ids):
     """
     Fetch details for a bulk of Hacker News items by their IDs.
     """
-    #base_url = "https://hacker-news.firebaseio.com/v0/item/{}.json?print=pretty"
+    async def fetch():
+        async with hn_client() as client:
+            return await client.items(item_ids)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        details_list = list(executor.map(fetch_hn_news_details, item_ids))
+    details_list = asyncio.run(fetch())
+    return [truncate_text_and_url(details) if details else None for details in details_list]
 
-    return details_list
 
-logger = logging.getLogger(__name__)
+def dialect_insert(table):
+    """
+    Return an INSERT construct that supports ON CONFLICT on the current database.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
 
-def save_news_to_db():
+def news_item_row(details, refreshed_at):
+    """
+    Convert the details of a Hacker News item into a news_item row.
+    """
+    details = truncate_text_and_url(details)
+    row = {column.key: details.get(column.key) for column in NEWS_SYNC_COLUMNS}
+    if isinstance(row['kids'], list):
+        row['kids'] = ','.join(map(str, row['kids']))
+    row['id'] = details['id']
+    row['sort_key'] = details.get('time') or 0
+    row['refreshed_at'] = refreshed_at
+    return row
+
+
+def upsert_news_items(rows):
+    """
+    Insert new news items and update the existing ones with one batched statement.
+    """
+    if not rows:
+        return
+    statement = dialect_insert(NewsItem.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=[NewsItem.id],
+        set_={column: getattr(statement.excluded, column) for column in rows[0] if column != 'id'}
+    )
+    db.session.execute(statement, rows)
+
+
+def news_ids_due(ids, changed_ids, now):
+    """
+    Return the ids among ids that are new, changed on Hacker News or were
+    last refreshed more than HN_REFRESH_INTERVAL seconds ago.
+    """
+    refreshed = dict(
+        db.session.query(NewsItem.id, NewsItem.refreshed_at).filter(NewsItem.id.in_(ids)).all()
+    )
+    stale_before = now - current_app.config['HN_REFRESH_INTERVAL']
+    return [
+        item_id for item_id in ids
+        if item_id not in refreshed
+        or item_id in changed_ids
+        or (refreshed[item_id] or 0) < stale_before
+    ]
+
+
+def save_news_to_db(delta=True):
     """
     Save the latest news items from Hacker News to the database.
+
+    In delta mode only the top stories that are new, listed in the Hacker
+    News updates feed, or due for a refresh are downloaded. Otherwise all
+    top stories are downloaded. Either way, existing rows are updated with
+    the fresh score, comment count and kids.
     """
+    now = int(time.time())
+
+    async def fetch():
+        async with hn_client() as client:
+            ids = (await client.top_story_ids())[:current_app.config['HN_TOP_STORIES']]
+            if delta:
+                try:
+                    changed_ids = set(await client.updated_ids())
+                except HNClientError as e:
+                    logger.warning("Could not fetch updated items, refreshing by age only: %s", e)
+                    changed_ids = set()
+                ids = news_ids_due(ids, changed_ids, now)
+            return await client.items(ids)
+
     try:
-        ids = fetch_hn_ids()[:30]
-        details_list = fetch_hn_news_details_bulk(ids)
-        details_list = [details for details in details_list if details]
-        existing_ids = {item.id for item in NewsItem.query.with_entities(NewsItem.id)
-        .filter(NewsItem.id.in_(ids)).all()}
-
-        new_details = [details for details in details_list if details['id'] not in existing_ids]
-
-        news_items = []
-        for details in new_details:
-            details = truncate_text_and_url(details)
-            if 'kids' in details:
-                details['kids'] = ','.join(map(str, details['kids']))
-
-            valid_keys = {k: v for k, v in details.items() if hasattr(NewsItem, k)}
-            news_items.append(NewsItem(**valid_keys))
-
-        if news_items:
-            db.session.bulk_save_objects(news_items)
-            db.session.commit()
-    except requests.RequestException as e:
+        details_list = asyncio.run(fetch())
+        rows = [news_item_row(details, now) for details in details_list if details]
+        upsert_news_items(rows)
+        hidden = set(db.session.scalars(
+            select(NewsItem.id).where(NewsItem.hidden, NewsItem.id.in_([row['id'] for row in rows]))
+        )) if rows else set()
+        index_documents('news', ((row['id'], row['title'], row['text'])
+                                 for row in rows if row['id'] not in hidden))
+        db.session.commit()
+        refresh_rankings(now)
+        cache.invalidate()
+        logger.info("Saved %d news items", len(rows))
+    except HNClientError as e:
         logger.error("Error saving news to DB: %s", e)
+        return
+
+    if current_app.config['CONTENT_FETCH_ENABLED']:
+        fetch_news_content(current_app.config['CONTENT_FETCH_LIMIT'])
+
+
+def parse_kids(kids):
+    """
+    Return the ids stored in a comma-joined kids column.
+    """
+    return [int(kid) for kid in kids.split(',') if kid] if kids else []
+
+
+def comment_path(parent_path, comment_id):
+    """
+    Return the materialized path of a comment below parent_path ('' for a
+    top-level comment).
+    """
+    segment = f'{comment_id:010d}'
+    return f'{parent_path}.{segment}' if parent_path else segment
+
+
+def save_comments_to_db(story_ids=None, full=False):
+    """
+    Store the comment trees of the stories whose descendants count changed
+    since their comments were last synced.
+
+    The trees are walked breadth first, one level of every story at a time,
+    and each level is fetched concurrently. Comments already stored are
+    reused without a request, unless they are listed in the Hacker News
+    updates feed (their kids may have changed) or full is set, so a
+    re-ingestion only downloads the new subtrees. The updates feed only
+    covers a short window, so a story whose walk reaches fewer comments
+    than its descendants count is walked again downloading every comment.
+
+    Args:
+        story_ids: Stories to sync; defaults to every stored story.
+        full: Walk every story and download every comment again.
+
+    Returns:
+        The number of comments downloaded.
+    """
+    statement = select(NewsItem.id, NewsItem.kids, NewsItem.descendants)
+    if not full:
+        statement = statement.where(
+            func.coalesce(NewsItem.descendants, 0) != func.coalesce(NewsItem.comments_synced, -1)
+        )
+    if story_ids is not None:
+        statement = statement.where(NewsItem.id.in_(story_ids))
+    stories = db.session.execute(statement).all()
+    if not stories:
+        return 0
+
+    stored = {
+        row.id: row for row in db.session.execute(
+            select(Comment.id, Comment.kids).where(Comment.story_id.in_([story.id for story in stories]))
+        )
+    }
+    max_comments = current_app.config['HN_MAX_COMMENTS']
+
+    async def walk_trees(client, trees, reuse, budget):
+        """
+        Walk the trees of stories, reusing the stored comments for which
+        reuse(comment id) is true. Returns the rows, the stories left
+        incomplete, the number of comments reached per story and the number
+        of comments downloaded.
+        """
+        rows = {}
+        incomplete = set()
+        reached = dict.fromkeys((story.id for story in trees), 0)
+        # (comment id, story id, parent id, parent path, depth)
+        level = [(kid, story.id, story.id, '', 0)
+                 for story in trees for kid in parse_kids(story.kids)]
+        fetched = 0
+        while level:
+            wanted = [node[0] for node in level if not reuse(node[0])]
+            if fetched + len(wanted) > budget:
+                wanted = wanted[:max(0, budget - fetched)]
+            details = dict(zip(wanted, await client.items(wanted)))
+            fetched += len(wanted)
+
+            next_level = []
+            for comment_id, story_id, parent_id, parent_path, depth in level:
+                path = comment_path(parent_path, comment_id)
+                if comment_id in details:
+                    item = details[comment_id]
+                    if item is None:
+                        incomplete.add(story_id)
+                        continue
+                    kids = item.get('kids') or []
+                    rows[comment_id] = {
+                        'id': comment_id, 'story_id': story_id, 'parent_id': parent_id,
+                        'path': path, 'depth': depth, 'by': item.get('by'),
+                        'text': item.get('text'), 'time': item.get('time'),
+                        'kids': ','.join(map(str, kids)),
+                        'deleted': bool(item.get('deleted') or item.get('dead')),
+                    }
+                elif reuse(comment_id):
+                    kids = parse_kids(stored[comment_id].kids)
+                else:
+                    # Over the per-run limit; picked up by the next run
+                    incomplete.add(story_id)
+                    continue
+                reached[story_id] += 1
+                next_level.extend((kid, story_id, comment_id, path, depth + 1) for kid in kids)
+            level = next_level
+        return rows, incomplete, reached, fetched
+
+    async def walk():
+        async with hn_client() as client:
+            changed_ids = set()
+            if not full:
+                try:
+                    changed_ids = set(await client.updated_ids())
+                except HNClientError as e:
+                    logger.warning("Could not fetch updated items: %s", e)
+
+            def unchanged(comment_id):
+                return not full and comment_id in stored and comment_id not in changed_ids
+
+            rows, incomplete, reached, fetched = await walk_trees(client, stories, unchanged, max_comments)
+            # A reply to a stored comment that the updates feed missed leaves
+            # its story short of its descendants: walk it again downloading
+            # every comment, since any of them may have new kids
+            short = [story for story in stories
+                     if story.id not in incomplete and reached[story.id] < (story.descendants or 0)]
+            if short and not full:
+                logger.info("Downloading the comments of %d stories again", len(short))
+                refetched, still_incomplete, _, refetch_count = await walk_trees(
+                    client, short, lambda comment_id: False, max_comments - fetched
+                )
+                rows.update(refetched)
+                incomplete |= still_incomplete
+                fetched += refetch_count
+            return list(rows.values()), incomplete, fetched
+
+    try:
+        rows, incomplete, fetched = asyncio.run(walk())
+    except HNClientError as e:
+        logger.error("Error saving comments to DB: %s", e)
+        return 0
+
+    if rows:
+        statement = dialect_insert(Comment.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Comment.id],
+            set_={column: getattr(statement.excluded, column) for column in rows[0] if column != 'id'}
+        )
+        db.session.execute(statement, rows)
+    synced = [{'id': story.id, 'comments_synced': story.descendants or 0}
+              for story in stories if story.id not in incomplete]
+    if synced:
+        db.session.execute(update(NewsItem), synced)
+    db.session.commit()
+    cache.invalidate()
+    logger.info("Saved %d comments of %d stories", len(rows), len(stories))
+    return fetched
+
+
+def fetch_news_content(limit=None):
+    """
+    Download the articles of the newest news items whose content was not
+    fetched yet and store their text compressed.
+
+    Items whose article could not be used are marked as fetched with no
+    content, so they are not tried again; items not reached before
+    CONTENT_DEADLINE are left for the next run.
+
+    Returns the number of items that got content.
+    """
+    statement = (
+        select(NewsItem.id, NewsItem.url)
+        .where(NewsItem.content_fetched_at.is_(None))
+        .where(NewsItem.url.like('http%'))
+        .order_by(NewsItem.sort_key.desc())
+    )
+    if limit:
+        statement = statement.limit(limit)
+    urls = dict(db.session.execute(statement).all())
+    if not urls:
+        return 0
+
+    async def fetch():
+        async with ArticleFetcher.from_config(current_app.config) as fetcher:
+            return await fetcher.fetch_many(urls)
+
+    texts = asyncio.run(fetch())
+    now = int(time.time())
+    rows = [
+        {'id': item_id, 'content': compress_text(text) if text else None, 'content_fetched_at': now}
+        for item_id, text in texts.items()
+    ]
+    if rows:
+        db.session.execute(update(NewsItem), rows)
+        db.session.commit()
+    stored = sum(1 for row in rows if row['content'] is not None)
+    logger.info("Stored the content of %d of %d news items", stored, len(urls))
+    return stored
@@ -0,0 +1,302 @@
+"""
+Rate limiting and load shedding of the write endpoints.
+
+Every endpoint of RATE_LIMITS gets a token bucket per client: a bucket
+holds up to `burst` tokens, refills at `rate` tokens per second, and
+every write request takes one. A client is the logged-in user, or its IP
+address for anonymous requests and for the policies keyed by 'ip'. A
+request finding the bucket empty is answered 429 with a Retry-After.
+Reads (GET, HEAD, OPTIONS) are never limited.
+
+The buckets live in the process, or in a SQLite file when
+RATE_LIMIT_PATH is set, which every gunicorn worker opens so that a
+client gets the same budget whichever worker serves it. Only
+ProductionConfig sets it: with the default in-process buckets, every
+worker grants a client its own budget. A bucket is
+updated with a single UPSERT ... RETURNING, so concurrent workers cannot
+both spend its last token.
+
+Load shedding protects the SQLite write lock from piling up requests.
+Every worker measures how long the limited requests take, from the time
+Nginx received them when it sends X-Request-Start. The header is only
+trusted behind RATE_LIMIT_TRUSTED_PROXIES proxies, since a client could
+otherwise send an old time to make the worker shed; without them the
+requests are timed from when the app starts handling them. When even the fastest
+of them took longer than SHED_TARGET over a SHED_INTERVAL, the worker is
+overloaded and answers the next ones 503 at once, until an interval
+passes in which they are fast again (or none complete).
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, jsonify, render_template, request, session
+
+logger = logging.getLogger(__name__)
+
+# Methods that never take a token
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Number of buckets taken between two purges of the full ones
+PURGE_EVERY = 1000
+
+
+def refill(tokens, updated, burst, rate, now):
+    """
+    Return the tokens of a bucket that held tokens at updated.
+    """
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBuckets:
+    """
+    Token buckets of one process.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._takes = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate, now):
+        """
+        Take a token from the bucket of key. Returns 0 when one was taken,
+        otherwise the seconds until the bucket holds a token again.
+        """
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = refill(tokens, updated, burst, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            self._takes += 1
+            if self._takes % PURGE_EVERY == 0:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        return 0 if allowed else (1 - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """
+    Token buckets in a local SQLite file, shared by every process that
+    opens the same path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections are opened per thread and are not reused after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS rate_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL, allowed INTEGER'
+                ') WITHOUT ROWID'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.takes = 0
+        return connection
+
+    def take(self, key, burst, rate, now):
+        """
+        Take a token from the bucket of key. Returns 0 when one was taken,
+        otherwise the seconds until the bucket holds a token again.
+        """
+        connection = self._connection()
+        refilled = 'min(:burst, tokens + (:now - updated) * :rate)'
+        tokens, allowed = connection.execute(
+            'INSERT INTO rate_bucket (key, tokens, updated, full_at, allowed) '
+            'VALUES (:key, :burst - 1, :now, :now + 1 / :rate, 1) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            f'tokens = {refilled} - ({refilled} >= 1), '
+            f'full_at = :now + (:burst - {refilled} + ({refilled} >= 1)) / :rate, '
+            f'allowed = {refilled} >= 1, '
+            'updated = :now '
+            'RETURNING tokens, allowed',
+            {'key': key, 'burst': burst, 'rate': rate, 'now': now}
+        ).fetchone()
+        self._local.takes += 1
+        if self._local.takes % PURGE_EVERY == 0:
+            connection.execute('DELETE FROM rate_bucket WHERE full_at < ?', (now,))
+        return 0 if allowed else (1 - tokens) / rate
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM rate_bucket').fetchone()[0]
+
+
+class LoadShedder:
+    """
+    Overload detector of one process, from the latency of the limited
+    requests: overloaded when their minimum over an interval exceeds target.
+    The intervals are measured with clock, time.monotonic by default.
+    """
+
+    def __init__(self, target, interval, clock=time.monotonic):
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+        self.overloaded = False
+        self._window_start = clock()
+        self._window_min = math.inf
+        self._lock = threading.Lock()
+
+    def observe(self, latency):
+        """
+        Record the latency of a request that was served.
+        """
+        with self._lock:
+            self._window_min = min(self._window_min, latency)
+            self._roll(self.clock())
+
+    def shedding(self):
+        """
+        Whether the next limited request should be turned away.
+        """
+        with self._lock:
+            self._roll(self.clock())
+            return self.overloaded
+
+    def _roll(self, now):
+        if now - self._window_start >= self.interval:
+            overloaded = self._window_min > self.target and self._window_min != math.inf
+            if overloaded != self.overloaded:
+                logger.warning("Load shedding %s (fastest request %.3f s)",
+                               'started' if overloaded else 'stopped', self._window_min)
+            self.overloaded = overloaded
+            self._window_start = now
+            self._window_min = math.inf
+
+
+class _LimiterState:
+    """
+    Per app policies, buckets and load shedder.
+    """
+
+    def __init__(self, config, instance_path):
+        self.enabled = config['RATE_LIMIT_ENABLED']
+        self.policies = config['RATE_LIMITS']
+        self.trusted_proxies = config['RATE_LIMIT_TRUSTED_PROXIES']
+        if config['RATE_LIMIT_PATH']:
+            os.makedirs(instance_path, exist_ok=True)
+            self.buckets = SQLiteBuckets(os.path.join(instance_path, config['RATE_LIMIT_PATH']))
+        else:
+            self.buckets = MemoryBuckets()
+        self.shedder = None
+        if config['SHED_ENABLED']:
+            self.shedder = LoadShedder(config['SHED_TARGET'], config['SHED_INTERVAL'])
+
+
+class RateLimiter:
+    """
+    Flask extension applying the RATE_LIMITS policies and the load shedding.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Set up the limits of app from its RATE_LIMIT_* and SHED_* settings.
+        """
+        state = app.extensions['rate_limiter'] = _LimiterState(app.config, app.instance_path)
+        if state.enabled or state.shedder is not None:
+            app.before_request(self._check_request)
+            app.teardown_request(self._request_finished)
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['rate_limiter']
+
+    def client_key(self, policy):
+        """
+        Return the bucket key of the client of the current request for a policy.
+        """
+        if policy.get('key', 'user') == 'user':
+            user_id = (session.get('user') or {}).get('id')
+            if user_id is not None:
+                return f'user:{user_id}'
+        return f'ip:{self.client_address()}'
+
+    def client_address(self):
+        """
+        Return the address of the client, read from X-Forwarded-For behind
+        RATE_LIMIT_TRUSTED_PROXIES proxies.
+        """
+        proxies = self._state().trusted_proxies
+        route = request.access_route
+        if proxies and len(route) >= proxies:
+            return route[-proxies]
+        return request.remote_addr
+
+    def _check_request(self):
+        state = self._state()
+        policy = state.policies.get(request.endpoint)
+        if policy is None or request.method in SAFE_METHODS:
+            return None
+
+        if state.shedder is not None and state.shedder.shedding():
+            return rejection(503, 'Server busy, please retry', state.shedder.interval)
+
+        if state.enabled:
+            retry_after = state.buckets.take(
+                f'{request.endpoint}|{self.client_key(policy)}', policy['burst'], policy['rate'], time.time()
+            )
+            if retry_after:
+                return rejection(429, 'Too many requests', retry_after)
+
+        # Only the requests that go on to be served measure the load
+        if state.shedder is not None:
+            g.rate_limit_start = request_start(trust_header=state.trusted_proxies > 0)
+        return None
+
+    def _request_finished(self, _exception=None):
+        start = g.pop('rate_limit_start', None)
+        if start is not None:
+            self._state().shedder.observe(time.time() - start)
+
+
+def request_start(trust_header):
+    """
+    Return the epoch time at which the front proxy received the current
+    request, from its X-Request-Start header ("t=<seconds>" as Nginx's
+    $msec, or milliseconds), or now when there is none or it is not trusted.
+    """
+    now = time.time()
+    if not trust_header:
+        return now
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        start = float(header.removeprefix('t='))
+    except ValueError:
+        return now
+    if start > 1e11:
+        start /= 1000
+    return min(start, now)
+
+
+def rejection(status, message, retry_after):
+    """
+    Build the response turning a request away: JSON for JSON requests, the
+    error page otherwise, with the seconds to wait in Retry-After.
+    """
+    if request.is_json:
+        response = jsonify({'error': message})
+    else:
+        response = current_app.make_response(render_template(f'errors/{status}.html'))
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
@@ -0,0 +1,165 @@
+"""
+Full-text search over news items and posts.
+
+Titles and bodies are indexed in an SQLite FTS5 table, search_index, which
+create_all sets up next to the model tables. News items and posts share the
+index: the rowid of a document is twice the id of the item, plus one for
+posts. The write paths keep the index current with index_documents and
+remove_documents; rebuild_index re-creates it from the tables in bulk.
+
+The index needs SQLite with FTS5. On other databases the maintenance
+functions do nothing and search_available returns False.
+"""
+
+import re
+
+from sqlalchemy import Column, DDL, Integer, MetaData, Table, Text, delete, event
+from sqlalchemy import func, insert, literal_column, select, text
+
+from flaskblog import db
+
+SEARCH_TABLE = 'search_index'
+
+# Document kinds, stored in the lowest bit of the rowid
+KINDS = {'news': 0, 'post': 1}
+
+# Weights of the title and body columns in the BM25 ranking
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+# Query-only description of the virtual table; it is created by the DDL below
+search_index = Table(
+    SEARCH_TABLE, MetaData(),
+    Column('rowid', Integer, primary_key=True),
+    Column('title', Text),
+    Column('body', Text),
+)
+
+event.listen(db.metadata, 'after_create', DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "title, body, tokenize='porter unicode61', prefix='2 3')"
+).execute_if(dialect='sqlite'))
+event.listen(db.metadata, 'before_drop', DDL(
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+).execute_if(dialect='sqlite'))
+
+
+def search_available():
+    """
+    Whether the database supports the search index.
+    """
+    return db.engine.dialect.name == 'sqlite'
+
+
+def document_rowid(kind, item_id):
+    """
+    Return the rowid of an item in the search index.
+    """
+    return item_id * 2 + KINDS[kind]
+
+
+def index_documents(kind, documents):
+    """
+    Add or replace documents in the search index, in the current transaction.
+
+    Args:
+        kind: 'news' or 'post'.
+        documents: Iterable of (id, title, body).
+    """
+    rows = [
+        {'rowid': document_rowid(kind, item_id), 'title': title or '', 'body': body or ''}
+        for item_id, title, body in documents
+    ]
+    if rows and search_available():
+        db.session.execute(insert(search_index).prefix_with('OR REPLACE'), rows)
+
+
+def remove_documents(kind, item_ids):
+    """
+    Remove items from the search index, in the current transaction.
+    """
+    rowids = [document_rowid(kind, item_id) for item_id in item_ids]
+    if rowids and search_available():
+        db.session.execute(delete(search_index).where(search_index.c.rowid.in_(rowids)))
+
+
+def rebuild_index():
+    """
+    Re-create the whole search index from the visible rows of the news_item
+    and post tables.
+
+    Returns the number of indexed documents.
+    """
+    if not search_available():
+        return 0
+    # pylint: disable=import-outside-toplevel
+    from flaskblog.models import NewsItem, Post
+    # pylint: enable=import-outside-toplevel
+    db.session.execute(delete(search_index))
+    for model, kind, body in ((NewsItem, 'news', NewsItem.text), (Post, 'post', Post.content)):
+        db.session.execute(
+            insert(search_index).from_select(
+                ['rowid', 'title', 'body'],
+                select(model.id * 2 + KINDS[kind], func.coalesce(model.title, ''),
+                       func.coalesce(body, ''))
+                .where(~model.hidden)
+            )
+        )
+    db.session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    count = db.session.execute(select(func.count()).select_from(search_index)).scalar() # pylint: disable=not-callable
+    db.session.commit()
+    return count
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query matching every word, the last one as
+    a prefix. Operators and quotes typed by the user are taken literally.
+
+    Returns None if the text has no words.
+    """
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_statement(expression, limit, offset):
+    """
+    Build the query of one page of search results, best match first. It
+    selects one row more than the page size, which tells whether there is a
+    next page.
+
+    Every row has the kind and id of the item, its BM25 score, and its
+    title, url and feed datetime from the item table.
+    """
+    # pylint: disable=import-outside-toplevel
+    from flaskblog.models import NewsItem, Post
+    # pylint: enable=import-outside-toplevel
+    score = func.bm25(literal_column(SEARCH_TABLE), TITLE_WEIGHT, BODY_WEIGHT)
+    hits = (
+        select(search_index.c.rowid.label('rowid'), score.label('score'))
+        .where(literal_column(SEARCH_TABLE).op('MATCH')(expression))
+        .order_by(score)
+        .limit(limit + 1)
+        .offset(offset)
+        .subquery('hits')
+    )
+    item_id = hits.c.rowid.op('>>')(1)
+    is_post = hits.c.rowid.op('&')(1)
+    return (
+        select(
+            item_id.label('id'),
+            is_post.label('is_post'),
+            hits.c.score,
+            func.coalesce(NewsItem.title, Post.title).label('title'),
+            NewsItem.url,
+            func.coalesce(NewsItem.sort_key, Post.sort_key).label('datetime'),
+        )
+        .select_from(hits)
+        .outerjoin(NewsItem, (is_post == 0) & (NewsItem.id == item_id))
+        .outerjoin(Post, (is_post == 1) & (Post.id == item_id))
+        .order_by(hits.c.score)
+    )
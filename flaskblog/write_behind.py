@@ -0,0 +1,390 @@
+"""
+Write-behind buffer for user interactions.
+
+With INTERACTION_WRITE_BEHIND on, likes and dislikes are not written to
+user_interaction by the request that makes them. The toggle is folded into
+a journal entry holding the final interaction of the (user, item) pair and
+the interaction stored in the database when the entry was created, and the
+request is answered with the counts projected from the database counters
+plus the pending entries. A background thread in every worker flushes the
+journal every INTERACTION_FLUSH_INTERVAL seconds, a request flushes it when
+it holds INTERACTION_FLUSH_SIZE entries, and it is flushed on shutdown.
+
+Entries hold final states rather than toggles and are stored with
+store_interactions, which is idempotent. Entries are removed from the
+journal only after the database transaction has committed, so a flush that
+is interrupted half way is simply repeated.
+
+The journal lives in the process unless INTERACTION_JOURNAL_PATH names a
+SQLite file: a crash then loses the toggles of the last flush interval,
+and the projected counts only include the toggles buffered by the same
+worker. With the file, every worker shares one journal and the entries
+survive a crash; they are flushed by the next process that starts, whose
+flusher begins with its first request.
+
+The read-modify-write of a toggle runs under the lock of the journal (a
+BEGIN IMMEDIATE transaction for the file), so concurrent toggles of the
+same user and item, from two tabs or two workers, are never folded from
+the same state.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryJournal:
+    """
+    Journal of pending interactions kept in the process.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """
+        Return a dict of key to (base, state) for the keys with an entry.
+        """
+        with self._lock:
+            return {key: tuple(self._entries[key][:2]) for key in keys if key in self._entries}
+
+    def update(self, keys, compute):
+        """
+        Atomically read the entries of keys, as a dict of key to (base, state)
+        for the keys with an entry, and store the dict of key to (base, state)
+        that compute returns for them.
+        """
+        with self._lock:
+            entries = {key: tuple(self._entries[key][:2]) for key in keys if key in self._entries}
+            for key, (base, state) in compute(entries).items():
+                self._sequence += 1
+                self._entries[key] = [base, state, self._sequence]
+
+    def pending_for(self, items):
+        """
+        Return a list of ((item type, item id), base, state) of the entries
+        of the items.
+        """
+        items = set(items)
+        with self._lock:
+            return [(key[1:], base, state) for key, (base, state, _) in self._entries.items()
+                    if key[1:] in items]
+
+    def snapshot(self, limit=None):
+        """
+        Return up to limit entries as (key, state, sequence).
+        """
+        with self._lock:
+            items = list(self._entries.items())[:limit]
+            return [(key, state, sequence) for key, (_, state, sequence) in items]
+
+    def acknowledge(self, flushed):
+        """
+        Drop the flushed entries. An entry changed since the snapshot is kept,
+        with the flushed state as its new base.
+        """
+        with self._lock:
+            for key, state, sequence in flushed:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[2] == sequence:
+                    del self._entries[key]
+                else:
+                    entry[0] = state
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteJournal:
+    """
+    Journal of pending interactions in a local SQLite file, shared by every
+    process that opens the same path and kept across restarts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections are opened per thread and are not reused after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS interaction_journal ('
+                'user_id INTEGER, target_type TEXT, post_id INTEGER, base TEXT, state TEXT, '
+                'sequence INTEGER PRIMARY KEY AUTOINCREMENT, UNIQUE (user_id, target_type, post_id))'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_interaction_journal_target '
+                'ON interaction_journal (target_type, post_id)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _select(connection, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = connection.execute(
+            'SELECT user_id, target_type, post_id, base, state FROM interaction_journal '
+            f'WHERE (user_id, target_type, post_id) IN ({", ".join(["(?, ?, ?)"] * len(keys))})',
+            [value for key in keys for value in key]
+        )
+        return {tuple(row[:3]): tuple(row[3:]) for row in rows}
+
+    def get_many(self, keys):
+        """
+        Return a dict of key to (base, state) for the keys with an entry.
+        """
+        return self._select(self._connection(), keys)
+
+    def update(self, keys, compute):
+        """
+        Atomically read the entries of keys, as a dict of key to (base, state)
+        for the keys with an entry, and store the dict of key to (base, state)
+        that compute returns for them. Both happen in one write transaction,
+        so the toggles of other threads and processes wait for it.
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            entries = compute(self._select(connection, keys))
+            connection.executemany(
+                'INSERT INTO interaction_journal (user_id, target_type, post_id, base, state) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (user_id, target_type, post_id) DO UPDATE SET state = excluded.state, '
+                'sequence = (SELECT max(sequence) + 1 FROM interaction_journal)',
+                [(*key, base, state) for key, (base, state) in entries.items()]
+            )
+
+    def pending_for(self, items):
+        """
+        Return a list of ((item type, item id), base, state) of the entries
+        of the items.
+        """
+        items = list(items)
+        if not items:
+            return []
+        rows = self._connection().execute(
+            'SELECT target_type, post_id, base, state FROM interaction_journal '
+            f'WHERE (target_type, post_id) IN ({", ".join(["(?, ?)"] * len(items))})',
+            [value for item in items for value in item]
+        )
+        return [((item_type, item_id), base, state) for item_type, item_id, base, state in rows]
+
+    def snapshot(self, limit=None):
+        """
+        Return up to limit entries as (key, state, sequence).
+        """
+        rows = self._connection().execute(
+            'SELECT user_id, target_type, post_id, state, sequence FROM interaction_journal '
+            'ORDER BY sequence LIMIT ?',
+            (-1 if limit is None else limit,)
+        )
+        return [(tuple(row[:3]), row[3], row[4]) for row in rows]
+
+    def acknowledge(self, flushed):
+        """
+        Drop the flushed entries. An entry changed since the snapshot is kept,
+        with the flushed state as its new base.
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'DELETE FROM interaction_journal '
+                'WHERE user_id = ? AND target_type = ? AND post_id = ? AND sequence = ?',
+                [(*key, sequence) for key, _, sequence in flushed]
+            )
+            connection.executemany(
+                'UPDATE interaction_journal SET base = ? '
+                'WHERE user_id = ? AND target_type = ? AND post_id = ?',
+                [(state, *key) for key, state, _ in flushed]
+            )
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM interaction_journal').fetchone()[0]
+
+
+class _BufferState:
+    """
+    Per app state of the write-behind buffer.
+    """
+
+    def __init__(self, config):
+        self.enabled = config['INTERACTION_WRITE_BEHIND']
+        self.interval = config['INTERACTION_FLUSH_INTERVAL']
+        self.flush_size = config['INTERACTION_FLUSH_SIZE']
+        if config['INTERACTION_JOURNAL_PATH']:
+            self.journal = SQLiteJournal(config['INTERACTION_JOURNAL_PATH'])
+        else:
+            self.journal = MemoryJournal()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.flusher_pid = None
+        self.stopped = threading.Event()
+
+
+class InteractionBuffer:
+    """
+    Flask extension buffering interaction toggles and writing them behind.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Set up the buffer for app from its INTERACTION_* settings.
+        """
+        state = app.extensions['interaction_buffer'] = _BufferState(app.config)
+        if state.enabled:
+            atexit.register(self.shutdown, app)
+            # The flusher of a process starts with its first request, so the
+            # entries a crashed process left in the journal file get written
+            # without waiting for a new toggle
+            app.before_request(lambda: self._start_flusher(state))
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['interaction_buffer']
+
+    @property
+    def enabled(self):
+        """
+        Whether the current app buffers interactions.
+        """
+        return self._state().enabled
+
+    def toggle_many(self, user_id, operations):
+        """
+        Buffer like/dislike toggles of one user, with the semantics of
+        apply_interactions, and return the same dict of (item type, item id)
+        to (interaction or None, likes, dislikes) with projected counts.
+        """
+        # pylint: disable=import-outside-toplevel
+        from flaskblog.models import fold_interactions, interaction_delta, interaction_states, item_counts
+        # pylint: enable=import-outside-toplevel
+        state = self._state()
+        operations = list(operations)
+        items = list(dict.fromkeys(item for item, _ in operations))
+        keys = [(user_id, *item) for item in items]
+
+        final = {}
+
+        def fold(entries):
+            # Runs under the journal lock: concurrent toggles of the same
+            # user and item are folded one after the other
+            stored = interaction_states(user_id, [key[1:] for key in keys if key not in entries])
+            bases = {key: entries[key][0] if key in entries else stored.get(key[1:]) for key in keys}
+            final.update(fold_interactions(
+                {key: entries[key][1] if key in entries else bases[key] for key in keys},
+                (((user_id, *item), action) for item, action in operations)
+            ))
+            return {key: (bases[key], final[key]) for key in keys}
+        state.journal.update(keys, fold)
+
+        counts = {item: list(counts) for item, counts in item_counts(items).items()}
+        for item, base, pending in state.journal.pending_for(items):
+            like_delta, dislike_delta = interaction_delta(base, pending)
+            counts[item][0] += like_delta
+            counts[item][1] += dislike_delta
+
+        if len(state.journal) >= state.flush_size:
+            self.flush()
+        return {item: (final[(user_id, *item)], *counts[item]) for item in items}
+
+    def current_states(self, user_id, items):
+        """
+        Return a dict of (item type, item id) to the interaction of a user
+        with the items, pending toggles included, for the items the user
+        interacted with. The stored states are read with one query.
+        """
+        # pylint: disable=import-outside-toplevel
+        from flaskblog.models import interaction_states
+        # pylint: enable=import-outside-toplevel
+        items = list(items)
+        pending = {}
+        if self.enabled:
+            entries = self._state().journal.get_many([(user_id, *item) for item in items])
+            pending = {key[1:]: state for key, (_, state) in entries.items()}
+        states = interaction_states(user_id, [item for item in items if item not in pending])
+        states.update((item, state) for item, state in pending.items() if state is not None)
+        return states
+
+    def flush(self, limit=None):
+        """
+        Write the pending interactions to the database in one transaction.
+
+        Returns the number of entries written.
+        """
+        # pylint: disable=import-outside-toplevel
+        from flaskblog import cache, db
+        from flaskblog.models import store_interactions
+        # pylint: enable=import-outside-toplevel
+        state = self._state()
+        with state.flush_lock:
+            flushed = state.journal.snapshot(limit)
+            if not flushed:
+                return 0
+            try:
+                store_interactions({key: interaction for key, interaction, _ in flushed})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            state.journal.acknowledge(flushed)
+        cache.invalidate()
+        logger.info("Flushed %d buffered interactions", len(flushed))
+        return len(flushed)
+
+    def _start_flusher(self, state):
+        """
+        Start the background flush thread of this process, once per process
+        so that it also runs in workers forked after the app was created.
+        """
+        if state.flusher_pid == os.getpid():
+            return
+        with state.start_lock:
+            if state.flusher_pid == os.getpid():
+                return
+            state.flusher_pid = os.getpid()
+        app = current_app._get_current_object() # pylint: disable=protected-access
+        threading.Thread(target=self._flush_periodically, args=(app, state), daemon=True,
+                         name='interaction-flusher').start()
+
+    def _flush_periodically(self, app, state):
+        while not state.stopped.wait(state.interval):
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception: # pylint: disable=broad-except
+                    logger.exception("Error flushing buffered interactions")
+
+    def shutdown(self, app):
+        """
+        Stop the background flush and write what is still pending.
+        """
+        state = app.extensions['interaction_buffer']
+        state.stopped.set()
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception: # pylint: disable=broad-except
+                logger.exception("Error flushing buffered interactions on shutdown")
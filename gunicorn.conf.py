@@ -0,0 +1,46 @@
+"""
+gunicorn settings of the production server, read by `gunicorn` from the
+working directory. Every setting can be overridden with an environment
+variable.
+
+The app is created once in the master (preload_app) and the workers are
+forked from it, so the imported code and the app are shared copy-on-write
+instead of being loaded again by every worker. The objects of the master
+are frozen out of the garbage collector before each fork; otherwise the
+first collection in a worker writes to the headers of all of them and
+un-shares their pages.
+"""
+
+import gc
+import multiprocessing
+from os import environ as env
+
+wsgi_app = 'wsgi:app'
+bind = env.get('GUNICORN_BIND', '127.0.0.1:8000')
+preload_app = True
+
+# Two workers per core plus one; threads overlap the network and SQLite I/O
+# of the requests of one worker.
+workers = int(env.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(env.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Recycle workers now and then so that slow leaks and fragmentation do not
+# build up; the jitter keeps them from restarting together.
+max_requests = int(env.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(env.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(env.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(env.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(env.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = env.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def pre_fork(_server, _worker):
+    """
+    Keep the objects of the master out of the collections of the workers.
+    """
+    gc.freeze()
+
@@ -0,0 +1,32 @@
+"""news item compressed content
+
+Revision ID: 1f6d0b3c5e47
+Revises: e3a8c5f7b9d2
+Create Date: 2026-10-18 05:48:12.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f6d0b3c5e47'
+down_revision = 'e3a8c5f7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # news_item.content was never filled, so it is cleared rather than converted
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), type_=sa.LargeBinary(),
+                              existing_nullable=True, postgresql_using='NULL')
+        batch_op.add_column(sa.Column('content_fetched_at', sa.Integer(), nullable=True))
+    op.execute("UPDATE news_item SET content = NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.drop_column('content_fetched_at')
+        batch_op.alter_column('content', existing_type=sa.LargeBinary(), type_=sa.Text(),
+                              existing_nullable=True, postgresql_using='NULL')
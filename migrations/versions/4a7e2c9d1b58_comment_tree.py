@@ -0,0 +1,47 @@
+"""comment tree
+
+Revision ID: 4a7e2c9d1b58
+Revises: 1f6d0b3c5e47
+Create Date: 2026-10-18 07:21:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7e2c9d1b58'
+down_revision = '1f6d0b3c5e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('comment',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('story_id', sa.Integer(), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.Text(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.Column('by', sa.String(length=120), nullable=True),
+    sa.Column('text', sa.Text(), nullable=True),
+    sa.Column('time', sa.Integer(), nullable=True),
+    sa.Column('kids', sa.Text(), nullable=True),
+    sa.Column('deleted', sa.Boolean(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_story_path', ['story_id', 'path'], unique=False)
+
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comments_synced', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.drop_column('comments_synced')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_story_path')
+
+    op.drop_table('comment')
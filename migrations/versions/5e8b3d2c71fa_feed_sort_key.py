@@ -0,0 +1,44 @@
+"""feed sort key
+
+Revision ID: 5e8b3d2c71fa
+Revises: a4c1e2f09b7d
+Create Date: 2026-10-18 02:31:07.904551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b3d2c71fa'
+down_revision = 'a4c1e2f09b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sort_key', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sort_key', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the epoch seconds the feed is ordered by
+    op.execute("UPDATE news_item SET sort_key = COALESCE(time, 0)")
+    op.execute("UPDATE post SET sort_key = CAST(strftime('%s', date_posted) AS INTEGER)")
+
+    op.create_index('ix_news_item_sort_key', 'news_item',
+                    [sa.text('sort_key DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_post_sort_key', 'post',
+                    [sa.text('sort_key DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_post_sort_key', table_name='post')
+    op.drop_index('ix_news_item_sort_key', table_name='news_item')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('sort_key')
+
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.drop_column('sort_key')
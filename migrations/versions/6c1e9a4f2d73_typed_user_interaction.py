@@ -0,0 +1,71 @@
+"""typed user interaction
+
+Revision ID: 6c1e9a4f2d73
+Revises: 8d3f6a1c2e94
+Create Date: 2026-10-18 09:12:40.281937
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e9a4f2d73'
+down_revision = '8d3f6a1c2e94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_interaction_new',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('target_type', sa.SmallInteger(), nullable=False),
+    sa.Column('post_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('interaction', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'target_type', 'post_id'),
+    sqlite_with_rowid=False
+    )
+
+    # Rows used to share the id space of posts and news items: an id that
+    # only exists as a news item is a news interaction (type 0), anything
+    # else stays a post interaction (type 1). 'like' becomes 1, 'dislike' -1.
+    op.execute("""
+        INSERT INTO user_interaction_new (user_id, target_type, post_id, interaction)
+        SELECT user_id,
+               CASE WHEN NOT EXISTS (SELECT 1 FROM post WHERE post.id = user_interaction.post_id)
+                     AND EXISTS (SELECT 1 FROM news_item WHERE news_item.id = user_interaction.post_id)
+                    THEN 0 ELSE 1 END,
+               post_id,
+               CASE WHEN interaction = 'like' THEN 1 ELSE -1 END
+        FROM user_interaction
+    """)
+    op.drop_table('user_interaction')
+    op.rename_table('user_interaction_new', 'user_interaction')
+
+    with op.batch_alter_table('user_interaction', schema=None) as batch_op:
+        batch_op.create_index('ix_user_interaction_target', ['target_type', 'post_id', 'interaction'], unique=False)
+
+
+def downgrade():
+    op.create_table('user_interaction_old',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('interaction', sa.String(length=10), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+
+    # A post and a news item with the same id collapse into one row again;
+    # the interaction with the post wins.
+    op.execute("""
+        INSERT INTO user_interaction_old (user_id, post_id, interaction)
+        SELECT user_id, post_id, CASE WHEN interaction = 1 THEN 'like' ELSE 'dislike' END
+        FROM user_interaction
+        WHERE true
+        ORDER BY target_type DESC
+        ON CONFLICT (user_id, post_id) DO NOTHING
+    """)
+    op.drop_table('user_interaction')
+    op.rename_table('user_interaction_old', 'user_interaction')
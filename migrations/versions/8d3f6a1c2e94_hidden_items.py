@@ -0,0 +1,32 @@
+"""hidden items
+
+Revision ID: 8d3f6a1c2e94
+Revises: 4a7e2c9d1b58
+Create Date: 2026-10-18 08:02:17.430562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6a1c2e94'
+down_revision = '4a7e2c9d1b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hidden', sa.Boolean(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hidden', sa.Boolean(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('hidden')
+
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.drop_column('hidden')
@@ -0,0 +1,38 @@
+"""full-text search index
+
+Revision ID: 9b2f4d6e8a13
+Revises: c7d94e1a3b20
+Create Date: 2026-10-18 04:15:27.093518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2f4d6e8a13'
+down_revision = 'c7d94e1a3b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, tokenize='porter unicode61', prefix='2 3')"
+    )
+    op.execute(
+        "INSERT INTO search_index (rowid, title, body) "
+        "SELECT id * 2, COALESCE(title, ''), COALESCE(text, '') FROM news_item"
+    )
+    op.execute(
+        "INSERT INTO search_index (rowid, title, body) "
+        "SELECT id * 2 + 1, COALESCE(title, ''), COALESCE(content, '') FROM post"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS search_index")
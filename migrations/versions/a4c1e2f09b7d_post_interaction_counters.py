@@ -0,0 +1,39 @@
+"""post interaction counters
+
+Revision ID: a4c1e2f09b7d
+Revises: 0315cda32c62
+Create Date: 2026-10-18 02:10:43.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c1e2f09b7d'
+down_revision = '0315cda32c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('dislike_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counters from the existing interactions
+    op.execute("""
+        UPDATE post SET
+            like_count = (SELECT COUNT(*) FROM user_interaction
+                          WHERE user_interaction.post_id = post.id
+                          AND user_interaction.interaction = 'like'),
+            dislike_count = (SELECT COUNT(*) FROM user_interaction
+                             WHERE user_interaction.post_id = post.id
+                             AND user_interaction.interaction = 'dislike')
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('dislike_count')
+        batch_op.drop_column('like_count')
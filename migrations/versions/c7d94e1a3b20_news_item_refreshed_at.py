@@ -0,0 +1,26 @@
+"""news item refreshed_at
+
+Revision ID: c7d94e1a3b20
+Revises: 5e8b3d2c71fa
+Create Date: 2026-10-18 03:02:55.417362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d94e1a3b20'
+down_revision = '5e8b3d2c71fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('refreshed_at', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('news_item', schema=None) as batch_op:
+        batch_op.drop_column('refreshed_at')
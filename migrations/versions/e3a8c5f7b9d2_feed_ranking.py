@@ -0,0 +1,35 @@
+"""feed ranking
+
+Revision ID: e3a8c5f7b9d2
+Revises: 9b2f4d6e8a13
+Create Date: 2026-10-18 05:02:41.602175
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a8c5f7b9d2'
+down_revision = '9b2f4d6e8a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feed_ranking',
+    sa.Column('item_type', sa.String(length=4), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('points', sa.Float(), nullable=False),
+    sa.Column('posted', sa.Integer(), nullable=False),
+    sa.Column('hot', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('item_type', 'item_id')
+    )
+    op.create_index('ix_feed_ranking_hot', 'feed_ranking',
+                    [sa.text('hot DESC'), sa.text('item_type DESC'), sa.text('item_id DESC')])
+
+
+def downgrade():
+    op.drop_index('ix_feed_ranking_hot', table_name='feed_ranking')
+    op.drop_table('feed_ranking')
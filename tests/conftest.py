@@ -0,0 +1,45 @@
+"""
+Shared fixtures for the tests of the Flask Blog application.
+"""
+
+import pytest
+from flaskblog import create_app, db
+from flaskblog.config import TestingConfig
+
+
+class TestConfig(TestingConfig):
+    """
+    Configuration used by the tests. The database URI has to be set before
+    the app is created, since the engine is built in create_app.
+    """
+
+
+# Setup for the test environment
+@pytest.fixture
+def app():
+    """
+    Create and configure a new app instance for each test.
+    """
+    _app = create_app(TestConfig)
+    return _app
+
+@pytest.fixture
+def client(app):
+    """
+    A test client for the app.
+    """
+    with app.test_client() as _client:
+        with app.app_context():
+            db.create_all()
+        yield _client
+
+@pytest.fixture
+def clean_db(app):
+    """
+    Set up a clean database before each test.
+    """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield
+        db.session.remove()
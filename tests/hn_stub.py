@@ -0,0 +1,161 @@
+"""
+A local stub of the Hacker News API for tests and benchmarks.
+
+It serves /v0/topstories.json, /v0/updates.json and /v0/item/<id>.json over
+keep-alive HTTP/1.1 from an in-memory dict of items, counts the connections
+it accepts, and can inject latency and transient failures. Any other path
+can be given a canned response, e.g. the articles the items link to.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ITEM_PATH = re.compile(r'^/v0/item/(\d+)\.json$')
+
+
+def make_story(item_id, time=1700000000, **fields):
+    """
+    Build a story item the way the Hacker News API returns it.
+    """
+    story = {
+        'by': f'user{item_id}',
+        'descendants': 0,
+        'id': item_id,
+        'score': 1,
+        'time': time + item_id,
+        'title': f'Story {item_id}',
+        'type': 'story',
+        'url': f'https://example.com/{item_id}',
+    }
+    story.update(fields)
+    return story
+
+
+class StubHNServer:
+    """
+    Stub Hacker News API server running on a background thread.
+
+    Usage:
+        with StubHNServer(items) as server:
+            app.config['HN_API_URL'] = server.url
+    """
+
+    def __init__(self, items=None, top_ids=None, latency=0.0):
+        self.items = dict(items or {})
+        self.top_ids = top_ids
+        self.updated_ids = []
+        self.pages = {}
+        self.latency = latency
+        self.failures = {}
+        self.connections = 0
+        self.requests = []
+        self.hosts = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def origin(self):
+        """
+        Scheme, host and port of the stub, for the paths in pages.
+        """
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def page(self, path, body, status=200, content_type='text/html; charset=utf-8', headers=None):
+        """
+        Serve a canned response at path.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.pages[path] = (status, dict({'Content-Type': content_type}, **(headers or {})), body)
+
+    @property
+    def url(self):
+        """
+        Base URL of the stub API, to be used as HN_API_URL.
+        """
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/v0'
+
+    def fail(self, path, times=1, status=500):
+        """
+        Make the next `times` requests to path fail with the given status.
+        """
+        self.failures[path] = [status] * times
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Request handler serving the stub API.
+            """
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock: # pylint: disable=protected-access
+                    stub.connections += 1
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                pass
+
+            def do_GET(self): # pylint: disable=invalid-name
+                """
+                Serve one API request.
+                """
+                with stub._lock: # pylint: disable=protected-access
+                    stub.requests.append(self.path)
+                    stub.hosts.append(self.headers.get('Host'))
+                    failures = stub.failures.get(self.path)
+                    status = failures.pop() if failures else None
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                if status:
+                    self._send(status, {'error': 'injected failure'})
+                    return
+
+                match = ITEM_PATH.match(self.path)
+                if self.path in stub.pages:
+                    self._send_page(*stub.pages[self.path])
+                elif self.path == '/v0/topstories.json':
+                    top_ids = stub.top_ids if stub.top_ids is not None else sorted(stub.items)
+                    self._send(200, top_ids)
+                elif self.path == '/v0/updates.json':
+                    self._send(200, {'items': stub.updated_ids, 'profiles': []})
+                elif match:
+                    self._send(200, stub.items.get(int(match.group(1))))
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def _send_page(self, status, headers, body):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if status not in (204, 304):
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
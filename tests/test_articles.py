@@ -0,0 +1,135 @@
+"""
+Tests for the article fetcher and the compressed, deferred news content.
+"""
+
+import asyncio
+import gzip
+
+from sqlalchemy import event
+
+from flaskblog import create_app, db
+from flaskblog.articles import ArticleFetcher, address_checker, extract_text
+from flaskblog.models import NewsItem, save_news_to_db
+from tests.conftest import TestConfig
+from tests.hn_stub import StubHNServer, make_story
+
+ARTICLE = """<html><head><title>T</title><style>p {color: red}</style></head>
+<body><nav>Home | About</nav><article><h1>Fast SQLite</h1>
+<p>WAL mode lets   readers run
+alongside a writer.</p><script>track()</script><p>Checkpoints &amp; fsync.</p></article>
+<footer>Copyright</footer></body></html>"""
+
+# Network of the stub server, which the fetcher refuses unless allowed
+LOOPBACK = ('127.0.0.0/8',)
+
+
+def test_extract_text():
+    """
+    Test that navigation, scripts and styles are left out of the text.
+    """
+    assert extract_text(ARTICLE) == (
+        'Fast SQLite\nWAL mode lets readers run alongside a writer.\nCheckpoints & fsync.'
+    )
+    assert extract_text(ARTICLE, max_chars=11) == 'Fast SQLite'
+
+
+def test_fetcher_limits():
+    """
+    Test redirects, the size cap, non-HTML responses and the deadline.
+    """
+    with StubHNServer() as server:
+        server.page('/a', ARTICLE)
+        server.page('/moved', '', status=301, headers={'Location': '/a'})
+        server.page('/big', 'x' * 5000)
+        server.page('/gzip-bomb', gzip.compress(b'<p>' + b'x' * 100_000),
+                    headers={'Content-Encoding': 'gzip'})
+        server.page('/pdf', b'%PDF', content_type='application/pdf')
+        urls = {i: server.origin + path for i, path in
+                enumerate(['/a', '/moved', '/big', '/gzip-bomb', '/pdf', '/missing'])}
+
+        async def fetch():
+            async with ArticleFetcher(max_bytes=4000, allowed_networks=LOOPBACK) as fetcher:
+                return await fetcher.fetch_many(urls)
+        texts = asyncio.run(fetch())
+
+        assert texts[0].startswith('Fast SQLite') and texts[1] == texts[0]
+        assert texts[2] is None and texts[3] is None and texts[4] is None and texts[5] is None
+
+        server.latency = 0.5
+
+        async def fetch_late():
+            async with ArticleFetcher(deadline=0.1, allowed_networks=LOOPBACK) as fetcher:
+                return await fetcher.fetch_many({9: server.origin + '/a'})
+        assert asyncio.run(fetch_late()) == {}
+
+
+def test_fetcher_refuses_non_public_addresses():
+    """
+    Test that the fetcher does not connect to loopback, private or
+    link-local addresses, neither directly nor through a redirect.
+    """
+    allowed = address_checker()
+    assert allowed('93.184.216.34') and allowed('2606:2800:220:1:248:1893:25c8:1946')
+    for address in ('127.0.0.1', '10.1.2.3', '192.168.0.1', '169.254.169.254', '::1',
+                    'fe80::1%eth0', '::ffff:10.0.0.1', '100.64.0.1', '0.0.0.0', '224.0.0.1'):
+        assert not allowed(address), address
+    assert address_checker(LOOPBACK)('127.0.0.1') and not address_checker(LOOPBACK)('10.0.0.1')
+
+    with StubHNServer() as server:
+        server.page('/a', ARTICLE)
+        server.page('/internal', '', status=302, headers={'Location': 'http://10.0.0.1/admin'})
+        server.page('/metadata', '', status=302, headers={'Location': 'http://169.254.169.254/'})
+
+        async def fetch(urls, **options):
+            async with ArticleFetcher(timeout=2, **options) as fetcher:
+                texts = await fetcher.fetch_many(urls)
+                return texts, fetcher.pool.connections_opened
+        texts, opened = asyncio.run(fetch({1: server.origin + '/a'}))
+        assert texts == {1: None} and opened == 0
+
+        texts, opened = asyncio.run(fetch({1: server.origin + '/internal', 2: server.origin + '/metadata'},
+                                          allowed_networks=LOOPBACK))
+        assert texts == {1: None, 2: None} and opened >= 1
+        assert server.requests.count('/internal') == 1
+
+
+def test_ingestion_stores_compressed_deferred_content():
+    """
+    Test that the sync downloads the articles, stores them compressed and
+    that the feed queries never load them.
+    """
+    class ContentConfig(TestConfig):
+        """
+        Ingestion with the content stage on.
+        """
+        CONTENT_FETCH_ENABLED = True
+        CONTENT_ALLOWED_NETWORKS = LOOPBACK
+
+    with StubHNServer({1: make_story(1), 2: make_story(2)}) as server:
+        server.items[1]['url'] = server.origin + '/article/1'
+        server.items[2]['url'] = server.origin + '/article/2'
+        server.page('/article/1', ARTICLE * 20)
+        server.page('/article/2', 'Not found', status=404)
+        app = create_app(ContentConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            first, second = NewsItem.query.order_by(NewsItem.id).all()
+            assert 'content' not in first.__dict__
+            assert first.article_text.startswith('Fast SQLite')
+            assert len(first.content) < len(first.article_text) / 5
+            assert second.content is None and second.content_fetched_at is not None
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda *args: statements.append(args[2]))
+            client = app.test_client()
+            client.get('/home').get_data()
+            client.get('/newsfeed').get_data()
+            client.get('/home?sort=hot').get_data()
+            assert statements and not any('news_item.content' in sql for sql in statements)
+
+            data = client.get('/news/1/content').get_json()
+            assert data['content'].startswith('Fast SQLite')
+            assert client.get('/news/99/content').status_code == 404
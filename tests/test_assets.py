@@ -0,0 +1,65 @@
+"""
+Tests for the fingerprinted static assets.
+"""
+
+import gzip
+
+from flask import Flask, url_for
+
+from flaskblog.assets import Assets, fingerprint, precompress
+
+
+def test_layout_links_fingerprinted_assets(client):
+    """
+    Test that the layout links main.css by its content hash, served for a
+    year as immutable, and that the plain name is still served.
+    """
+    page = client.get('/home').get_data(as_text=True)
+    with open(client.application.static_folder + '/main.css', 'rb') as css:
+        hashed = fingerprint('main.css', css.read())
+    assert f'/static/{hashed}' in page
+    assert 'https://code.jquery.com/jquery-3.6.0.min.js' in page
+
+    response = client.get(f'/static/{hashed}')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert response.cache_control.max_age == 31536000
+    assert response.cache_control.immutable and response.cache_control.public
+    response.close()
+
+    plain = client.get('/static/main.css')
+    assert plain.status_code == 200 and not plain.cache_control.immutable
+    plain.close()
+
+
+def test_precompressed_copies(tmp_path):
+    """
+    Test that build-assets writes a gzip copy of the larger text assets only,
+    and that it is sent to the clients accepting gzip.
+    """
+    (tmp_path / 'app.js').write_text('console.log("compressible");\n' * 100)
+    (tmp_path / 'tiny.css').write_text('body { margin: 0; }')
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG' * 500)
+    precompress(str(tmp_path), min_size=500)
+    assert (tmp_path / 'app.js.gz').exists()
+    assert not (tmp_path / 'tiny.css.gz').exists() and not (tmp_path / 'logo.png.gz').exists()
+
+    app = Flask(__name__, static_folder=str(tmp_path))
+    app.config['ASSETS_MAX_AGE'] = 60
+    Assets(app)
+    with app.test_request_context():
+        url = url_for('static', filename='app.js')
+    assert url != '/static/app.js'
+
+    client = app.test_client()
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert compressed.mimetype == 'text/javascript'
+    assert gzip.decompress(compressed.data) == (tmp_path / 'app.js').read_bytes()
+    compressed.close()
+
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == (tmp_path / 'app.js').read_bytes()
+    plain.close()
@@ -0,0 +1,144 @@
+"""
+Tests for the feed response cache.
+"""
+
+import time
+from datetime import datetime
+
+from flaskblog import cache, create_app, db
+from flaskblog.cache import LRUCache
+from flaskblog.models import User, Post, refresh_rankings
+from tests.conftest import TestConfig
+
+
+def test_lru_cache_bounds():
+    """
+    Test that the LRU evicts the least recently used entry and expires old ones.
+    """
+    lru = LRUCache(maxsize=2, ttl=0.05)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+    time.sleep(0.06)
+    assert lru.get('a') is None
+
+
+def test_etag_and_not_modified(client):
+    """
+    Test that repeat requests with If-None-Match get an empty 304. The first
+    response is streamed, so the ETag comes with the cached copy.
+    """
+    client.get('/newsfeed').get_data()
+    etag = client.get('/newsfeed').headers['ETag']
+    assert etag and not etag.startswith('W/')
+
+    second = client.get('/newsfeed', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+
+
+def test_writes_invalidate_cached_feed(client):
+    """
+    Test that creating a post invalidates the cached feed.
+    """
+    before = client.get('/newsfeed').get_json()
+    assert before['items'] == []
+
+    with client.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'cache@example.com'}
+    client.post('/create_post', data={'title': 'Fresh', 'content': 'Body'})
+
+    after = client.get('/newsfeed').get_json()
+    assert [item['title'] for item in after['items']] == ['Fresh']
+
+
+def test_shared_store_invalidates_other_workers(tmp_path):
+    """
+    Test that a write in one app invalidates the pages cached by another app
+    sharing the same cache file, like two worker processes would.
+    """
+    class SharedConfig(TestConfig):
+        """
+        Both apps use the same database and cache files.
+        """
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'site.db'}"
+        FEED_CACHE_PATH = str(tmp_path / 'cache.db')
+
+    worker_a, worker_b = create_app(SharedConfig), create_app(SharedConfig)
+    with worker_a.app_context():
+        db.create_all()
+        db.session.add(User(email='shared@example.com'))
+        db.session.commit()
+
+    client_b = worker_b.test_client()
+    assert client_b.get('/newsfeed').get_json()['items'] == []
+
+    client_a = worker_a.test_client()
+    with client_a.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'shared@example.com'}
+    client_a.post('/create_post', data={'title': 'Shared', 'content': 'Body'})
+
+    assert [item['title'] for item in client_b.get('/newsfeed').get_json()['items']] == ['Shared']
+    with worker_b.app_context():
+        assert Post.query.count() == 1
+
+
+def test_recent_writer_bypasses_cache(client):
+    """
+    Test that a session that has just written is not served a cached page,
+    which another worker may have cached before the write.
+    """
+    with client.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'cache@example.com'}
+    assert client.get('/newsfeed').get_json()['items'] == []
+
+    # Written through another worker: this one's cache is not invalidated
+    with client.application.app_context():
+        db.session.add(Post(title='Elsewhere', content='Body', user_email='cache@example.com'))
+        db.session.commit()
+    assert client.get('/newsfeed').get_json()['items'] == []
+
+    with client.session_transaction() as session:
+        session['_last_write'] = time.time()
+    assert [item['title'] for item in client.get('/newsfeed').get_json()['items']] == ['Elsewhere']
+
+
+def test_feed_cards_are_rendered_once_per_version(client):
+    """
+    Test that the home feed reuses the rendered card of an unchanged item
+    and renders it again once the row changes.
+    """
+    with client.application.app_context():
+        db.session.add(Post(id=1, title='Card title', content='Card body', user_email='card@example.com',
+                            sort_key=1700000000))
+        db.session.commit()
+        fragments = client.application.extensions['response_cache'].fragments
+
+    assert b'Card title' in client.get('/home').data
+    (version, card), = [fragments.get(('feed_card', 'post', 1, None))]
+    assert b'Card title' in client.get('/home').data
+    assert fragments.get(('feed_card', 'post', 1, None))[1] is card
+
+    with client.application.app_context():
+        db.session.get(Post, 1).title = 'Edited title'
+        db.session.commit()
+        cache.invalidate()
+    page = client.get('/home').data
+    assert b'Edited title' in page and b'Card title' not in page
+    assert fragments.get(('feed_card', 'post', 1, None))[0] != version
+
+
+def test_feed_rows_carry_the_display_time(client):
+    """
+    Test that the feed queries format the time of the cards, new and hot.
+    """
+    with client.application.app_context():
+        db.session.add(Post(id=1, title='Timed', content='Body', user_email='time@example.com',
+                            sort_key=1700000000))
+        db.session.commit()
+        refresh_rankings()
+    posted = datetime.fromtimestamp(1700000000).strftime('%Y-%m-%d %H:%M')
+    for path in ('/home', '/home?sort=hot'):
+        assert f'<strong>Time:</strong> {posted}</p>' in client.get(path).get_data(as_text=True), path
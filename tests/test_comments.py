@@ -0,0 +1,137 @@
+"""
+Tests for the comment tree ingestion and the thread endpoint.
+"""
+
+from flaskblog import create_app, db
+from flaskblog.models import Comment, NewsItem, save_comments_to_db, save_news_to_db
+from tests.conftest import TestConfig
+from tests.hn_stub import StubHNServer, make_story
+
+
+def make_comment(item_id, parent, kids=(), **fields):
+    """
+    Build a comment item the way the Hacker News API returns it.
+    """
+    comment = {'by': f'user{item_id}', 'id': item_id, 'parent': parent,
+               'text': f'Comment {item_id}', 'time': 1700000000 + item_id, 'type': 'comment'}
+    if kids:
+        comment['kids'] = list(kids)
+    comment.update(fields)
+    return comment
+
+
+def item_requests(server):
+    """
+    Return the ids of the items requested from the stub so far.
+    """
+    return sorted(int(path.rsplit('/', 1)[1].split('.')[0])
+                  for path in server.requests if '/item/' in path)
+
+
+def test_comment_tree_ingestion_and_delta():
+    """
+    Test that the trees are stored with paths in thread order, and that a
+    re-ingestion only downloads the changed comments and the new subtrees.
+    """
+    items = {
+        1: make_story(1, kids=[10, 11], descendants=4),
+        10: make_comment(10, 1, kids=[12, 13]),
+        11: make_comment(11, 1),
+        12: make_comment(12, 10),
+        13: {'id': 13, 'parent': 10, 'deleted': True, 'time': 1700000013, 'type': 'comment'},
+    }
+    with StubHNServer(items, top_ids=[1]) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            assert save_comments_to_db() == 4
+
+            thread = app.test_client().get('/thread/1').get_json()
+            assert [c['id'] for c in thread['comments']] == [10, 12, 13, 11]
+            assert [c['depth'] for c in thread['comments']] == [0, 1, 1, 0]
+            assert thread['comments'][2]['deleted'] and thread['comments'][2]['text'] is None
+            assert db.session.get(NewsItem, 1).comments_synced == 4
+
+            # Nothing changed: no item is downloaded
+            server.requests.clear()
+            assert save_comments_to_db() == 0
+            assert item_requests(server) == []
+
+            # A reply to 11 and a new top-level comment with a reply
+            server.items[11]['kids'] = [14]
+            server.items[14] = make_comment(14, 11)
+            server.items[1].update(kids=[15, 10, 11], descendants=7)
+            server.items[15] = make_comment(15, 1, kids=[16])
+            server.items[16] = make_comment(16, 15)
+            server.updated_ids = [1, 11]
+            save_news_to_db()
+            server.requests.clear()
+            assert save_comments_to_db() == 4
+            assert item_requests(server) == [11, 14, 15, 16]
+
+            client = app.test_client()
+            thread = client.get('/thread/1').get_json()
+            assert [c['id'] for c in thread['comments']] == [10, 12, 13, 11, 14, 15, 16]
+            assert Comment.query.filter_by(story_id=1).count() == 7
+
+            app.config['THREAD_PAGE_SIZE'] = 3
+            page = client.get('/thread/1?compact=1').get_json()
+            assert [c['id'] for c in page['comments']] == [10, 12, 13]
+            page = client.get(f"/thread/1?after={page['next_after']}").get_json()
+            assert [c['id'] for c in page['comments']] == [11, 14, 15]
+            assert client.get('/thread/99').status_code == 404
+
+
+def test_reply_missing_from_updates_feed():
+    """
+    Test that a nested reply to a stored comment is downloaded even when
+    the updates feed does not list its parent.
+    """
+    items = {
+        1: make_story(1, kids=[10], descendants=2),
+        10: make_comment(10, 1, kids=[11]),
+        11: make_comment(11, 10),
+    }
+    with StubHNServer(items, top_ids=[1]) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            assert save_comments_to_db() == 2
+
+            server.items[11]['kids'] = [12]
+            server.items[12] = make_comment(12, 11)
+            server.items[1]['descendants'] = 3
+            server.updated_ids = [1]
+            save_news_to_db()
+            server.requests.clear()
+            assert save_comments_to_db() == 3
+            assert item_requests(server) == [10, 11, 12]
+            assert [c.id for c in Comment.query.order_by(Comment.path)] == [10, 11, 12]
+            assert db.session.get(NewsItem, 1).comments_synced == 3
+
+
+def test_comment_limit_leaves_story_unsynced():
+    """
+    Test that a walk cut short by HN_MAX_COMMENTS is resumed by the next run.
+    """
+    items = {
+        1: make_story(1, kids=[10], descendants=2),
+        10: make_comment(10, 1, kids=[11]),
+        11: make_comment(11, 10),
+    }
+    with StubHNServer(items, top_ids=[1]) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        app.config['HN_MAX_COMMENTS'] = 1
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            assert save_comments_to_db() == 1
+            assert db.session.get(NewsItem, 1).comments_synced is None
+            assert save_comments_to_db() == 1
+            assert db.session.get(NewsItem, 1).comments_synced == 2
+            assert [c.id for c in Comment.query.order_by(Comment.path)] == [10, 11]
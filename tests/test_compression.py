@@ -0,0 +1,67 @@
+"""
+Tests for the compression of the dynamic responses.
+"""
+
+import gzip
+import json
+
+from flaskblog import db
+from flaskblog.models import Post
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def add_posts(app, count):
+    """
+    Add count posts.
+    """
+    with app.app_context():
+        db.session.add_all(Post(id=number, title=f'Post {number}', content='Some words ' * 20,
+                                user_email='compress@example.com', sort_key=1700000000 + number)
+                           for number in range(1, count + 1))
+        db.session.commit()
+
+
+def test_cached_page_is_compressed_with_weak_etag(client):
+    """
+    Test that a page is gzipped for a client accepting it, keeps its ETag as
+    a weak one that still answers If-None-Match, and is left alone otherwise.
+    """
+    add_posts(client.application, 5)
+    plain = client.get('/home')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.vary
+
+    compressed = client.get('/home', headers=GZIP)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert int(compressed.headers['Content-Length']) == len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data) == plain.data
+    etag = compressed.headers['ETag']
+    assert etag.startswith('W/') and etag[2:] == plain.headers['ETag']
+
+    revalidated = client.get('/home', headers=dict(GZIP, **{'If-None-Match': etag}))
+    assert revalidated.status_code == 304 and revalidated.data == b''
+
+
+def test_streamed_feed_is_compressed(client):
+    """
+    Test that the streamed newsfeed is compressed as it is generated.
+    """
+    add_posts(client.application, 30)
+    response = client.get('/newsfeed', headers=GZIP)
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    items = json.loads(gzip.decompress(response.data))['items']
+    assert len(items) == 30
+
+
+def test_small_responses_are_not_compressed(client):
+    """
+    Test that a body under COMPRESS_MIN_SIZE is sent as it is.
+    """
+    client.get('/newsfeed').get_data()
+    response = client.get('/newsfeed', headers=GZIP)
+    assert len(response.data) < client.application.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'items': [], 'next_cursor': None}
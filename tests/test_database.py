@@ -0,0 +1,163 @@
+"""
+Tests for the config profiles and the SQLite engine set up.
+"""
+
+import os
+
+import pytest
+from sqlalchemy import text
+
+from flaskblog import auth0, create_app, db
+from flaskblog.config import BenchmarkConfig, ProductionConfig, TestingConfig
+from flaskblog.database import parse_pragmas, pragma_statements, sync_replica
+from flaskblog.models import Post, User
+
+
+def test_file_database_pragmas(tmp_path):
+    """
+    Test that new connections of a file database run in WAL mode with the
+    configured pragmas and that the pool options reach the engine.
+    """
+    class FileConfig(ProductionConfig):
+        """
+        The production profile on a scratch file.
+        """
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'site.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            assert connection.execute(text('PRAGMA temp_store')).scalar() == 2
+            assert connection.execute(text('PRAGMA cache_size')).scalar() == -64000
+        assert db.engine.pool.size() == 10
+        db.engine.dispose()
+
+
+def test_profile_from_environment(monkeypatch, tmp_path):
+    """
+    Test that APP_CONFIG selects the profile and that DATABASE_URL and
+    SQLITE_PRAGMAS override its settings.
+    """
+    url = f"sqlite:///{tmp_path / 'env.db'}"
+    monkeypatch.setenv('APP_CONFIG', 'benchmark')
+    monkeypatch.setenv('DATABASE_URL', url)
+    monkeypatch.setenv('SQLITE_PRAGMAS', 'synchronous=OFF,busy_timeout=100')
+
+    app = create_app()
+    assert app.config['FEED_CACHE_ENABLED'] is BenchmarkConfig.FEED_CACHE_ENABLED
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == url
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 0
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 100
+        db.engine.dispose()
+
+    # The test suite never follows DATABASE_URL
+    assert create_app(TestingConfig).config['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///:memory:'
+
+
+def test_pragma_parsing():
+    """
+    Test the parsing and validation of pragma settings.
+    """
+    assert parse_pragmas(' cache_size=-2000, ,temp_store=MEMORY') == {
+        'cache_size': '-2000', 'temp_store': 'MEMORY'
+    }
+    assert pragma_statements({'cache_size': -2000}) == ['PRAGMA cache_size=-2000']
+    with pytest.raises(ValueError):
+        pragma_statements({'journal_mode': 'WAL; DROP TABLE post'})
+
+
+def test_replica_routing(tmp_path):
+    """
+    Test that the read-only views read from the replica, that writes go to
+    the primary and that a user sees their own write right away.
+    """
+    class ReplicaConfig(TestingConfig):
+        """
+        A primary and a replica SQLite file.
+        """
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        READ_REPLICA_URI = f"sqlite:///{tmp_path / 'replica.db'}"
+        FEED_CACHE_ENABLED = False
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='writer@example.com', name='Writer'))
+        db.session.add(Post(title='Synced post', content='Body', user_email='writer@example.com'))
+        db.session.commit()
+        assert sync_replica(db)
+        db.session.add(Post(title='Unsynced post', content='Body', user_email='writer@example.com'))
+        db.session.commit()
+
+    reader = app.test_client()
+    page = reader.get('/home').get_data(as_text=True)
+    assert 'Synced post' in page and 'Unsynced post' not in page
+    titles = [item['title'] for item in reader.get('/newsfeed').get_json()['items']]
+    assert titles == ['Synced post']
+
+    writer = app.test_client()
+    with writer.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'writer@example.com'}
+    response = writer.post('/create_post', data={'title': 'Fresh post', 'content': 'Body'})
+    assert response.status_code == 302
+    page = writer.get('/home').get_data(as_text=True)
+    assert 'Fresh post' in page and 'Unsynced post' in page
+    assert 'Fresh post' not in reader.get('/home').get_data(as_text=True)
+
+    with app.app_context():
+        with db.engines['replica'].connect() as connection:
+            assert connection.execute(text('PRAGMA query_only')).scalar() == 1
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_drops_inherited_connections(tmp_path):
+    """
+    Test that a process forked after the app opened connections, like a
+    gunicorn worker of a preloaded app, starts with an empty pool.
+    """
+    class FileConfig(TestingConfig):
+        """
+        The testing profile on a scratch file.
+        """
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'site.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        assert db.engine.pool.checkedin() == 1
+
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_end, str(db.engine.pool.checkedin()).encode('ascii'))
+            finally:
+                os._exit(0) # pylint: disable=protected-access
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as pipe:
+            assert pipe.read() == b'0'
+        os.waitpid(pid, 0)
+        assert db.engine.pool.checkedin() == 1
+        db.engine.dispose()
+
+
+def test_serving_app_defers_optional_setup():
+    """
+    Test that the WSGI app leaves out the migration commands and that the
+    Auth0 client is only registered on first use.
+    """
+    app = create_app(TestingConfig, migrations=False)
+    assert 'migrate' not in app.extensions and 'db' not in app.cli.commands
+    assert app.extensions['auth0'] is None
+    with app.app_context():
+        client = auth0.client
+        assert client.name == 'auth0' and auth0.client is client
+    assert 'migrate' in create_app(TestingConfig).extensions
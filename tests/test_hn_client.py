@@ -0,0 +1,177 @@
+"""
+Tests for the asyncio Hacker News client and the news ingestion, run
+against a local stub of the Hacker News API.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+from flaskblog import create_app, db
+from flaskblog.hn_client import ConnectionPool, HNClient, HNClientError, host_header
+from flaskblog.models import NewsItem, save_news_to_db
+from tests.hn_stub import StubHNServer, make_story
+from tests.conftest import TestConfig
+
+
+def fetch_items(client, item_ids):
+    """
+    Run a bulk fetch to completion and close the client.
+    """
+    async def fetch():
+        async with client:
+            return await client.items(item_ids)
+    return asyncio.run(fetch())
+
+
+def test_bulk_fetch_reuses_pooled_connections():
+    """
+    Test that hundreds of items are fetched over a few keep-alive connections.
+    """
+    items = {i: make_story(i) for i in range(1, 301)}
+    with StubHNServer(items) as server:
+        client = HNClient(server.url, concurrency=20, per_host_limit=5)
+        started = time.monotonic()
+        results = fetch_items(client, list(items))
+        elapsed = time.monotonic() - started
+
+    assert [item['id'] for item in results] == list(items)
+    assert server.connections <= 5
+    assert elapsed < 5
+
+
+def test_retries_transient_failures():
+    """
+    Test that a failing request is retried with backoff.
+    """
+    with StubHNServer({1: make_story(1)}) as server:
+        server.fail('/v0/item/1.json', times=2, status=503)
+        client = HNClient(server.url, retries=3, backoff=0.01)
+        assert fetch_items(client, [1])[0]['id'] == 1
+
+        server.fail('/v0/topstories.json', times=5, status=500)
+        client = HNClient(server.url, retries=1, backoff=0.01)
+
+        async def fetch_ids():
+            async with client:
+                return await client.top_story_ids()
+        with pytest.raises(HNClientError):
+            asyncio.run(fetch_ids())
+
+
+def test_corrupt_compressed_bodies_fail_the_item():
+    """
+    Test that a truncated gzip or an invalid deflate body fails only its item.
+    """
+    body = gzip.compress(json.dumps(make_story(1)).encode('utf-8'))
+    with StubHNServer({3: make_story(3)}) as server:
+        server.page('/v0/item/1.json', body[:-8], content_type='application/json',
+                    headers={'Content-Encoding': 'gzip'})
+        server.page('/v0/item/2.json', b'not deflate', content_type='application/json',
+                    headers={'Content-Encoding': 'deflate'})
+        client = HNClient(server.url, retries=1, backoff=0.01)
+        results = fetch_items(client, [1, 2, 3])
+
+    assert results[:2] == [None, None]
+    assert results[2]['id'] == 3
+
+
+def test_host_header_leaves_out_userinfo():
+    """
+    Test that the Host header carries the host and a non-default port only.
+    """
+    with StubHNServer({1: make_story(1)}) as server:
+        client = HNClient(server.url.replace('http://', 'http://user:secret@'))
+        assert fetch_items(client, [1])[0]['id'] == 1
+        assert server.hosts == [server.origin.removeprefix('http://')]
+    assert host_header('example.com', 443, 443) == 'example.com'
+    assert host_header('example.com', 8443, 443) == 'example.com:8443'
+    assert host_header('::1', 8080, 80) == '[::1]:8080'
+
+
+def test_bodyless_responses_are_not_read_to_eof():
+    """
+    Test that a 204 or 304 without Content-Length is read as empty at once
+    and leaves the keep-alive connection usable.
+    """
+    async def fetch(pool, urls):
+        try:
+            return [await pool.request(url) for url in urls]
+        finally:
+            await pool.close()
+
+    with StubHNServer({1: make_story(1)}) as server:
+        server.page('/empty', b'', status=204)
+        server.page('/cached', b'', status=304)
+        pool = ConnectionPool(timeout=2)
+        started = time.monotonic()
+        responses = asyncio.run(fetch(pool, [f'{server.origin}/empty', f'{server.origin}/cached',
+                                             f'{server.url}/item/1.json']))
+        elapsed = time.monotonic() - started
+
+    assert [(response.status, response.body) for response in responses[:2]] == [(204, b''), (304, b'')]
+    assert responses[2].json()['id'] == 1
+    assert elapsed < 1 and pool.connections_opened == 1
+
+
+def test_deadline_returns_partial_results():
+    """
+    Test that items still pending at the deadline come back as None.
+    """
+    with StubHNServer({i: make_story(i) for i in range(1, 5)}, latency=0.5) as server:
+        client = HNClient(server.url, concurrency=1, deadline=0.7, timeout=2)
+        results = fetch_items(client, [1, 2, 3, 4])
+
+    assert results[0]['id'] == 1
+    assert results[-1] is None
+
+
+def test_save_news_to_db():
+    """
+    Test that the ingestion stores the top stories served by the stub.
+    """
+    items = {i: make_story(i, kids=[i * 10, i * 10 + 1]) for i in range(1, 41)}
+    with StubHNServer(items) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            stored = NewsItem.query.order_by(NewsItem.id).all()
+
+    assert len(stored) == app.config['HN_TOP_STORIES']
+    assert stored[0].kids == '10,11'
+    assert stored[0].sort_key == items[1]['time']
+
+
+def test_delta_sync_refreshes_changed_items():
+    """
+    Test that the delta sync only downloads new and changed items and
+    updates the stored rows in place.
+    """
+    items = {i: make_story(i) for i in range(1, 6)}
+    with StubHNServer(items) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            assert NewsItem.query.count() == 5
+
+            server.items[3] = make_story(3, score=99, descendants=7, kids=[31])
+            server.items[6] = make_story(6)
+            server.updated_ids = [3, 1000]
+            server.requests.clear()
+            save_news_to_db()
+
+            fetched = sorted(path for path in server.requests if '/item/' in path)
+            assert fetched == ['/v0/item/3.json', '/v0/item/6.json']
+            item = db.session.get(NewsItem, 3)
+            assert (item.score, item.descendants, item.kids) == (99, 7, '31')
+            assert NewsItem.query.count() == 6
+
+            server.requests.clear()
+            save_news_to_db(delta=False)
+            assert len([path for path in server.requests if '/item/' in path]) == 6
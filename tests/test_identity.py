@@ -0,0 +1,67 @@
+"""
+Tests for the identity of the logged-in user.
+"""
+
+from flaskblog import db
+from flaskblog.models import User, upsert_login_user
+from tests.test_query_budgets import sql_count
+
+
+def login(client, email):
+    """
+    Create a user and log the client in as them.
+    """
+    with client.application.app_context():
+        user = User(email=email, name='Old name', nickname='old', role='User')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': email}
+    return user_id
+
+
+def test_user_is_cached_and_invalidated_by_writes(client):
+    """
+    Test that the user is resolved by id once and read from the cache
+    afterwards, and that the profile and update_user writes refresh it.
+    """
+    login(client, 'identity@example.com')
+    first = client.get('/settings')
+    second = client.get('/settings')
+    assert b'Old name' in second.data
+    assert sql_count(second) == sql_count(first) - 1
+
+    client.post('/update_profile', data={'name': 'New name', 'nickname': 'new'})
+    page = client.get('/settings')
+    assert b'New name' in page.data and b'Old name' not in page.data
+
+    assert client.get('/admin/items').status_code == 403
+    client.post('/update_user', json={'email': 'identity@example.com', 'role': 'Admin'})
+    assert client.get('/admin/items').status_code == 200
+
+
+def test_missing_user(client):
+    """
+    Test that a session of a deleted user resolves to nobody.
+    """
+    user_id = login(client, 'gone@example.com')
+    with client.application.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    assert client.get('/settings').status_code == 302
+    assert client.get('/admin/items').status_code == 403
+
+
+def test_login_upsert(app):
+    """
+    Test that a login creates the user once and refreshes the profile after.
+    """
+    with app.app_context():
+        db.create_all()
+        user_id = upsert_login_user('login@example.com', 'Name', 'nick', None)
+        db.session.commit()
+        assert upsert_login_user('login@example.com', 'Renamed', 'nick', 'pic.png') == user_id
+        db.session.commit()
+        user = db.session.get(User, user_id)
+        assert (user.name, user.picture, user.role) == ('Renamed', 'pic.png', 'User')
@@ -0,0 +1,58 @@
+"""
+Tests for the request instrumentation and the /metrics endpoint.
+"""
+
+import logging
+import re
+
+from flaskblog import create_app, db
+from tests.conftest import TestConfig
+
+
+def sql_count(response):
+    """
+    Read the number of SQL statements from the Server-Timing header.
+    """
+    return int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+
+
+def test_server_timing_header(client):
+    """
+    Test that responses report their wall, SQL and template time.
+    """
+    response = client.get('/home')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'tpl;dur=' in timing
+    assert sql_count(response) == 1
+
+
+def test_metrics_endpoint(client):
+    """
+    Test that /metrics exposes a latency histogram per endpoint.
+    """
+    client.get('/home')
+    client.get('/about')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'flaskblog_request_duration_seconds_count{endpoint="main.home"} 1' in body
+    assert 'flaskblog_request_duration_seconds_bucket{endpoint="main.about",le="+Inf"} 1' in body
+    assert re.search(r'flaskblog_sql_queries_total\{endpoint="main.home"\} 1\n', body)
+
+
+def test_slow_query_log(caplog):
+    """
+    Test that statements above the threshold are logged and counted.
+    """
+    class SlowConfig(TestConfig):
+        """
+        Every statement counts as slow.
+        """
+        SLOW_QUERY_THRESHOLD_MS = 0
+
+    app = create_app(SlowConfig)
+    with app.app_context():
+        db.create_all()
+    with caplog.at_level(logging.WARNING, logger='flaskblog.metrics'):
+        app.test_client().get('/home')
+    assert any('Slow query' in record.message for record in caplog.records)
+    assert 'flaskblog_slow_queries_total 0' not in app.test_client().get('/metrics').get_data(as_text=True)
@@ -0,0 +1,105 @@
+"""
+Tests for the paginated admin listing and the bulk moderation endpoint.
+"""
+
+from benchmarks.seed import seed
+from flaskblog import db
+from flaskblog.models import FeedRanking, NewsItem, Post, UserInteraction, refresh_rankings
+from flaskblog.search import search_statement
+
+
+def log_in(client, user_id):
+    """
+    Log the client in as one of the seeded users.
+    """
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': f'user{user_id}@example.com'}
+
+
+def test_admin_items_pagination_and_filters(client):
+    """
+    Test that the listing is paged with a cursor, filtered and counted.
+    """
+    with client.application.app_context():
+        seed(news=30, posts=20, users=5, interactions=0)
+    log_in(client, 2)
+    assert client.get('/admin/items').status_code == 403
+
+    log_in(client, 1)
+    seen = []
+    cursor = None
+    while True:
+        data = client.get('/admin/items?limit=15' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        assert data['totals'] == {'news': 30, 'post': 20} and not data['totals_capped']
+        seen.extend((item['type'], item['id']) for item in data['items'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 50
+
+    data = client.get('/admin/items?type=post&author=user2%40example.com').get_json()
+    assert data['totals'] == {'post': 4}
+    assert {item['id'] for item in data['items']} == {1, 6, 11, 16}
+
+    news = client.get('/admin/items?type=news').get_json()['items']
+    since, until = news[9]['datetime'], news[0]['datetime']
+    data = client.get(f'/admin/items?type=news&since={since}&until={until}').get_json()
+    assert [item['id'] for item in data['items']] == [item['id'] for item in news[1:10]]
+
+    client.application.config['ADMIN_COUNT_LIMIT'] = 10
+    data = client.get('/admin/items').get_json()
+    assert data['totals'] == {'news': 10, 'post': 10} and data['totals_capped']
+    assert client.get('/admin/items?type=poll').status_code == 400
+
+
+def test_bulk_moderation(client):
+    """
+    Test that bulk delete removes the items with their interactions, and
+    that hidden items leave the feeds, the hot ranking and the search.
+    """
+    with client.application.app_context():
+        seed(news=10, posts=10, users=5, interactions=40)
+        refresh_rankings()
+        assert UserInteraction.query.filter(UserInteraction.post_id.in_([1, 2])).count()
+    log_in(client, 2)
+    denied = client.post('/admin/moderate', json={'action': 'delete', 'items': [{'id': 1, 'type': 'post'}]})
+    assert denied.status_code == 403
+    denied = client.post('/delete_post', json={'id': 1, 'type': 'post'})
+    assert denied.status_code == 403
+    with client.application.app_context():
+        assert db.session.get(Post, 1) is not None
+
+    log_in(client, 1)
+    for invalid in ({'action': 'purge', 'items': [{'id': 1, 'type': 'post'}]},
+                    {'action': 'delete', 'items': []},
+                    {'action': 'delete', 'items': [{'id': '1', 'type': 'post'}]}):
+        assert client.post('/admin/moderate', json=invalid).status_code == 400
+
+    response = client.post('/admin/moderate', json={'action': 'delete', 'items': [
+        {'id': 1, 'type': 'post'}, {'id': 2, 'type': 'post'}, {'id': 1, 'type': 'news'}
+    ]})
+    assert response.get_json()['changed'] == {'news': 1, 'post': 2}
+
+    response = client.post('/admin/moderate', json={'action': 'hide', 'items': [
+        {'id': 3, 'type': 'post'}, {'id': 2, 'type': 'news'}
+    ]})
+    assert response.get_json()['changed'] == {'news': 1, 'post': 1}
+
+    with client.application.app_context():
+        assert db.session.get(Post, 1) is None and db.session.get(NewsItem, 1) is None
+        assert UserInteraction.query.filter(UserInteraction.post_id.in_([1, 2])).count() == 0
+        assert db.session.get(Post, 3).hidden and db.session.get(NewsItem, 2).hidden
+        refresh_rankings()
+        ranked = {(row.item_type, row.item_id) for row in FeedRanking.query}
+        assert ('post', 3) not in ranked and ('news', 2) not in ranked and ('news', 3) in ranked
+        hits = db.session.execute(search_statement('"synthetic"', 100, 0)).all()
+        assert {(row.is_post, row.id) for row in hits}.isdisjoint({(1, 3), (0, 2)})
+
+    feed = client.get('/newsfeed?limit=100').get_json()['items']
+    assert {(item['type'], item['id']) for item in feed}.isdisjoint({('post', 3), ('story', 2)})
+    assert len(feed) == 15
+    for path in ('/news/2/content', '/thread/2'):
+        assert client.get(path).status_code == 404, path
+    assert client.get('/thread/3').status_code == 200
+    listing = client.get('/admin/items?type=post').get_json()['items']
+    assert [item['hidden'] for item in listing if item['id'] == 3] == [True]
@@ -0,0 +1,125 @@
+"""
+Tests keeping the number of SQL statements per route within the budgets of
+benchmarks/budgets.py, so that N+1 regressions fail the build.
+"""
+
+import re
+
+from benchmarks.budgets import QUERY_BUDGETS
+from benchmarks.seed import seed
+from flaskblog import create_app, db
+from flaskblog.models import NewsItem, Post, User, UserInteraction
+from tests.conftest import TestConfig
+
+
+def sql_count(response):
+    """
+    Read the number of SQL statements from the Server-Timing header.
+    """
+    return int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+
+
+def test_query_budgets(client):
+    """
+    Test that every route stays within its query budget on a seeded database.
+    """
+    with client.application.app_context():
+        seed(news=200, posts=50, users=20, interactions=300)
+        admin = db.session.get(User, 1)
+        admin_id, admin_email = admin.id, admin.email
+
+    with client.session_transaction() as session:
+        session['user'] = {'id': admin_id, 'email': admin_email}
+
+    requests = {
+        'main.home': lambda: client.get('/home'),
+        'main.newsfeed': lambda: client.get('/newsfeed?limit=100'),
+        'main.search': lambda: client.get('/search?q=synthetic+post'),
+        'main.news_content': lambda: client.get('/news/1/content'),
+        'main.thread': lambda: client.get('/thread/1'),
+        'main.settings': lambda: client.get('/settings'),
+        'main.admin_items': lambda: client.get('/admin/items?author=user1%40example.com&since=0'),
+        'main.moderate': lambda: client.post('/admin/moderate', json={
+            'action': 'delete', 'items': [{'id': 2, 'type': 'news'}, {'id': 27, 'type': 'post'}]}),
+        'main.update_interaction': lambda: client.post(
+            '/update_interaction', json={'id': 25, 'action': 'like'}),
+        'main.update_interactions': lambda: client.post('/update_interactions', json={'operations': [
+            {'id': post_id, 'action': 'dislike'} for post_id in range(28, 50)]}),
+        'main.create_post': lambda: client.post(
+            '/create_post', data={'title': 'Budget', 'content': 'Body'}),
+        'main.delete_post': lambda: client.post(
+            '/delete_post', json={'id': 26, 'type': 'post'}),
+    }
+    assert set(requests) == set(QUERY_BUDGETS)
+    for endpoint, send in requests.items():
+        response = send()
+        response.get_data()
+        assert response.status_code in (200, 302), endpoint
+        assert sql_count(response) <= QUERY_BUDGETS[endpoint], endpoint
+
+    # The hot feeds are read from the precomputed ranking
+    for path, endpoint in (('/home?sort=hot', 'main.home'), ('/newsfeed?sort=hot', 'main.newsfeed')):
+        response = client.get(path)
+        response.get_data()
+        assert sql_count(response) <= QUERY_BUDGETS[endpoint], path
+
+
+def test_seed(clean_db):
+    """
+    Test that the seeder writes the requested rows and backfills the counters.
+    """
+    seed(news=30, posts=10, users=5, interactions=40)
+    assert NewsItem.query.count() == 30
+    assert Post.query.count() == 10
+    assert User.query.filter_by(role='Admin').count() == 1
+    assert UserInteraction.query.count() == 40
+    assert sum(post.like_count + post.dislike_count for post in Post.query) == 40
+
+
+class NoFeedCacheConfig(TestConfig):
+    """
+    Feed pages rendered on every request, so that each one runs its queries.
+    """
+    FEED_CACHE_ENABLED = False
+
+
+def test_feed_reactions_cost_one_query():
+    """
+    Test that the reactions of a logged-in user on a 30 item page are read
+    with a single extra query, and end up on the cards and the JSON items.
+    """
+    client = create_app(NoFeedCacheConfig).test_client()
+    with client.application.app_context():
+        db.create_all()
+        seed(news=40, posts=10, users=5, interactions=0)
+    anonymous = {path: client.get(path) for path in ('/home?limit=30', '/newsfeed?limit=30')}
+    items = anonymous['/newsfeed?limit=30'].get_json()['items']
+    assert all(item['reaction'] is None for item in items)
+    post_id = next(item['id'] for item in items if item['type'] == 'post')
+    news_id = next(item['id'] for item in items if item['type'] != 'post')
+
+    with client.application.app_context():
+        db.session.add_all([
+            UserInteraction(user_id=1, target_type='post', post_id=post_id, interaction='like'),
+            UserInteraction(user_id=1, target_type='news', post_id=news_id, interaction='dislike'),
+        ])
+        db.session.commit()
+        user = db.session.get(User, 1)
+        user_id, email = user.id, user.email
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': email}
+
+    home = client.get('/home?limit=30')
+    assert sql_count(home) <= sql_count(anonymous['/home?limit=30']) + 1
+    page = home.get_data(as_text=True)
+    assert re.search(rf'id="like-icon-post-{post_id}" class="fa-solid', page)
+    assert re.search(rf'id="dislike-icon-news-{news_id}" class="fa-solid', page)
+    assert page.count('class="fa-solid') == 2
+
+    feed = client.get('/newsfeed?limit=30')
+    assert sql_count(feed) <= sql_count(anonymous['/newsfeed?limit=30']) + 1
+    reactions = {item['reaction'] for item in feed.get_json()['items']
+                 if (item['type'] == 'post', item['id']) not in ((True, post_id), (False, news_id))}
+    assert reactions == {None}
+    assert {(item['id'], item['reaction']) for item in feed.get_json()['items'] if item['reaction']} == {
+        (post_id, 'like'), (news_id, 'dislike')}
@@ -0,0 +1,74 @@
+"""
+Tests for the precomputed hot ranking and the ?sort=hot feeds.
+"""
+
+import time
+from datetime import datetime
+
+from flaskblog import db
+from flaskblog.models import FeedRanking, NewsItem, Post, refresh_rankings
+
+
+def add_items(now):
+    """
+    Add news items and posts with known points and ages.
+    """
+    hour = 3600
+    db.session.add(NewsItem(id=1, title='Old and popular', score=500, descendants=0, time=now - 48 * hour))
+    db.session.add(NewsItem(id=2, title='Fresh and popular', score=100, descendants=40, time=now - hour))
+    db.session.add(NewsItem(id=3, title='Fresh and ignored', score=1, descendants=0, time=now - hour))
+    db.session.add(Post(id=1, title='Liked post', content='Body', user_email='a@example.com',
+                        like_count=30, date_posted=datetime.utcfromtimestamp(now - 2 * hour)))
+    db.session.commit()
+
+
+def test_hot_feed_order_and_pagination(client):
+    """
+    Test that the hot feed follows the gravity formula and pages with its cursor.
+    """
+    now = int(time.time())
+    with client.application.app_context():
+        add_items(now)
+        assert refresh_rankings(now) == 4
+
+    titles = []
+    cursor = None
+    while True:
+        query = {'sort': 'hot', 'limit': 1}
+        if cursor:
+            query['cursor'] = cursor
+        data = client.get('/newsfeed', query_string=query).get_json()
+        titles += [item['title'] for item in data['items']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert titles == ['Fresh and popular', 'Liked post', 'Old and popular', 'Fresh and ignored']
+
+    page = client.get('/home?sort=hot').get_data(as_text=True)
+    assert page.index('Fresh and popular') < page.index('Liked post') < page.index('Old and popular')
+    assert client.get('/newsfeed?sort=top').status_code == 400
+
+
+def test_incremental_refresh(client):
+    """
+    Test that a pass only rewrites the scores whose inputs changed or aged,
+    and drops the scores of deleted items.
+    """
+    now = int(time.time())
+    with client.application.app_context():
+        add_items(now)
+        refresh_rankings(now)
+        assert refresh_rankings(now + 1) == 0
+
+        db.session.get(Post, 1).like_count = 31
+        db.session.commit()
+        assert refresh_rankings(now + 2) == 1
+
+        # Past the refresh interval only the items within the window are rescored
+        later = now + client.application.config['RANKING_REFRESH_INTERVAL'] + 10
+        assert refresh_rankings(later) == 3
+
+        NewsItem.query.filter_by(id=3).delete()
+        db.session.commit()
+        refresh_rankings(later)
+        assert db.session.get(FeedRanking, ('news', 3)) is None
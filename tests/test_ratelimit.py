@@ -0,0 +1,180 @@
+"""
+Tests for the rate limiting and load shedding of the write endpoints.
+"""
+
+import time
+
+import pytest
+
+from flaskblog import create_app, db
+from flaskblog.ratelimit import LoadShedder, MemoryBuckets, SQLiteBuckets
+from tests.conftest import TestConfig
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_token_bucket(tmp_path, shared):
+    """
+    Test that a bucket allows a burst, then refills at its rate.
+    """
+    buckets = SQLiteBuckets(str(tmp_path / 'limits.db')) if shared else MemoryBuckets()
+    assert [buckets.take('key', 2, 1.0, 100.0) for _ in range(3)] == [0, 0, 1.0]
+    assert buckets.take('key', 2, 1.0, 100.5) == pytest.approx(0.5)
+    assert buckets.take('key', 2, 1.0, 101.0) == 0
+    assert buckets.take('other', 2, 1.0, 101.0) == 0
+    assert buckets.take('key', 2, 1.0, 200.0) == 0
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    """
+    Test that two processes opening the same file share their buckets.
+    """
+    first, second = SQLiteBuckets(str(tmp_path / 'limits.db')), SQLiteBuckets(str(tmp_path / 'limits.db'))
+    assert first.take('key', 2, 1.0, 100.0) == 0
+    assert second.take('key', 2, 1.0, 100.0) == 0
+    assert first.take('key', 2, 1.0, 100.0) == 1.0
+    assert len(second) == 1
+
+
+def limited_app(tmp_path, **config):
+    """
+    Create an app limiting /update_interaction to two requests per client.
+    """
+    class Config(TestConfig):
+        """
+        TestConfig with a tight rate limit.
+        """
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMITS = {
+            'main.update_interaction': {'burst': 2, 'rate': 0.01},
+            'main.create_post': {'burst': 1, 'rate': 0.01, 'key': 'ip'},
+        }
+        RATE_LIMIT_PATH = str(tmp_path / 'limits.db')
+    for name, value in config.items():
+        setattr(Config, name, value)
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def logged_in(app, user_id):
+    """
+    Return a test client logged in as user_id.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': f'user{user_id}@example.com'}
+    return client
+
+
+def test_write_endpoint_is_limited_per_user(tmp_path):
+    """
+    Test that a user going over the limit gets a 429 with Retry-After, while
+    other users and reads are not affected.
+    """
+    app = limited_app(tmp_path)
+    client = logged_in(app, 1)
+    like = {'id': 1, 'type': 'news', 'action': 'like'}
+    assert [client.post('/update_interaction', json=like).status_code for _ in range(2)] == [200, 200]
+
+    limited = client.post('/update_interaction', json=like)
+    assert limited.status_code == 429
+    assert limited.get_json() == {'error': 'Too many requests'}
+    assert int(limited.headers['Retry-After']) == 100
+    assert client.get('/home').status_code == 200
+    assert logged_in(app, 2).post('/update_interaction', json=like).status_code == 200
+
+
+def test_ip_policy_behind_proxy(tmp_path):
+    """
+    Test that an 'ip' policy keys on the address the trusted proxy appended
+    to X-Forwarded-For, ignoring the entries sent by the client.
+    """
+    app = limited_app(tmp_path, RATE_LIMIT_TRUSTED_PROXIES=1)
+    client = app.test_client()
+
+    def post(address, spoofed='203.0.113.1'):
+        return client.post('/create_post', data={}, headers={'X-Forwarded-For': f'{spoofed}, {address}'})
+
+    assert post('192.0.2.1').status_code != 429
+    limited = post('192.0.2.1', spoofed='203.0.113.2')
+    assert limited.status_code == 429 and b'Too many requests' in limited.data
+    assert post('192.0.2.2').status_code != 429
+
+
+class ManualClock:
+    """
+    Clock of a LoadShedder advanced by the test.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def manual_shedder(app):
+    """
+    Give app a shedder of 0.5 s per 1 s interval driven by a ManualClock,
+    which is returned.
+    """
+    clock = ManualClock()
+    app.extensions['rate_limiter'].shedder = LoadShedder(target=0.5, interval=1.0, clock=clock)
+    return clock
+
+
+def test_load_shedder_window():
+    """
+    Test that the shedder trips when the fastest request of an interval is
+    too slow, and recovers after an interval with fast or no requests.
+    """
+    clock = ManualClock()
+    shedder = LoadShedder(target=0.5, interval=1.0, clock=clock)
+    shedder.observe(1.0)
+    clock.now = 0.9
+    shedder.observe(0.8)
+    assert not shedder.shedding()
+    clock.now = 1.0
+    assert shedder.shedding()
+    clock.now = 2.0
+    assert not shedder.shedding()
+    shedder.observe(0.9)
+    shedder.observe(0.1)
+    clock.now = 3.0
+    assert not shedder.shedding()
+
+
+def test_slow_requests_are_shed(tmp_path):
+    """
+    Test that a request queued longer than the target makes the next writes
+    fail fast with a 503, until the load has gone.
+    """
+    app = limited_app(tmp_path, RATE_LIMIT_ENABLED=False, SHED_ENABLED=True, RATE_LIMIT_TRUSTED_PROXIES=1)
+    clock = manual_shedder(app)
+    client = logged_in(app, 1)
+    like = {'id': 1, 'type': 'news', 'action': 'like'}
+    queued = {'X-Request-Start': f't={time.time() - 2:.3f}'}
+    assert client.post('/update_interaction', json=like, headers=queued).status_code == 200
+    clock.now = 1.0
+
+    shed = client.post('/update_interaction', json=like)
+    assert shed.status_code == 503 and 'Retry-After' in shed.headers
+    assert client.get('/home').status_code == 200
+    clock.now = 2.0
+    assert client.post('/update_interaction', json=like).status_code == 200
+
+
+def test_request_start_is_not_trusted_without_proxy(tmp_path):
+    """
+    Test that without a trusted proxy a client cannot trigger the shedding
+    with a forged X-Request-Start.
+    """
+    app = limited_app(tmp_path, RATE_LIMIT_ENABLED=False, SHED_ENABLED=True)
+    clock = manual_shedder(app)
+    client = logged_in(app, 1)
+    like = {'id': 1, 'type': 'news', 'action': 'like'}
+    forged = {'X-Request-Start': f't={time.time() - 2:.3f}'}
+    assert client.post('/update_interaction', json=like, headers=forged).status_code == 200
+    clock.now = 1.0
+    assert client.post('/update_interaction', json=like).status_code == 200
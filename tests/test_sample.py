@@ -2,41 +2,20 @@
 This module contains unit tests for the Flask Blog application.
 """
 
-import pytest
-from flaskblog import create_app, db
-from flaskblog.models import User, Post
+import json
+import os
+from datetime import datetime
 
-# Setup for the test environment
-@pytest.fixture
-def app():
-    """
-    Create and configure a new app instance for each test.
-    """
-    _app = create_app()
-    _app.config['TESTING'] = True
-    _app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    return _app
-
-@pytest.fixture
-def client(app):
-    """
-    A test client for the app.
-    """
-    with app.test_client() as _client:
-        with app.app_context():
-            db.create_all()
-        yield _client
+import flask_migrate
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import inspect as sa_inspect
+from flaskblog import create_app, db
+from flaskblog.database import include_in_migrations
+from flaskblog.models import User, Post, NewsItem, UserInteraction, reconcile_post_counters
+from flaskblog.models import refresh_rankings
+from tests.conftest import TestConfig
 
-@pytest.fixture
-def clean_db(app):
-    """
-    Set up a clean database before each test.
-    """
-    with app.app_context():
-        db.drop_all()
-        db.create_all()
-        yield
-        db.session.remove()
 
 # Test for the home function
 def test_home(client):
@@ -74,3 +53,207 @@ def test_update_interaction(client):
 
     # Assertions
     assert response.status_code == 200
+
+
+def test_newsfeed_pagination(client):
+    """
+    Test that walking the newsfeed with cursors returns every item once, newest first.
+    """
+    with client.application.app_context():
+        for i in range(5):
+            db.session.add(NewsItem(id=100 + i, title=f'News {i}', time=1700000000 + i * 10))
+        for i in range(3):
+            db.session.add(Post(title=f'Post {i}', content='Body', user_email='a@example.com',
+                                date_posted=datetime.utcfromtimestamp(1700000005 + i * 10)))
+        db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        query = {'limit': 3}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/newsfeed', query_string=query)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['items']) <= 3
+        seen.extend((item['datetime'], item['id']) for item in data['items'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert len(seen) == 8
+    assert [dt for dt, _ in seen] == sorted((dt for dt, _ in seen), reverse=True)
+
+
+def test_invalid_cursor(client):
+    """
+    Test that a malformed cursor is rejected.
+    """
+    assert client.get('/newsfeed?cursor=not-a-cursor').status_code == 400
+    assert client.get('/home?cursor=not-a-cursor').status_code == 400
+
+
+def test_interaction_counters(client):
+    """
+    Test that the post counters follow likes, flips and removals.
+    """
+    with client.application.app_context():
+        user = User(email='counter-test@example.com', name='Counter User')
+        post = Post(title='Counted', content='Body', user_email='counter-test@example.com')
+        db.session.add_all([user, post])
+        db.session.commit()
+        post_id, user_id = post.id, user.id
+
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': 'counter-test@example.com'}
+
+    expected = [('like', 1, 0), ('dislike', 0, 1), ('dislike', 0, 0)]
+    for action, likes, dislikes in expected:
+        data = client.post('/update_interaction', json={'id': post_id, 'action': action}).get_json()
+        assert (data['new_like_count'], data['new_dislike_count']) == (likes, dislikes)
+
+    with client.application.app_context():
+        post = db.session.get(Post, post_id)
+        assert (post.like_count, post.dislike_count) == (0, 0)
+
+
+def test_home_shows_news_counts(client):
+    """
+    Test that the home feed, new and hot, shows the likes of news items.
+    """
+    with client.application.app_context():
+        user = User(email='news-counts@example.com')
+        db.session.add_all([user, NewsItem(id=5, title='Counted news', time=1700000000)])
+        db.session.commit()
+        user_id = user.id
+
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': 'news-counts@example.com'}
+    client.post('/update_interaction', json={'id': 5, 'type': 'news', 'action': 'like'})
+    with client.application.app_context():
+        refresh_rankings()
+
+    for path in ('/home', '/home?sort=hot'):
+        page = client.get(path).get_data(as_text=True)
+        assert '<span id="like-count-news-5">1</span>' in page, path
+        assert '<span id="dislike-count-news-5">0</span>' in page, path
+
+
+def test_batch_interactions(client):
+    """
+    Test that a batch folds the toggles of every item and matches the
+    counters of a reconcile.
+    """
+    with client.application.app_context():
+        user = User(email='batch@example.com')
+        posts = [Post(title=f'Batch {i}', content='Body', user_email='batch@example.com')
+                 for i in range(3)]
+        news = NewsItem(id=900, title='Batch news', time=1700000000)
+        db.session.add_all([user, news, *posts])
+        db.session.commit()
+        db.session.add(UserInteraction(user_id=user.id, target_type='post', post_id=posts[2].id,
+                                       interaction='like'))
+        posts[2].like_count = 1
+        db.session.commit()
+        user_id, ids = user.id, [post.id for post in posts]
+
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': 'batch@example.com'}
+
+    operations = [
+        {'id': ids[0], 'action': 'like'}, {'id': ids[0], 'action': 'dislike'},
+        {'id': ids[1], 'action': 'like'}, {'id': ids[1], 'action': 'like'},
+        {'id': ids[2], 'type': 'post', 'action': 'dislike'}, {'id': 900, 'type': 'news', 'action': 'like'},
+        {'id': ids[0], 'type': 'news', 'action': 'like'},
+    ]
+    data = client.post('/update_interactions', json={'operations': operations}).get_json()
+    assert [(item['type'], item['id'], item['interaction'], item['like_count'], item['dislike_count'])
+            for item in data['items']] == [
+        ('post', ids[0], 'dislike', 0, 1), ('post', ids[1], None, 0, 0), ('post', ids[2], 'dislike', 0, 1),
+        ('news', 900, 'like', 1, 0), ('news', ids[0], 'like', 1, 0)
+    ]
+    for invalid in ({'id': 1, 'action': 'love'}, {'id': 1, 'type': 'story', 'action': 'like'}):
+        assert client.post('/update_interactions', json={'operations': [invalid]}).status_code == 400
+
+    with client.application.app_context():
+        counters = [(db.session.get(Post, i).like_count, db.session.get(Post, i).dislike_count) for i in ids]
+        reconcile_post_counters()
+        assert counters == [(post.like_count, post.dislike_count)
+                            for post in Post.query.filter(Post.id.in_(ids)).order_by(Post.id)]
+
+
+def test_reconcile_counters(app, client):
+    """
+    Test that the reconcile-counters command rebuilds drifted counters.
+    """
+    with app.app_context():
+        user = User(email='reconcile@example.com')
+        post = Post(title='Drifted', content='Body', user_email='reconcile@example.com',
+                    like_count=7, dislike_count=3)
+        db.session.add_all([user, post])
+        db.session.commit()
+        db.session.add(UserInteraction(user_id=user.id, target_type='post', post_id=post.id, interaction='like'))
+        db.session.commit()
+        post_id = post.id
+
+    result = app.test_cli_runner().invoke(args=['reconcile-counters'])
+    assert 'Reconciled' in result.output
+
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        assert (post.like_count, post.dislike_count) == (1, 0)
+
+
+def test_migrations_match_models(tmp_path):
+    """
+    Test that upgrading an empty database through every migration yields the
+    schema declared by the models.
+    """
+    class MigrationConfig(TestConfig):
+        """
+        File based database, so that alembic and the test share it.
+        """
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'migrated.db'}"
+
+    _app = create_app(MigrationConfig)
+    migrations_dir = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+    with _app.app_context():
+        flask_migrate.upgrade(directory=migrations_dir)
+        with db.engine.connect() as connection:
+            context = MigrationContext.configure(
+                connection, opts={'include_name': include_in_migrations}
+            )
+            # Alembic cannot compare expression (DESC) indexes on SQLite, so
+            # indexes are compared by name instead.
+            diffs = [diff for diff in compare_metadata(context, db.metadata)
+                     if not isinstance(diff, tuple) or 'index' not in diff[0]]
+            assert diffs == []
+
+            inspector = sa_inspect(connection)
+            for table in db.metadata.sorted_tables:
+                migrated = {index['name'] for index in inspector.get_indexes(table.name)}
+                assert {index.name for index in table.indexes} <= migrated
+
+
+def test_newsfeed_compact_json(client):
+    """
+    Test that compact and indented newsfeed output carry the same data.
+    """
+    with client.application.app_context():
+        for i in range(3):
+            db.session.add(NewsItem(id=200 + i, title=f'News "{i}"\nline', time=1700000000 + i))
+        db.session.commit()
+
+    pretty = client.get('/newsfeed?limit=2')
+    assert pretty.is_streamed
+    pretty = pretty.get_data()
+    compact = client.get('/newsfeed?limit=2', headers={'Accept': 'application/json'}).get_data()
+    assert json.loads(pretty) == json.loads(compact)
+    assert b'\n' not in compact
+    assert len(compact) < len(pretty)
+
+    next_cursor = json.loads(compact)['next_cursor']
+    last_page = client.get(f'/newsfeed?compact=1&limit=2&cursor={next_cursor}').get_json()
+    assert [item['title'] for item in last_page['items']] == ['News "0"\nline']
+    assert last_page['next_cursor'] is None
@@ -0,0 +1,88 @@
+"""
+Tests for the full-text search index and the /search route.
+"""
+
+from flaskblog import create_app, db
+from flaskblog.models import NewsItem, User, save_news_to_db
+from flaskblog.search import match_expression, rebuild_index
+from tests.conftest import TestConfig
+from tests.hn_stub import StubHNServer, make_story
+
+
+def search_titles(client, query, **args):
+    """
+    Return the titles of the results of a search.
+    """
+    response = client.get('/search', query_string=dict(q=query, **args))
+    assert response.status_code == 200
+    return [item['title'] for item in response.get_json()['items']]
+
+
+def test_write_paths_maintain_index(client):
+    """
+    Test that created and deleted posts are added to and removed from the index.
+    """
+    with client.application.app_context():
+        db.session.add(User(email='author@example.com', name='Author', role='Admin'))
+        db.session.commit()
+    with client.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'author@example.com'}
+
+    client.post('/create_post', data={'title': 'Tuning SQLite', 'content': 'Write-ahead logging'})
+    client.post('/create_post', data={'title': 'Gardening', 'content': 'Tomatoes and sqlite jars'})
+    assert search_titles(client, 'sqlite') == ['Tuning SQLite', 'Gardening']
+    assert search_titles(client, 'logging') == ['Tuning SQLite']
+    assert search_titles(client, 'garden') == ['Gardening']
+
+    client.post('/delete_post', json={'id': 1, 'type': 'post'})
+    assert search_titles(client, 'sqlite') == ['Gardening']
+
+
+def test_ingestion_maintains_index():
+    """
+    Test that stored and refreshed news items are searchable.
+    """
+    items = {1: make_story(1, title='Rust compilers'), 2: make_story(2, title='Python packaging')}
+    with StubHNServer(items) as server:
+        app = create_app(TestConfig)
+        app.config['HN_API_URL'] = server.url
+        with app.app_context():
+            db.create_all()
+            save_news_to_db()
+            items[1]['title'] = 'Go compilers'
+            server.items = items
+            save_news_to_db(delta=False)
+
+    client = app.test_client()
+    assert search_titles(client, 'compilers') == ['Go compilers']
+    assert search_titles(client, 'rust') == []
+
+
+def test_search_pagination_and_rebuild(client):
+    """
+    Test paging through ranked results and rebuilding the index in bulk.
+    """
+    with client.application.app_context():
+        for i in range(5):
+            db.session.add(NewsItem(id=i + 1, title=f'Story {i}', text='database ' * (i + 1),
+                                    time=1700000000 + i))
+        db.session.commit()
+        assert rebuild_index() == 5
+
+    response = client.get('/search?q=database&limit=2').get_json()
+    # More occurrences of the term rank higher
+    assert [item['id'] for item in response['items']] == [5, 4]
+    assert response['next_page'] == 2
+    last = client.get('/search?q=database&limit=2&page=3').get_json()
+    assert [item['id'] for item in last['items']] == [1]
+    assert last['next_page'] is None
+
+
+def test_query_parsing(client):
+    """
+    Test that search syntax typed by users cannot break the query.
+    """
+    assert match_expression('"hello" OR wor') == '"hello" "OR" "wor"*'
+    assert match_expression(' -*" ') is None
+    assert client.get('/search?q=%22unbalanced').status_code == 200
+    assert client.get('/search?q=').status_code == 400
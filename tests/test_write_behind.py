@@ -0,0 +1,209 @@
+"""
+Tests for the write-behind buffer of user interactions.
+"""
+
+import threading
+import time
+
+import pytest
+
+from flaskblog import create_app, db, interaction_buffer
+from flaskblog.models import Post, User, UserInteraction, reconcile_post_counters
+from tests.conftest import TestConfig
+
+
+class WriteBehindConfig(TestConfig):
+    """
+    Buffered interactions, flushed only when the tests ask for it.
+    """
+    INTERACTION_WRITE_BEHIND = True
+    INTERACTION_FLUSH_INTERVAL = 3600
+
+
+def buffered_app(tmp_path, journal=True, **config):
+    """
+    Create an app buffering interactions on a database file in tmp_path, so
+    that a second app can stand for the restarted process.
+    """
+    class Config(WriteBehindConfig):
+        """
+        WriteBehindConfig on files of the test.
+        """
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "blog.db"}'
+        INTERACTION_JOURNAL_PATH = str(tmp_path / 'journal.db') if journal else None
+    for name, value in config.items():
+        setattr(Config, name, value)
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        if db.session.get(Post, 1) is None:
+            db.session.add_all([User(id=i, email=f'user{i}@example.com') for i in (1, 2, 3)])
+            db.session.add_all([Post(id=i, title=f'Post {i}', content='Body', user_email='user1@example.com')
+                                for i in (1, 2)])
+            db.session.commit()
+    return app
+
+
+def click(app, user_id, post_id, action):
+    """
+    Send one interaction as a logged-in user and return the JSON response.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'id': user_id, 'email': f'user{user_id}@example.com'}
+    return client.post('/update_interaction', json={'id': post_id, 'action': action}).get_json()
+
+
+def stored(app):
+    """
+    Return the stored interactions and the counters of post 1.
+    """
+    with app.app_context():
+        rows = sorted((row.user_id, row.target_type, row.post_id, row.interaction)
+                      for row in UserInteraction.query)
+        post = db.session.get(Post, 1)
+        return rows, (post.like_count, post.dislike_count)
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_buffered_toggles_collapse_and_flush(tmp_path, journal):
+    """
+    Test that toggles are answered with projected counts, collapse per
+    user and item, and reach the database only when flushed.
+    """
+    app = buffered_app(tmp_path, journal)
+    assert click(app, 1, 1, 'like')['new_like_count'] == 1
+    assert click(app, 2, 1, 'like')['new_like_count'] == 2
+    data = click(app, 1, 1, 'dislike')
+    assert (data['new_like_count'], data['new_dislike_count'], data['interaction']) == (1, 1, 'dislike')
+    for action in ('like', 'like', 'like'):
+        data = click(app, 3, 1, action)
+    assert (data['new_like_count'], data['interaction']) == (2, 'like')
+    assert stored(app) == ([], (0, 0))
+
+    with app.app_context():
+        assert interaction_buffer.flush() == 3
+        assert interaction_buffer.flush() == 0
+    rows, counters = stored(app)
+    assert rows == [(1, 'post', 1, 'dislike'), (2, 'post', 1, 'like'), (3, 'post', 1, 'like')] and counters == (2, 1)
+    with app.app_context():
+        reconcile_post_counters()
+    assert stored(app)[1] == counters
+
+    # Toggles of flushed rows start from the stored state
+    data = click(app, 2, 1, 'like')
+    assert (data['new_like_count'], data['interaction']) == (1, None)
+
+
+def test_flush_size_threshold(tmp_path):
+    """
+    Test that a request flushes the buffer once it holds INTERACTION_FLUSH_SIZE entries.
+    """
+    app = buffered_app(tmp_path, INTERACTION_FLUSH_SIZE=2)
+    click(app, 1, 1, 'like')
+    assert stored(app)[0] == []
+    click(app, 2, 2, 'like')
+    assert len(stored(app)[0]) == 2
+
+
+def test_crash_recovery(tmp_path):
+    """
+    Test that toggles buffered in the journal file survive a crash and are
+    written by the next process, exactly once even if a flush is
+    interrupted after the database commit.
+    """
+    crashed = buffered_app(tmp_path)
+    click(crashed, 1, 1, 'like')
+    click(crashed, 2, 1, 'dislike')
+    # The process dies without flushing
+
+    restarted = buffered_app(tmp_path)
+    state = restarted.extensions['interaction_buffer']
+    acknowledge = state.journal.acknowledge
+
+    def crash(_flushed):
+        raise SystemExit('killed between commit and acknowledge')
+    state.journal.acknowledge = crash
+    with restarted.app_context(), pytest.raises(SystemExit):
+        interaction_buffer.flush()
+    assert stored(restarted) == ([(1, 'post', 1, 'like'), (2, 'post', 1, 'dislike')], (1, 1))
+
+    state.journal.acknowledge = acknowledge
+    with restarted.app_context():
+        assert interaction_buffer.flush() == 2
+    assert stored(restarted) == ([(1, 'post', 1, 'like'), (2, 'post', 1, 'dislike')], (1, 1))
+    assert len(state.journal) == 0
+
+
+def test_journal_is_flushed_after_restart_without_toggles(tmp_path):
+    """
+    Test that the entries left by a crashed process are written once the
+    next process serves any request, without waiting for a new toggle.
+    """
+    crashed = buffered_app(tmp_path)
+    click(crashed, 1, 1, 'like')
+
+    restarted = buffered_app(tmp_path, INTERACTION_FLUSH_INTERVAL=0.05)
+    restarted.test_client().get('/about')
+    deadline = time.monotonic() + 5
+    while stored(restarted)[0] == [] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stored(restarted) == ([(1, 'post', 1, 'like')], (1, 0))
+    restarted.extensions['interaction_buffer'].stopped.set()
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_concurrent_toggles_are_not_lost(tmp_path, journal):
+    """
+    Test that toggles of the same user and item sent at once, from several
+    threads and, with the journal file, from two processes, all count.
+    """
+    apps = [buffered_app(tmp_path, journal)]
+    if journal:
+        apps.append(buffered_app(tmp_path, journal))
+    start = threading.Barrier(6)
+
+    def toggle(app):
+        start.wait()
+        for _ in range(5):
+            click(app, 1, 1, 'like')
+    threads = [threading.Thread(target=toggle, args=(apps[number % len(apps)],)) for number in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    data = click(apps[0], 1, 1, 'like')
+    assert (data['interaction'], data['new_like_count']) == ('like', 1)
+    with apps[0].app_context():
+        interaction_buffer.flush()
+    assert stored(apps[0]) == ([(1, 'post', 1, 'like')], (1, 0))
+
+
+def test_memory_buffer_flushes_on_shutdown(tmp_path):
+    """
+    Test that the in-process buffer is written when the app shuts down.
+    """
+    app = buffered_app(tmp_path, journal=False)
+    click(app, 1, 1, 'like')
+    interaction_buffer.shutdown(app)
+    assert stored(app) == ([(1, 'post', 1, 'like')], (1, 0))
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_feed_reactions_include_pending_toggles(tmp_path, journal):
+    """
+    Test that the feed shows the reactions of a user that are still buffered.
+    """
+    app = buffered_app(tmp_path, journal, FEED_CACHE_ENABLED=False)
+    click(app, 1, 1, 'like')
+    click(app, 1, 2, 'dislike')
+    with app.app_context():
+        interaction_buffer.flush()
+    click(app, 1, 2, 'dislike')
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'id': 1, 'email': 'user1@example.com'}
+    items = client.get('/newsfeed').get_json()['items']
+    assert {item['id']: item['reaction'] for item in items} == {1: 'like', 2: None}
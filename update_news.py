@@ -6,12 +6,23 @@ Script to update news articles in the database.
 
 This module, when run, initializes the Flask application context and
 triggers the process of fetching and saving the latest news articles
-to the database.
+to the database. By default only new and changed items are downloaded;
+pass --full to download every top story again, and --comments to also
+sync the comment trees of the stories.
 """
+import argparse
+
 from flaskblog import create_app
-from flaskblog.models import save_news_to_db
+from flaskblog.models import save_comments_to_db, save_news_to_db
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--full', action='store_true', help='download every top story')
+parser.add_argument('--comments', action='store_true', help='also sync the comment trees')
+args = parser.parse_args()
 
 app = create_app()
 
 with app.app_context():
-    save_news_to_db()
+    save_news_to_db(delta=not args.full)
+    if args.comments:
+        save_comments_to_db(full=args.full)
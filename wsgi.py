@@ -0,0 +1,12 @@
+"""
+WSGI entry point for gunicorn (see gunicorn.conf.py). Unlike run.py it
+leaves out the `flask db` migration commands, which a server never runs.
+"""
+
+from dotenv import load_dotenv
+
+from flaskblog import create_app
+
+load_dotenv()  # Load environment variables from .env file
+
+app = create_app(migrations=False)